@@ -0,0 +1,33 @@
+-- Migration: Instruments version row for snapshot freshness checks
+-- Purpose: Let services trust their on-disk instruments snapshot (INSTRUMENTS_SNAPSHOT_PATH)
+--          with a single-row lookup instead of reloading the instrument master on every start
+-- Date: 2026-10-16
+
+-- Single row; version is the txid of the last transaction that changed instruments
+CREATE TABLE IF NOT EXISTS instruments_version (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    version BIGINT NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+INSERT INTO instruments_version (version)
+VALUES (txid_current())
+ON CONFLICT (id) DO NOTHING;
+
+-- Statement-level so per-row upserts in the sync scripts cost one row write per
+-- transaction (later statements in the same transaction match no row)
+CREATE OR REPLACE FUNCTION bump_instruments_version() RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE instruments_version
+    SET version = txid_current(), updated_at = NOW()
+    WHERE version IS DISTINCT FROM txid_current();
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS instruments_version_bump ON instruments;
+CREATE TRIGGER instruments_version_bump
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON instruments
+FOR EACH STATEMENT EXECUTE FUNCTION bump_instruments_version();
+
+COMMENT ON TABLE instruments_version IS 'Bumped by trigger on any change to instruments; compared against the version stored in instrument snapshots';
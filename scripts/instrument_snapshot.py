@@ -0,0 +1,430 @@
+"""
+Instrument Snapshot
+Versioned on-disk copy of the active instruments for warm starts
+
+A copy of this module lives in services/ingestion (reads and rewrites the
+snapshot) and scripts (the instrument sync scripts write it); the two files
+must stay identical.
+
+The file carries the instruments_version row (database/instruments_version.sql)
+it was taken at, so a restart only needs a single-row query to know whether
+the snapshot is current instead of reloading the whole instrument master.
+Written by the sync scripts once their transaction has committed
+(write_snapshot_from_database(), stamped with the post-sync version), and by
+load_instruments_cache() after any database load.
+
+Layout:
+    header   magic, format version, db version, created_at, rows, sha256 of the payload
+    payload  one block per SNAPSHOT_COLUMNS entry, each a run of sections
+             (u64 byte length + bytes), little-endian:
+             i8 / f8     array buffer (None -> type minimum / NaN)
+             str         NUL-terminated utf-8, then u32 row indices of the Nones
+             dict:<kind> distinct values as a <kind> column, then a u8/u16/u32
+                         index per row (narrowest that fits the table)
+
+The payload is plain arrays and text; reading a snapshot never executes
+anything, and the sha256 catches truncated or corrupted files.
+
+Enabled with INSTRUMENTS_SNAPSHOT_PATH
+"""
+
+import codecs
+import hashlib
+import os
+import re
+import struct
+import sys
+import time
+from array import array
+from sys import intern
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence
+
+import psycopg2
+import structlog
+
+logger = structlog.get_logger()
+
+SNAPSHOT_PATH = os.getenv("INSTRUMENTS_SNAPSHOT_PATH", "")
+
+SNAPSHOT_MAGIC = b'TINS'
+SNAPSHOT_FORMAT_VERSION = 3  # 1 = pickle, 2 = JSON payload
+# magic, format version, db version, created_at (epoch seconds), rows, sha256(payload)
+SNAPSHOT_HEADER = struct.Struct('<4sHqdI32s')
+SECTION_LENGTH = struct.Struct('<Q')
+
+# Column -> encoding, in InstrumentRecord field order
+SNAPSHOT_COLUMNS = (
+    'instrument_token', 'trading_symbol', 'exchange', 'instrument_type',
+    'expiry', 'strike', 'lot_size', 'tick_size', 'security_id', 'source',
+)
+# Low-cardinality columns are dict-encoded: a table of distinct values + an index per row
+COLUMN_KINDS = (
+    'q', 'str', 'dict:str', 'dict:str',
+    'dict:str', 'dict:d', 'dict:q', 'dict:d', 'str', 'dict:str',
+)
+
+INT_NULL = -2 ** 63
+NAN = float('nan')
+NAN_BYTES = struct.pack('<d', NAN)
+LITTLE_ENDIAN = sys.byteorder == 'little'
+# Sections per column encoding
+SECTION_COUNTS = {'q': 1, 'd': 1, 'str': 2, 'dict:str': 3, 'dict:d': 2, 'dict:q': 2}
+
+INSTRUMENTS_VERSION_SQL = "SELECT version FROM instruments_version"
+
+# Active instruments, parsed row by row by InstrumentCopySink
+# (to_char pins the expiry format independent of the server DateStyle)
+INSTRUMENTS_COPY_SQL = """
+    COPY (
+        SELECT
+            instrument_token, trading_symbol, exchange, instrument_type,
+            to_char(expiry, 'YYYY-MM-DD'), strike, tick_size, lot_size,
+            security_id, source
+        FROM instruments
+        WHERE is_active = TRUE
+    ) TO STDOUT
+"""
+COPY_NULL = '\\N'
+_COPY_ESCAPES = {'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t', 'v': '\v'}
+_COPY_ESCAPE_RE = re.compile(r'\\(.)')
+
+
+class SnapshotError(Exception):
+    """Snapshot file is missing, truncated, from another format version or fails its hash"""
+
+
+class InstrumentSnapshot(NamedTuple):
+    db_version: int
+    created_at: float
+    content_hash: str
+    columns: List[list]
+    
+    @property
+    def rows(self) -> int:
+        return len(self.columns[0])
+
+
+class InstrumentCopySink:
+    """
+    Write target for cursor.copy_expert that parses COPY text rows as they arrive
+    
+    Each row is handed to `factory` straight away (fields in SNAPSHOT_COLUMNS
+    order), so the result set is never materialised as tuples/Decimals/dates
+    or as one big text buffer. Columns are those of INSTRUMENTS_COPY_SQL.
+    
+    Args:
+        factory: Builds the cached value from the row's fields (default: the tuple itself)
+    """
+    
+    def __init__(self, factory: Optional[Callable] = None):
+        self.factory = factory
+        self.instruments: Dict[int, object] = {}
+        self.rows = 0
+        self.bytes = 0
+        self.parse_failures = 0
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._partial = ''
+    
+    def write(self, data) -> int:
+        """Consume a chunk of COPY output (psycopg2 writes one row per call)"""
+        self.bytes += len(data)
+        text = self._decoder.decode(data) if isinstance(data, bytes) else data
+        
+        lines = (self._partial + text).split('\n')
+        self._partial = lines.pop()
+        for line in lines:
+            self._parse_line(line)
+        
+        return len(data)
+    
+    def _parse_line(self, line: str):
+        self.rows += 1
+        try:
+            token, symbol, exchange, instrument_type, expiry, strike, tick_size, lot_size, security_id, source = line.split('\t')
+            
+            # Low-cardinality columns are interned: one string object per distinct value
+            # in the cache (read_snapshot() shares them the same way)
+            token = int(token)
+            fields = (
+                token,
+                _copy_text(symbol),
+                _copy_interned(exchange),
+                _copy_interned(instrument_type),
+                None if expiry == COPY_NULL else intern(expiry),
+                None if strike == COPY_NULL else (float(strike) or None),
+                None if lot_size == COPY_NULL else (int(lot_size) or None),
+                None if tick_size == COPY_NULL else (float(tick_size) or None),
+                _copy_text(security_id),  # Dhan security_id
+                _copy_interned(source) or "kite"  # Data source
+            )
+            self.instruments[token] = self.factory(*fields) if self.factory else fields
+        except Exception as e:
+            self.parse_failures += 1
+            logger.error("instrument_parse_failed", row=line, error=str(e))
+
+
+def _copy_text(value: str) -> Optional[str]:
+    """Decode a COPY text-format field (\\N is NULL, backslash escapes are rare)"""
+    if value == COPY_NULL:
+        return None
+    if '\\' in value:
+        return _COPY_ESCAPE_RE.sub(lambda m: _COPY_ESCAPES.get(m.group(1), m.group(1)), value)
+    return value
+
+
+def _copy_interned(value: str) -> Optional[str]:
+    """_copy_text for low-cardinality columns (exchange, instrument_type, source)"""
+    text = _copy_text(value)
+    return intern(text) if text is not None else None
+
+
+def fetch_instruments_version(cursor) -> Optional[int]:
+    """
+    Current instruments_version, or None before the migration has been applied
+    
+    Args:
+        cursor: Open psycopg2 cursor (rolled back to a savepoint if the table is missing)
+    
+    Returns:
+        Version number, or None if it cannot be determined
+    """
+    cursor.execute("SAVEPOINT instruments_version")
+    try:
+        cursor.execute(INSTRUMENTS_VERSION_SQL)
+    except psycopg2.Error as e:
+        cursor.execute("ROLLBACK TO SAVEPOINT instruments_version")
+        logger.warning("instruments_version_unavailable", error=str(e))
+        return None
+    
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def _array_bytes(typecode: str, values) -> bytes:
+    data = array(typecode, values)
+    if not LITTLE_ENDIAN:
+        data.byteswap()
+    return data.tobytes()
+
+
+def _bytes_array(typecode: str, section) -> array:
+    data = array(typecode)
+    data.frombytes(section)
+    if not LITTLE_ENDIAN:
+        data.byteswap()
+    return data
+
+
+def _index_typecode(table_size: int) -> str:
+    """Narrowest index array for a dict table (bytes iterate fastest)"""
+    return 'B' if table_size <= 256 else 'H' if table_size <= 65536 else 'I'
+
+
+def _encode_values(kind: str, values: Sequence) -> List[bytes]:
+    """Sections of a plain column (or of a dict table)"""
+    if kind == 'q':
+        return [_array_bytes('q', (INT_NULL if value is None else value for value in values))]
+    if kind == 'd':
+        return [_array_bytes('d', (NAN if value is None else value for value in values))]
+    
+    # str: NUL-terminated utf-8 (Postgres text never holds NUL), then positions of the Nones
+    nulls = [i for i, value in enumerate(values) if value is None]
+    text = ''.join(f"{'' if value is None else value}\0" for value in values)
+    return [text.encode('utf-8'), _array_bytes('I', nulls)]
+
+
+def _encode_column(kind: str, values: Sequence) -> List[bytes]:
+    """Sections of one column"""
+    if not kind.startswith('dict:'):
+        return _encode_values(kind, values)
+    
+    # Distinct values in first-seen order, then one index per row
+    table: Dict = {}
+    indices = [table.setdefault(value, len(table)) for value in values]
+    return _encode_values(kind[5:], list(table)) + [_array_bytes(_index_typecode(len(table)), indices)]
+
+
+def _decode_values(kind: str, sections: List[memoryview]) -> list:
+    """Values of a plain column (or of a dict table)"""
+    if kind == 'q':
+        values = _bytes_array('q', sections[0]).tolist()
+        if INT_NULL in values:
+            values = [None if value == INT_NULL else value for value in values]
+        return values
+    if kind == 'd':
+        values = _bytes_array('d', sections[0]).tolist()
+        # Cheap pre-check on the raw bytes; only columns holding a null pay for the scan
+        if NAN_BYTES in sections[0].tobytes():
+            values = [None if value != value else value for value in values]
+        return values
+    
+    values = bytes(sections[0]).decode('utf-8').split('\0')
+    if values.pop() != '':
+        raise SnapshotError("Unterminated string column")
+    for i in _bytes_array('I', sections[1]):
+        values[i] = None
+    return values
+
+
+def _decode_column(kind: str, sections: List[memoryview], rows: int) -> list:
+    """Column values from its sections"""
+    if kind.startswith('dict:'):
+        table = _decode_values(kind[5:], sections[:-1])
+        if kind == 'dict:str':
+            # Interned like the COPY load: one object per distinct value
+            table = [intern(value) if value is not None else None for value in table]
+        
+        typecode = _index_typecode(len(table))
+        indices = bytes(sections[-1]) if typecode == 'B' else _bytes_array(typecode, sections[-1])
+        values = list(map(table.__getitem__, indices))
+    else:
+        values = _decode_values(kind, sections)
+    
+    if len(values) != rows:
+        raise SnapshotError("Snapshot columns do not match the header")
+    return values
+
+
+def write_snapshot(path: str, columns: Sequence[Sequence], db_version: int) -> str:
+    """
+    Atomically write a snapshot (temp file + rename)
+    
+    Args:
+        path: Snapshot file (INSTRUMENTS_SNAPSHOT_PATH)
+        columns: One sequence per SNAPSHOT_COLUMNS entry, all the same length
+        db_version: instruments_version the rows were read at
+    
+    Returns:
+        Hex sha256 of the payload
+    """
+    if len(columns) != len(SNAPSHOT_COLUMNS):
+        raise ValueError(f"Expected {len(SNAPSHOT_COLUMNS)} columns, got {len(columns)}")
+    
+    sections = []
+    for kind, values in zip(COLUMN_KINDS, columns):
+        for section in _encode_column(kind, values):
+            sections.append(SECTION_LENGTH.pack(len(section)))
+            sections.append(section)
+    payload = b''.join(sections)
+    
+    digest = hashlib.sha256(payload).digest()
+    header = SNAPSHOT_HEADER.pack(
+        SNAPSHOT_MAGIC, SNAPSHOT_FORMAT_VERSION, db_version, time.time(), len(columns[0]), digest
+    )
+    
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    
+    logger.info(
+        "instruments_snapshot_written",
+        path=path,
+        db_version=db_version,
+        rows=len(columns[0]),
+        size_bytes=len(header) + len(payload),
+        content_hash=digest.hex()[:16]
+    )
+    return digest.hex()
+
+
+def read_snapshot(path: str) -> InstrumentSnapshot:
+    """
+    Read and verify a snapshot
+    
+    Args:
+        path: Snapshot file (INSTRUMENTS_SNAPSHOT_PATH)
+    
+    Returns:
+        InstrumentSnapshot with the column lists
+    
+    Raises:
+        SnapshotError: If the file is unreadable or fails verification
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError as e:
+        raise SnapshotError(str(e)) from e
+    
+    if len(data) < SNAPSHOT_HEADER.size:
+        raise SnapshotError(f"Truncated snapshot ({len(data)} bytes)")
+    
+    magic, format_version, db_version, created_at, rows, digest = SNAPSHOT_HEADER.unpack_from(data)
+    if magic != SNAPSHOT_MAGIC:
+        raise SnapshotError(f"Not an instruments snapshot (magic {magic!r})")
+    if format_version != SNAPSHOT_FORMAT_VERSION:
+        raise SnapshotError(f"Unsupported snapshot format version {format_version}")
+    
+    payload = memoryview(data)[SNAPSHOT_HEADER.size:]
+    if hashlib.sha256(payload).digest() != digest:
+        raise SnapshotError("Snapshot content hash mismatch")
+    
+    sections = []
+    offset = 0
+    try:
+        while offset < len(payload):
+            (length,) = SECTION_LENGTH.unpack_from(payload, offset)
+            offset += SECTION_LENGTH.size
+            sections.append(payload[offset:offset + length])
+            offset += length
+        
+        columns = []
+        for kind in COLUMN_KINDS:
+            count = SECTION_COUNTS[kind]
+            column_sections, sections = sections[:count], sections[count:]
+            if len(column_sections) != count:
+                raise SnapshotError("Snapshot is missing columns")
+            columns.append(_decode_column(kind, column_sections, rows))
+    except (struct.error, ValueError, IndexError) as e:
+        raise SnapshotError(f"Invalid snapshot payload: {e}") from e
+    
+    if sections or offset != len(payload):
+        raise SnapshotError("Trailing data after the snapshot columns")
+    
+    return InstrumentSnapshot(db_version, created_at, digest.hex(), columns)
+
+
+def write_snapshot_from_database(database_url: str, path: str = SNAPSHOT_PATH) -> int:
+    """
+    Snapshot the active instruments as committed now (run by the sync scripts)
+    
+    The version row and the COPY share one REPEATABLE READ transaction, so
+    the snapshot is stamped with exactly the instruments_version of its rows.
+    
+    Args:
+        database_url: PostgreSQL connection URL
+        path: Snapshot file (defaults to INSTRUMENTS_SNAPSHOT_PATH)
+    
+    Returns:
+        Number of active instruments written (0 if instruments_version is missing)
+    """
+    conn = psycopg2.connect(database_url)
+    try:
+        conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+        with conn.cursor() as cursor:
+            db_version = fetch_instruments_version(cursor)
+            if db_version is None:
+                logger.warning(
+                    "instruments_snapshot_skipped",
+                    reason="instruments_version table missing (apply database/instruments_version.sql)"
+                )
+                return 0
+            
+            sink = InstrumentCopySink()
+            cursor.copy_expert(INSTRUMENTS_COPY_SQL, sink)
+        conn.rollback()
+    finally:
+        conn.close()
+    
+    rows = list(sink.instruments.values())
+    columns = list(zip(*rows)) if rows else [() for _ in SNAPSHOT_COLUMNS]
+    write_snapshot(path, columns, db_version)
+    return len(rows)
@@ -20,11 +20,16 @@ from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 import requests
 
+from instrument_snapshot import write_snapshot_from_database
+
 logger = structlog.get_logger()
 
 # Dhan instrument master CSV URL
 DHAN_INSTRUMENTS_URL = "https://images.dhan.co/api-data/api-scrip-master.csv"
 
+# Ingestion warm-start snapshot, rewritten after the sync (empty = skip)
+INSTRUMENTS_SNAPSHOT_PATH = os.getenv("INSTRUMENTS_SNAPSHOT_PATH", "")
+
 # Exchange segment mapping (from Dhan docs)
 EXCHANGE_SEGMENT_MAP = {
     0: "NSE_EQ",
@@ -338,6 +343,25 @@ def sync_to_database(instruments: List[Dict], db_url: str, batch_size: int = 100
         return (0, 0)
 
 
+def write_instruments_snapshot(db_url: str, path: str) -> int:
+    """
+    Rewrite the ingestion instruments snapshot so its next restart skips the full reload
+    
+    Args:
+        db_url: PostgreSQL connection URL
+        path: Snapshot file (INSTRUMENTS_SNAPSHOT_PATH)
+    
+    Returns:
+        Number of active instruments in the snapshot (0 on failure)
+    """
+    try:
+        return write_snapshot_from_database(db_url, path)
+    
+    except Exception as e:
+        logger.error("instruments_snapshot_failed", path=path, error=str(e))
+        return 0
+
+
 def main():
     """Main execution"""
     parser = argparse.ArgumentParser(description='Sync Dhan instruments to database')
@@ -356,6 +380,11 @@ def main():
         action='store_true',
         help='Download CSV from Dhan before syncing'
     )
+    parser.add_argument(
+        '--snapshot-path',
+        default=INSTRUMENTS_SNAPSHOT_PATH,
+        help='Ingestion instruments snapshot to rewrite after the sync (default: $INSTRUMENTS_SNAPSHOT_PATH)'
+    )
     parser.add_argument(
         '--batch-size',
         type=int,
@@ -390,6 +419,10 @@ def main():
     # Sync to database
     inserted, updated = sync_to_database(instruments, args.db_url, args.batch_size)
     
+    # Snapshot for ingestion warm starts (sync_to_database has committed)
+    if args.snapshot_path:
+        write_instruments_snapshot(args.db_url, args.snapshot_path)
+    
     logger.info("sync_summary", inserted=inserted, updated=updated)
     print(f"\n✅ Sync complete: {inserted} rows affected")
 
@@ -29,6 +29,8 @@ from pathlib import Path
 from typing import List, Dict
 from dotenv import load_dotenv
 
+from instrument_snapshot import write_snapshot_from_database
+
 # Load environment
 load_dotenv()
 
@@ -64,6 +66,8 @@ REDIS_URL = get_redis_url()
 DATABASE_URL = get_database_url()
 ENV_FILE = Path(__file__).parent.parent / ".env"
 BACKUP_DIR = Path(__file__).parent.parent / "backups"
+# Ingestion warm-start snapshot, rewritten after the sync (empty = skip)
+INSTRUMENTS_SNAPSHOT_PATH = os.getenv("INSTRUMENTS_SNAPSHOT_PATH", "")
 
 
 def download_instruments() -> str:
@@ -335,6 +339,23 @@ def mark_instruments_active(tokens: List[int]) -> int:
         return 0
 
 
+def write_instruments_snapshot() -> int:
+    """Rewrite the ingestion instruments snapshot so its next restart skips the full reload"""
+    if not INSTRUMENTS_SNAPSHOT_PATH or not DATABASE_URL:
+        return 0
+    
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] Writing instruments snapshot...")
+    
+    try:
+        count = write_snapshot_from_database(DATABASE_URL, INSTRUMENTS_SNAPSHOT_PATH)
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] ✓ Snapshot of {count:,} active instruments at {INSTRUMENTS_SNAPSHOT_PATH}")
+        return count
+    
+    except Exception as e:
+        print(f"  ✗ Snapshot failed (ingestion will reload from Postgres): {e}")
+        return 0
+
+
 def print_summary(instruments: List[Dict], filter_type: str, tokens: List[int]):
     """Print execution summary"""
     print("\n" + "="*70)
@@ -396,6 +417,9 @@ def main():
     # Update .env for backward compatibility
     update_env_file(tokens)
     
+    # Snapshot for ingestion warm starts (after the is_active changes have committed)
+    write_instruments_snapshot()
+    
     # Summary
     print_summary(instruments, args.filter, tokens)
     
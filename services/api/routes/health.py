@@ -4,8 +4,10 @@ Monitors connectivity to all critical services (PostgreSQL, Redis, RabbitMQ)
 """
 
 import os
+import json
+import time
 import logging
-from typing import Dict
+from typing import Dict, List, Optional
 
 from fastapi import APIRouter, HTTPException
 import redis
@@ -21,6 +23,17 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 REDIS_URL = os.getenv("REDIS_URL")
 RABBITMQ_URL = os.getenv("RABBITMQ_URL")
 
+# Tick queues - ticks_queue, or ticks_queue.0 .. N-1 when partitioned by instrument
+TICK_QUEUE_PARTITIONS = int(os.getenv("TICK_QUEUE_PARTITIONS", 1))
+TICK_QUEUES = (
+    [f"ticks_queue.{p}" for p in range(TICK_QUEUE_PARTITIONS)]
+    if TICK_QUEUE_PARTITIONS > 1 else ['ticks_queue']
+)
+
+# Per-worker latency windows written by services/worker/latency.py
+LATENCY_KEY_PATTERN = "latency:worker:*"
+LATENCY_QUANTILES = (0.5, 0.95, 0.99)
+
 
 async def check_postgresql() -> Dict[str, str]:
     """
@@ -115,16 +128,21 @@ async def check_rabbitmq() -> Dict[str, str]:
         if connection.is_open:
             channel = connection.channel()
             
-            # Declare queue and get metrics (passive=True means don't create, just check)
+            # Declare queues and get metrics (passive=True means don't create, just check)
             try:
-                method = channel.queue_declare(queue='ticks_queue', passive=True)
+                partition_depths = {}
+                consumer_count = 0
+                for queue in TICK_QUEUES:
+                    method = channel.queue_declare(queue=queue, passive=True)
+                    partition_depths[queue] = method.method.message_count
+                    consumer_count += method.method.consumer_count
                 queue_exists = True
-                queue_depth = method.method.message_count
-                consumer_count = method.method.consumer_count
+                queue_depth = sum(partition_depths.values())
             except:
                 queue_exists = False
                 queue_depth = -1
                 consumer_count = 0
+                partition_depths = {}
             
             connection.close()
             
@@ -149,6 +167,7 @@ async def check_rabbitmq() -> Dict[str, str]:
                 "ticks_queue_exists": queue_exists,
                 "queue_depth": queue_depth,
                 "consumer_count": consumer_count,
+                "partition_depths": partition_depths,
                 "lag_estimate_seconds": round(lag_seconds, 2),
                 "message": message
             }
@@ -165,6 +184,117 @@ async def check_rabbitmq() -> Dict[str, str]:
         }
 
 
+def _bucket_quantile(bounds: List[float], counts: List[int], q: float) -> Optional[float]:
+    """
+    Estimate a quantile from histogram bucket counts (linear within a bucket,
+    like Prometheus histogram_quantile); the +Inf bucket reports its lower bound
+    """
+    total = sum(counts)
+    if not total:
+        return None
+    
+    rank = q * total
+    cumulative = 0
+    for i, count in enumerate(counts):
+        if cumulative + count >= rank and count:
+            if i >= len(bounds):
+                return bounds[-1]
+            lower = bounds[i - 1] if i > 0 else 0.0
+            return lower + (bounds[i] - lower) * (rank - cumulative) / count
+        cumulative += count
+    return bounds[-1]
+
+
+def merge_latency_windows(windows: List[Dict]) -> Dict[str, Dict[str, Dict]]:
+    """
+    Merge per-worker latency windows into source -> hop -> summary
+    
+    Bucket counts add up exactly across workers, so quantiles are estimated
+    from the merged counts.
+    """
+    merged: Dict[tuple, Dict] = {}
+    for window in windows:
+        bounds = window.get("buckets") or []
+        for series in window.get("series", []):
+            key = (series["source"], series["hop"])
+            entry = merged.get(key)
+            if entry is None:
+                entry = merged[key] = {"bounds": bounds, "counts": [0] * len(series["counts"]), "sum": 0.0, "max": 0.0}
+            entry["counts"] = [a + b for a, b in zip(entry["counts"], series["counts"])]
+            entry["sum"] += series["sum"]
+            entry["max"] = max(entry["max"], series["max"])
+    
+    result: Dict[str, Dict[str, Dict]] = {}
+    for (source, hop), entry in sorted(merged.items()):
+        count = sum(entry["counts"])
+        summary = {
+            "count": count,
+            "avg_ms": round(entry["sum"] / count * 1000, 2) if count else None,
+            "max_ms": round(entry["max"] * 1000, 2)
+        }
+        for q in LATENCY_QUANTILES:
+            value = _bucket_quantile(entry["bounds"], entry["counts"], q)
+            if value is not None:
+                value = min(value, entry["max"])
+            summary[f"p{int(q * 100)}_ms"] = round(value * 1000, 2) if value is not None else None
+        result.setdefault(source, {})[hop] = summary
+    
+    return result
+
+
+async def check_latency() -> Dict:
+    """
+    Tick pipeline latency per source and hop, from the workers' latest windows
+    
+    Returns:
+        dict: Merged hop latencies, per-worker window info and sampled ticks
+    """
+    try:
+        redis_client = redis.from_url(REDIS_URL, decode_responses=True)
+        
+        windows = []
+        for key in redis_client.scan_iter(LATENCY_KEY_PATTERN, count=100):
+            raw = redis_client.get(key)
+            if raw:
+                windows.append(json.loads(raw))
+        
+        redis_client.close()
+        
+        if not windows:
+            return {
+                "status": "unknown",
+                "service": "TickLatency",
+                "message": "No latency windows reported by workers"
+            }
+        
+        now = time.time()
+        return {
+            "status": "healthy",
+            "service": "TickLatency",
+            "latency": merge_latency_windows(windows),
+            "workers": [
+                {
+                    "worker_id": window.get("worker_id"),
+                    "window_seconds": round(window["window_end"] - window["window_start"], 1),
+                    "age_seconds": round(now - window["window_end"], 1),
+                    "traced_messages": window.get("traced_messages", 0),
+                    "untraced_messages": window.get("untraced_messages", 0)
+                }
+                for window in windows
+            ],
+            "samples": [window["sample"] for window in windows if window.get("sample")]
+        }
+    
+    except Exception as e:
+        logger.error(f"Latency check failed: {str(e)}")
+        return {
+            "status": "unhealthy",
+            "service": "TickLatency",
+            "error": str(e),
+            "message": "Latency summaries unavailable"
+        }
+
+
 @router.get("/health")
 async def health_check():
     """
@@ -267,6 +397,19 @@ async def health_check_rabbitmq():
     return await check_rabbitmq()
 
 
+@router.get("/health/latency")
+async def health_check_latency():
+    """
+    Tick latency per pipeline hop (WebSocket receive -> enrich -> publish ->
+    consumer receive -> DB commit) and exchange time to commit, per source,
+    over the workers' last summary window
+    
+    Returns:
+        dict: Latency summary (count, avg, p50/p95/p99, max in ms)
+    """
+    return await check_latency()
+
+
 @router.get("/health/liveness")
 async def liveness_probe():
     """
@@ -37,6 +37,11 @@ RESPONSE_DISCONNECT = 50
 DEPTH_LEVELS = 20
 PACKET_SIZE = 332  # 12 header + 320 data (20 levels × 16 bytes)
 
+# Per-packet lines are only printed with DEPTH_DEBUG=true; otherwise packets are
+# counted and summarized every DEPTH_SUMMARY_INTERVAL seconds
+DEPTH_DEBUG = os.getenv('DEPTH_DEBUG', 'false').lower() == 'true'
+DEPTH_SUMMARY_INTERVAL = int(os.getenv('DEPTH_SUMMARY_INTERVAL', 60))
+
 # Global variables
 ws = None
 db_conn = None
@@ -45,6 +50,17 @@ redis_client = None
 snapshot_count = 0
 start_time = None
 
+# Hot-path counters since the last summary line
+packet_counts = {
+    'messages': 0,
+    'bid_packets': 0,
+    'ask_packets': 0,
+    'inserted_records': 0,
+    'nonstandard_messages': 0,
+    'text_messages': 0
+}
+last_summary_time = time.time()
+
 # Buffer for incomplete depth snapshots (bid/ask come separately)
 pending_bid_depth = None
 pending_ask_depth = None
@@ -116,7 +132,9 @@ def insert_depth_levels_batch(cursor, records):
     
     try:
         execute_batch(cursor, insert_query, records, page_size=400)
-        print(f"✓ Inserted {len(records)} depth level records")
+        packet_counts['inserted_records'] += len(records)
+        if DEPTH_DEBUG:
+            print(f"✓ Inserted {len(records)} depth level records")
     except Exception as e:
         print(f"✗ Error in batch insert: {e}")
 
@@ -352,6 +370,23 @@ def save_snapshot_to_db(snapshot):
         except Exception as reconnect_error:
             print(f"Failed to reconnect to database: {reconnect_error}")
 
+def print_summary(best_bid, best_ask):
+    """Print snapshot progress and the packet counters since the last summary, then reset them"""
+    global last_summary_time
+    
+    now = time.time()
+    timestamp_str = datetime.now(ist).strftime('%H:%M:%S')
+    counts = ', '.join(f"{name}: {count}" for name, count in packet_counts.items())
+    print(f"[{timestamp_str}] Snapshots: {snapshot_count}, "
+          f"Bid: ₹{best_bid:,.2f}, "
+          f"Ask: ₹{best_ask:,.2f}, "
+          f"Spread: ₹{best_ask - best_bid:.2f} | "
+          f"last {now - last_summary_time:.0f}s - {counts}")
+    
+    for name in packet_counts:
+        packet_counts[name] = 0
+    last_summary_time = now
+
 def on_open(ws):
     """WebSocket connection opened"""
     global start_time
@@ -402,7 +437,9 @@ def on_message(ws, message):
             if len(message) % PACKET_SIZE == 0 and len(message) >= PACKET_SIZE:
                 # Process each 332-byte packet in the message
                 num_packets = len(message) // PACKET_SIZE
-                print(f"[DEBUG] Received {len(message)} bytes = {num_packets} packets")
+                packet_counts['messages'] += 1
+                if DEPTH_DEBUG:
+                    print(f"[DEBUG] Received {len(message)} bytes = {num_packets} packets")
                 
                 for i in range(num_packets):
                     offset = i * PACKET_SIZE
@@ -411,21 +448,22 @@ def on_message(ws, message):
                     
                     if response_code == RESPONSE_BID_DEPTH:
                         # Got BID packet
-                        print(f"  Packet {i+1}: BID depth")
+                        packet_counts['bid_packets'] += 1
                         bid_depth = parse_depth_packet_20(packet)
                         if bid_depth:
                             pending_bid_depth = bid_depth
                             pending_timestamp = datetime.now(ist).astimezone(pytz.UTC)
-                            print(f"    Stored BID with {len(bid_depth)} levels, best bid: ₹{bid_depth[0]['price']:,.2f}")
+                            if DEPTH_DEBUG:
+                                print(f"  Packet {i+1}: BID with {len(bid_depth)} levels, best bid: ₹{bid_depth[0]['price']:,.2f}")
                             
                     elif response_code == RESPONSE_ASK_DEPTH:
                         # Got ASK packet - check if we have matching BID
-                        print(f"  Packet {i+1}: ASK depth")
+                        packet_counts['ask_packets'] += 1
                         ask_depth = parse_depth_packet_20(packet)
                         if ask_depth:
-                            print(f"    ASK has {len(ask_depth)} levels, best ask: ₹{ask_depth[0]['price']:,.2f}")
+                            if DEPTH_DEBUG:
+                                print(f"  Packet {i+1}: ASK with {len(ask_depth)} levels, best ask: ₹{ask_depth[0]['price']:,.2f}")
                             if pending_bid_depth and pending_timestamp:
-                                print(f"    ✓ Complete snapshot! Saving to DB...")
                                 # We have a complete snapshot!
                                 save_depth_levels_to_db(db_cursor, pending_bid_depth, ask_depth, pending_timestamp, int(SECURITY_ID))
                             
@@ -448,16 +486,9 @@ def on_message(ws, message):
                             
                             snapshot_count += 1
                             
-                            # Print progress every 100 snapshots
-                            if snapshot_count % 100 == 0:
-                                timestamp_str = datetime.now(ist).strftime('%H:%M:%S')
-                                best_bid = pending_bid_depth[0]['price']
-                                best_ask = ask_depth[0]['price']
-                                spread = best_ask - best_bid
-                                print(f"[{timestamp_str}] Snapshots: {snapshot_count}, "
-                                      f"Bid: ₹{best_bid:,.2f}, "
-                                      f"Ask: ₹{best_ask:,.2f}, "
-                                      f"Spread: ₹{spread:.2f}")
+                            # Print a summary every DEPTH_SUMMARY_INTERVAL seconds
+                            if time.time() - last_summary_time >= DEPTH_SUMMARY_INTERVAL:
+                                print_summary(pending_bid_depth[0]['price'], ask_depth[0]['price'])
                             
                             # Clear the buffer
                             pending_bid_depth = None
@@ -468,12 +499,16 @@ def on_message(ws, message):
                         pending_timestamp = None
             else:
                 # Not standard packet size - could be multiple instruments stacked
-                print(f"[DEBUG] Non-standard message length: {len(message)} bytes")
-                hex_dump = ' '.join(f'{b:02x}' for b in message[:min(20, len(message))])
-                print(f"[DEBUG] First bytes (hex): {hex_dump}")
+                packet_counts['nonstandard_messages'] += 1
+                if DEPTH_DEBUG or packet_counts['nonstandard_messages'] == 1:
+                    print(f"[DEBUG] Non-standard message length: {len(message)} bytes")
+                    hex_dump = ' '.join(f'{b:02x}' for b in message[:min(20, len(message))])
+                    print(f"[DEBUG] First bytes (hex): {hex_dump}")
         else:
             # Text message (JSON response?)
-            print(f"[DEBUG] Received text message: {message}")
+            packet_counts['text_messages'] += 1
+            if DEPTH_DEBUG or packet_counts['text_messages'] == 1:
+                print(f"[DEBUG] Received text message: {message}")
         
     except Exception as e:
         print(f"Error parsing message: {e}")
@@ -0,0 +1,529 @@
+"""
+Async RabbitMQ Publisher
+Publisher variant on pika's AsyncioConnection with pipelined publisher confirms
+
+publish_batch() encodes on the caller's thread and hands the body to the
+event loop, which keeps up to CONFIRM_WINDOW batches unconfirmed on the
+channel instead of one synchronous socket write per batch. Confirms are
+tracked by delivery tag; nacked batches, and batches still unconfirmed when
+the connection drops, are re-published ahead of new ones.
+
+Runs on the Dhan client's asyncio loop (start(loop)) or on its own loop
+thread (start()) for the Kite path.
+
+Selected with INGESTION_PUBLISHER=async
+"""
+
+import os
+import json
+import time
+import asyncio
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, Any, List, Optional
+
+import pika
+from pika.adapters.asyncio_connection import AsyncioConnection
+import structlog
+
+from publisher import RabbitMQPublisher
+from tick_wire import content_type_for, partition_for, trace_headers
+
+logger = structlog.get_logger()
+
+# Pending/unconfirmed entry slots
+BODY, CONTENT_TYPE, CONTENT_ENCODING, ROUTING_KEY, TICKS, ATTEMPTS, SENT_AT, TRACE = range(8)
+
+
+class AsyncRabbitMQPublisher(RabbitMQPublisher):
+    """
+    Non-blocking RabbitMQ publisher with publisher confirms
+    
+    Same interface as RabbitMQPublisher (publish_batch, get_stats,
+    get_queue_depth, close); encoding, compression and their statistics are
+    shared with it. publish_batch() returns once the batch is queued for the
+    event loop - it only blocks (up to PUBLISH_TIMEOUT) when MAX_PENDING
+    batches are already queued or unconfirmed, and never blocks on the loop
+    thread itself.
+    
+    The disk spool is not used: unconfirmed batches are held in memory and
+    retried across reconnects.
+    """
+    
+    CONFIRM_WINDOW = int(os.getenv("INGESTION_PUBLISH_CONFIRM_WINDOW", 64))  # Unconfirmed batches on the channel
+    MAX_PENDING = int(os.getenv("INGESTION_PUBLISH_MAX_PENDING", 1000))  # Queued + unconfirmed batches before publish_batch waits
+    PUBLISH_TIMEOUT = float(os.getenv("INGESTION_PUBLISH_TIMEOUT", 5.0))  # Seconds publish_batch waits for room
+    MAX_ATTEMPTS = int(os.getenv("INGESTION_PUBLISH_MAX_ATTEMPTS", 5))  # Publishes per batch before a nacked batch is dropped
+    MAX_RECONNECT_DELAY = 30  # seconds
+    
+    def __init__(
+        self,
+        rabbitmq_url: str,
+        wire_format: Optional[str] = None,
+        compression: Optional[str] = None,
+        compression_min_bytes: Optional[int] = None,
+        confirm_window: Optional[int] = None,
+        max_pending: Optional[int] = None,
+        partitions: Optional[int] = None
+    ):
+        """
+        Initialize async publisher (the connection opens in start())
+        
+        Args:
+            rabbitmq_url: RabbitMQ connection URL (amqp://...)
+            wire_format: Override for INGESTION_WIRE_FORMAT ("json" or "binary")
+            compression: Override for INGESTION_COMPRESSION ("none", "zlib" or "lz4")
+            compression_min_bytes: Override for INGESTION_COMPRESSION_MIN_BYTES
+            confirm_window: Override for INGESTION_PUBLISH_CONFIRM_WINDOW
+            max_pending: Override for INGESTION_PUBLISH_MAX_PENDING
+            partitions: Override for TICK_QUEUE_PARTITIONS
+        """
+        self.confirm_window = confirm_window or self.CONFIRM_WINDOW
+        self.max_pending = max_pending or self.MAX_PENDING
+        
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._loop_thread_id: Optional[int] = None
+        self._ready = False
+        self._closing = False
+        self._closed = threading.Event()
+        self._connect_attempts = 0
+        
+        # Loop-thread state
+        self._pending = deque()
+        self._unconfirmed: "OrderedDict[int, List]" = OrderedDict()
+        self._next_tag = 1
+        self._queue_depths: Dict[str, int] = {}
+        self._declared_queues = 0
+        
+        # Queued + unconfirmed batches (any thread, guarded by the condition)
+        self._room = threading.Condition()
+        self._outstanding = 0
+        
+        if self.SPOOL_DIR:
+            logger.warning("spool_not_used_by_async_publisher", spool_dir=self.SPOOL_DIR)
+        
+        super().__init__(
+            rabbitmq_url, wire_format, compression, compression_min_bytes, spool_dir='', partitions=partitions
+        )
+        
+        # Statistics
+        self.nacked_batches = 0
+        self.retried_batches = 0
+        self.failed_batches = 0
+        self.rejected_batches = 0
+        self.requeued_batches = 0
+        self.max_unconfirmed = 0
+        self.confirm_seconds = 0.0
+        self.max_confirm_seconds = 0.0
+    
+    def _connect(self, max_retries: Optional[int] = None):
+        """Connections are opened on the event loop by start()"""
+    
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """
+        Open the connection on an event loop
+        
+        Args:
+            loop: Running loop to share (the Dhan client's); None starts a
+                dedicated loop thread
+        """
+        if loop is None:
+            loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(
+                target=self._run_loop,
+                args=(loop,),
+                name="amqp-publisher",
+                daemon=True
+            )
+            self._thread.start()
+        
+        self._loop = loop
+        loop.call_soon_threadsafe(self._open_connection)
+    
+    def _run_loop(self, loop: asyncio.AbstractEventLoop):
+        asyncio.set_event_loop(loop)
+        loop.run_forever()
+        loop.close()
+    
+    def _on_loop_thread(self) -> bool:
+        return threading.get_ident() == self._loop_thread_id
+    
+    def _open_connection(self):
+        self._loop_thread_id = threading.get_ident()
+        if self._closing:
+            return
+        
+        parameters = pika.URLParameters(self.rabbitmq_url)
+        parameters.heartbeat = 600
+        parameters.blocked_connection_timeout = 300
+        
+        logger.info("rabbitmq_connecting", attempt=self._connect_attempts + 1, publisher="async")
+        self.connection = AsyncioConnection(
+            parameters,
+            on_open_callback=self._on_connection_open,
+            on_open_error_callback=self._on_connection_open_error,
+            on_close_callback=self._on_connection_closed,
+            custom_ioloop=self._loop
+        )
+    
+    def _on_connection_open(self, connection):
+        connection.channel(on_open_callback=self._on_channel_open)
+    
+    def _on_connection_open_error(self, connection, error):
+        logger.error("rabbitmq_connection_failed", attempt=self._connect_attempts + 1, error=str(error) or repr(error))
+        self._schedule_reconnect()
+    
+    def _on_channel_open(self, channel):
+        self.channel = channel
+        channel.add_on_close_callback(self._on_channel_closed)
+        
+        self._declared_queues = 0
+        for queue in self.queue_names:
+            channel.queue_declare(
+                queue=queue,
+                durable=True,
+                arguments=self.QUEUE_ARGUMENTS,
+                callback=self._on_queue_declared
+            )
+    
+    def _on_queue_declared(self, frame):
+        self._queue_depths[frame.method.queue] = frame.method.message_count
+        self._declared_queues += 1
+        if self._declared_queues < len(self.queue_names):
+            return
+        
+        self.channel.confirm_delivery(
+            ack_nack_callback=self._on_delivery_confirmation,
+            callback=self._on_confirm_selected
+        )
+    
+    def _on_confirm_selected(self, frame):
+        # Delivery tags restart at 1 on every channel
+        self._next_tag = 1
+        self._ready = True
+        self._connect_attempts = 0
+        
+        logger.info(
+            "rabbitmq_connected",
+            queue=self.QUEUE_NAME,
+            partitions=self.partitions,
+            durable=True,
+            publisher="async",
+            confirm_window=self.confirm_window,
+            pending_batches=len(self._pending)
+        )
+        self._publish_pending()
+    
+    def _on_channel_closed(self, channel, reason):
+        self._ready = False
+        self.channel = None
+        self._requeue_unconfirmed()
+        
+        if not self._closing:
+            logger.warning("rabbitmq_channel_closed", reason=str(reason))
+            if self.connection and not self.connection.is_closed and not self.connection.is_closing:
+                self.connection.close()
+    
+    def _on_connection_closed(self, connection, reason):
+        self._ready = False
+        self.channel = None
+        self._requeue_unconfirmed()
+        
+        if self._closing:
+            logger.info("rabbitmq_connection_closed")
+            self._closed.set()
+            if self._thread is not None:
+                self._loop.stop()
+            return
+        
+        logger.warning("rabbitmq_connection_lost", action="reconnecting", reason=str(reason))
+        self._schedule_reconnect()
+    
+    def _schedule_reconnect(self):
+        if self._closing:
+            self._closed.set()
+            return
+        
+        self._connect_attempts += 1
+        delay = min(self.RETRY_DELAY * self._connect_attempts, self.MAX_RECONNECT_DELAY)
+        self._loop.call_later(delay, self._open_connection)
+    
+    def _requeue_unconfirmed(self):
+        """Unconfirmed batches go back to the front of the queue (in order) for the next channel"""
+        if not self._unconfirmed:
+            return
+        
+        entries = list(self._unconfirmed.values())
+        self._unconfirmed.clear()
+        self._pending.extendleft(reversed(entries))
+        self.requeued_batches += len(entries)
+        logger.warning("unconfirmed_batches_requeued", count=len(entries))
+    
+    def publish(self, message: Dict[str, Any]) -> bool:
+        """
+        Publish a single message (JSON) through the confirm pipeline
+        
+        Returns:
+            bool: True if queued for publishing
+        """
+        routing_key = self.queue_names[partition_for(message.get('instrument_token'), self.partitions)]
+        body = json.dumps(message).encode('utf-8')
+        return self._submit(body, content_type_for(binary=False), None, routing_key, 1) > 0
+    
+    def publish_batch(self, messages: list, trace: Optional[tuple] = None) -> int:
+        """
+        Queue a batch for publishing as ONE message (one per partition)
+        
+        Args:
+            messages: List of dictionaries to publish as batch
+            trace: Optional (source, received_at, enriched_at); the publish
+                   time is stamped when the loop writes the batch
+        
+        Returns:
+            int: Number of ticks in batch if queued, 0 if the backlog stayed
+                full for PUBLISH_TIMEOUT (or the publisher is not started)
+        """
+        if not messages:
+            return 0
+        
+        return sum(
+            self._publish_partition(routing_key, batch, trace)
+            for routing_key, batch in self._partition_batch(messages)
+        )
+    
+    def _publish_partition(self, routing_key: str, messages: list, trace: Optional[tuple] = None) -> int:
+        body, content_type = self._encode_batch(messages)
+        body, content_encoding = self._compress(body)
+        return self._submit(body, content_type, content_encoding, routing_key, len(messages), trace)
+    
+    def _submit(
+        self,
+        body: bytes,
+        content_type: str,
+        content_encoding: Optional[str],
+        routing_key: str,
+        ticks: int,
+        trace: Optional[tuple] = None
+    ) -> int:
+        """Reserve room in the backlog and hand the encoded batch to the loop"""
+        if self._loop is None or self._closing:
+            logger.error("async_publisher_not_running", batch_size=ticks)
+            return 0
+        
+        # Never wait on the loop thread - it is the one that frees room
+        timeout = 0 if self._on_loop_thread() else self.PUBLISH_TIMEOUT
+        with self._room:
+            if not self._room.wait_for(lambda: self._outstanding < self.max_pending, timeout=timeout):
+                self.rejected_batches += 1
+                logger.error(
+                    "async_publish_backlog_full",
+                    batch_size=ticks,
+                    outstanding=self._outstanding,
+                    max_pending=self.max_pending
+                )
+                return 0
+            self._outstanding += 1
+        
+        self._loop.call_soon_threadsafe(self._enqueue, [body, content_type, content_encoding, routing_key, ticks, 0, 0.0, trace])
+        return ticks
+    
+    def _enqueue(self, entry: List):
+        self._pending.append(entry)
+        self._publish_pending()
+    
+    def _publish_pending(self):
+        """Fill the confirm window from the pending queue"""
+        if not self._ready or self.channel is None:
+            return
+        
+        while self._pending and len(self._unconfirmed) < self.confirm_window:
+            entry = self._pending.popleft()
+            now = time.time()
+            try:
+                self.channel.basic_publish(
+                    exchange=self.EXCHANGE_NAME,
+                    routing_key=entry[ROUTING_KEY],
+                    body=entry[BODY],
+                    properties=pika.BasicProperties(
+                        delivery_mode=2,  # Make message persistent
+                        content_type=entry[CONTENT_TYPE],
+                        content_encoding=entry[CONTENT_ENCODING],
+                        timestamp=int(now),
+                        headers=trace_headers(*entry[TRACE], now) if entry[TRACE] else None
+                    )
+                )
+            except Exception as e:
+                self._pending.appendleft(entry)
+                logger.error("batch_publish_failed", error=str(e), batch_size=entry[TICKS])
+                return
+            
+            entry[ATTEMPTS] += 1
+            entry[SENT_AT] = time.perf_counter()
+            self._unconfirmed[self._next_tag] = entry
+            self._next_tag += 1
+        
+        self.max_unconfirmed = max(self.max_unconfirmed, len(self._unconfirmed))
+    
+    def _on_delivery_confirmation(self, frame):
+        """Basic.Ack / Basic.Nack - settles one tag, or every tag up to it when multiple"""
+        method = frame.method
+        acked = isinstance(method, pika.spec.Basic.Ack)
+        tag = method.delivery_tag
+        
+        if method.multiple:
+            tags = []
+            for pending_tag in self._unconfirmed:
+                if pending_tag > tag:
+                    break
+                tags.append(pending_tag)
+        else:
+            tags = [tag]
+        
+        now = time.perf_counter()
+        settled = 0
+        retry = []
+        
+        for pending_tag in tags:
+            entry = self._unconfirmed.pop(pending_tag, None)
+            if entry is None:
+                continue
+            
+            elapsed = now - entry[SENT_AT]
+            self.confirm_seconds += elapsed
+            self.max_confirm_seconds = max(self.max_confirm_seconds, elapsed)
+            
+            if acked:
+                self.batches_published += 1
+                self.ticks_published += entry[TICKS]
+                self.bytes_published += len(entry[BODY])
+                self.log_counters.add("batch_confirmed", ticks=entry[TICKS], bytes=len(entry[BODY]))
+                settled += 1
+                continue
+            
+            self.nacked_batches += 1
+            if entry[ATTEMPTS] >= self.MAX_ATTEMPTS:
+                self.failed_batches += 1
+                settled += 1
+                logger.error("batch_nacked_dropped", batch_size=entry[TICKS], attempts=entry[ATTEMPTS])
+            else:
+                self.retried_batches += 1
+                retry.append(entry)
+        
+        if retry:
+            logger.warning("batches_nacked_retrying", count=len(retry))
+            self._pending.extendleft(reversed(retry))
+        
+        if settled:
+            with self._room:
+                self._outstanding -= settled
+                self._room.notify_all()
+        
+        self._publish_pending()
+    
+    def get_queue_depth(self) -> int:
+        """
+        Queue depth from the most recent check (non-blocking)
+        Each call also schedules fresh passive declares on the loop
+        
+        Returns:
+            int: Number of messages in queue (summed over partitions), -1 if not known yet
+        """
+        if self._loop is not None and not self._closing:
+            self._loop.call_soon_threadsafe(self._check_queue_depth)
+        if len(self._queue_depths) < len(self.queue_names):
+            return -1
+        return sum(self._queue_depths.values())
+    
+    def _check_queue_depth(self):
+        if not self._ready or self.channel is None:
+            return
+        
+        def on_declared(frame):
+            self._queue_depths[frame.method.queue] = frame.method.message_count
+        
+        try:
+            for queue in self.queue_names:
+                self.channel.queue_declare(queue=queue, passive=True, callback=on_declared)
+        except Exception as e:
+            logger.error("queue_depth_check_failed", error=str(e))
+    
+    def get_stats(self) -> Dict:
+        """Get publishing statistics"""
+        confirmed = self.batches_published + self.nacked_batches
+        stats = super().get_stats()
+        stats.update({
+            'publisher': 'async',
+            'confirm_window': self.confirm_window,
+            'outstanding_batches': self._outstanding,
+            'unconfirmed_batches': len(self._unconfirmed),
+            'max_unconfirmed_batches': self.max_unconfirmed,
+            'nacked_batches': self.nacked_batches,
+            'retried_batches': self.retried_batches,
+            'failed_batches': self.failed_batches,
+            'rejected_batches': self.rejected_batches,
+            'requeued_batches': self.requeued_batches,
+            'avg_confirm_ms': round(self.confirm_seconds / confirmed * 1000, 2) if confirmed else 0,
+            'max_confirm_ms': round(self.max_confirm_seconds * 1000, 2)
+        })
+        return stats
+    
+    async def aclose(self, timeout: float = 10.0):
+        """
+        Wait for outstanding batches to be confirmed, then close (on the loop)
+        
+        Args:
+            timeout: Seconds to wait for confirms
+        """
+        deadline = time.time() + timeout
+        while self._outstanding and time.time() < deadline:
+            await asyncio.sleep(0.05)
+        
+        self._close_connection()
+        while not self._closed.is_set() and time.time() < deadline + 1:
+            await asyncio.sleep(0.05)
+    
+    def close(self, timeout: float = 10.0):
+        """
+        Wait (up to timeout) for outstanding batches to be confirmed, then close
+        On the loop thread this only starts the close (use aclose() there)
+        
+        Args:
+            timeout: Seconds to wait for confirms
+        """
+        if self._loop is None or self._closed.is_set():
+            return
+        
+        if self._on_loop_thread():
+            self._close_connection()
+            return
+        
+        with self._room:
+            self._room.wait_for(lambda: self._outstanding == 0, timeout=timeout)
+        
+        try:
+            self._loop.call_soon_threadsafe(self._close_connection)
+        except RuntimeError:
+            # Loop already stopped
+            return
+        
+        self._closed.wait(timeout=5)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        
+        self.log_counters.flush()
+    
+    def _close_connection(self):
+        if self._closing:
+            return
+        self._closing = True
+        
+        if self._outstanding:
+            logger.warning("async_publisher_closing_with_unconfirmed", outstanding=self._outstanding)
+        
+        if self.connection is not None and not self.connection.is_closed and not self.connection.is_closing:
+            self.connection.close()
+        else:
+            self._closed.set()
+            if self._thread is not None:
+                self._loop.stop()
@@ -0,0 +1,213 @@
+"""
+Tick Batcher
+Size/time based buffering of enriched ticks in front of RabbitMQPublisher.publish_batch
+Used by the Dhan path and the Kite publisher thread
+"""
+
+import os
+import time
+import threading
+import structlog
+from typing import Dict, List, Any, Optional
+
+from publisher import RabbitMQPublisher
+from conflator import TickConflator
+from metrics import BATCH_SIZE, PUBLISH_SECONDS, tick_lag
+
+logger = structlog.get_logger()
+
+
+class TickBatcher:
+    """
+    Buffers enriched tick dicts and publishes them as one RabbitMQ message
+    
+    Flushes when the buffer reaches BATCH_SIZE, or when BATCH_TIMEOUT has
+    elapsed since the last flush (checked on every add and by flush_if_due(),
+    which the caller runs on a timer so idle periods still flush).
+    
+    With a source set, each batch carries x-tick-trace hop timestamps for
+    its oldest tick: WebSocket receive (passed to extend()), enrichment done
+    (when extend() was called) and publish.
+    """
+    
+    # Same knobs as the Kite path
+    BATCH_SIZE = int(os.getenv("INGESTION_BATCH_SIZE", 500))  # Number of ticks per batch
+    BATCH_TIMEOUT = float(os.getenv("INGESTION_BATCH_TIMEOUT", 0.5))  # Seconds before forcing flush
+    TRACE_ENABLED = os.getenv("INGESTION_TRACE_ENABLED", "true").lower() == "true"  # x-tick-trace hop headers
+    
+    def __init__(
+        self,
+        publisher: RabbitMQPublisher,
+        batch_size: Optional[int] = None,
+        batch_timeout: Optional[float] = None,
+        conflator: Optional[TickConflator] = None,
+        source: Optional[str] = None
+    ):
+        """
+        Initialize batcher
+        
+        Args:
+            publisher: RabbitMQ publisher instance
+            batch_size: Override for INGESTION_BATCH_SIZE
+            batch_timeout: Override for INGESTION_BATCH_TIMEOUT (seconds)
+            conflator: Optional backlog conflation stage applied on every flush
+            source: Feed name ("kite" / "dhan") for trace headers; None or
+                    INGESTION_TRACE_ENABLED=false publishes untraced
+        """
+        self.publisher = publisher
+        self.batch_size = batch_size or self.BATCH_SIZE
+        self.batch_timeout = batch_timeout or self.BATCH_TIMEOUT
+        self.conflator = conflator
+        self.source = source if self.TRACE_ENABLED else None
+        
+        self._buffer: List[Dict[str, Any]] = []
+        # Receive / enrich-done epoch seconds of the oldest buffered tick
+        self._received_at: Optional[float] = None
+        self._enriched_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self.last_flush_time = time.time()
+        
+        # Statistics
+        self.ticks_buffered = 0
+        self.ticks_flushed = 0
+        self.published_count = 0
+        self.failed_count = 0
+        self.batch_count = 0
+        self.size_flushes = 0
+        self.timer_flushes = 0
+        self.last_batch_size = 0
+        self.max_batch_size = 0
+        self.total_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.last_flush_seconds = 0.0
+    
+    def add(self, tick: Dict[str, Any], received_at: Optional[float] = None):
+        """Buffer a single enriched tick, flushing if the batch is full or due"""
+        self.extend([tick], received_at)
+    
+    def extend(self, ticks: List[Dict[str, Any]], received_at: Optional[float] = None):
+        """
+        Buffer several enriched ticks, flushing if the batch is full or due
+        
+        Args:
+            ticks: Enriched tick dicts
+            received_at: Epoch seconds the ticks were read off the WebSocket
+                         (defaults to now)
+        """
+        if not ticks:
+            return
+        
+        with self._lock:
+            if self._received_at is None:
+                now = time.time()
+                self._received_at = received_at or now
+                self._enriched_at = now
+            self._buffer.extend(ticks)
+            self.ticks_buffered += len(ticks)
+            
+            if len(self._buffer) >= self.batch_size:
+                self.size_flushes += 1
+                self._flush_locked()
+            elif (time.time() - self.last_flush_time) >= self.batch_timeout:
+                self.timer_flushes += 1
+                self._flush_locked()
+    
+    def flush_if_due(self) -> int:
+        """
+        Flush if BATCH_TIMEOUT has elapsed since the last flush
+        Call periodically so buffered ticks go out even when no new ticks arrive
+        
+        Returns:
+            int: Number of ticks published
+        """
+        with self._lock:
+            held = self.conflator.pending if self.conflator else 0
+            if (self._buffer or held) and (time.time() - self.last_flush_time) >= self.batch_timeout:
+                self.timer_flushes += 1
+                return self._flush_locked()
+            
+            # Keep draining the publisher's disk spool while no new ticks arrive
+            self.publisher.drain_spool()
+            return 0
+    
+    def flush(self) -> int:
+        """
+        Flush whatever is buffered, including ticks held by the conflator (shutdown/close)
+        
+        Returns:
+            int: Number of ticks published
+        """
+        with self._lock:
+            return self._flush_locked(drain=True)
+    
+    def _flush_locked(self, drain: bool = False) -> int:
+        """Publish the buffer as one batch (caller holds the lock)"""
+        batch = self._buffer
+        self._buffer = []
+        trace = (self.source, self._received_at, self._enriched_at) if self.source and self._received_at else None
+        self._received_at = self._enriched_at = None
+        
+        if self.conflator is not None:
+            batch = self.conflator.process(batch)
+            if drain:
+                batch += self.conflator.drain()
+        
+        if not batch:
+            self.last_flush_time = time.time()
+            return 0
+        
+        batch_size = len(batch)
+        
+        start = time.perf_counter()
+        try:
+            success_count = self.publisher.publish_batch(batch, trace)
+        except Exception as e:
+            logger.error("batch_publish_error", error=str(e), batch_size=batch_size)
+            success_count = 0
+        elapsed = time.perf_counter() - start
+        
+        self.last_flush_time = time.time()
+        PUBLISH_SECONDS.observe(elapsed)
+        BATCH_SIZE.observe(batch_size)
+        self.batch_count += 1
+        self.ticks_flushed += batch_size
+        self.last_batch_size = batch_size
+        self.max_batch_size = max(self.max_batch_size, batch_size)
+        self.last_flush_seconds = elapsed
+        self.total_flush_seconds += elapsed
+        self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+        
+        if success_count > 0:
+            self.published_count += success_count
+            tick_lag.observe_batch(batch, self.last_flush_time)
+        else:
+            self.failed_count += batch_size
+            logger.warning("batch_publish_failed", batch_size=batch_size)
+        
+        return success_count
+    
+    def get_stats(self) -> Dict:
+        """Get batching statistics"""
+        with self._lock:
+            buffered = len(self._buffer)
+        
+        stats = {
+            'buffered_ticks': buffered,
+            'ticks_buffered_total': self.ticks_buffered,
+            'published_ticks': self.published_count,
+            'failed_ticks': self.failed_count,
+            'batch_count': self.batch_count,
+            'size_flushes': self.size_flushes,
+            'timer_flushes': self.timer_flushes,
+            'last_batch_size': self.last_batch_size,
+            'max_batch_size': self.max_batch_size,
+            'avg_batch_size': round(self.ticks_flushed / self.batch_count, 1) if self.batch_count else 0,
+            'last_flush_ms': round(self.last_flush_seconds * 1000, 2),
+            'avg_flush_ms': round(self.total_flush_seconds / self.batch_count * 1000, 2) if self.batch_count else 0,
+            'max_flush_ms': round(self.max_flush_seconds * 1000, 2)
+        }
+        
+        if self.conflator is not None:
+            stats.update(self.conflator.get_stats())
+        
+        return stats
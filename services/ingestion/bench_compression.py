@@ -0,0 +1,74 @@
+"""
+Benchmark: compression of published tick batches
+Checks decode_body(compress_body(...)) round-trips, then reports body size,
+compression ratio and compress/decompress time per batch for each wire
+format, batch size and codec - input for INGESTION_COMPRESSION_MIN_BYTES
+
+Usage:
+    python bench_compression.py
+"""
+
+import json
+import random
+import time
+
+from bench_tick_records import build_cache
+from bench_tick_wire import build_batches
+from tick_wire import (
+    encode_batch, decode_body, content_type_for, compress_body, decompress_body, lz4_frame
+)
+
+BATCH_SIZES = [10, 50, 100, 500, 2_000]
+CODECS = [('zlib', 1), ('zlib', 6)] + ([('lz4', 0)] if lz4_frame is not None else [])
+ROUNDS = 20
+
+
+def encode(ticks, wire_format: str) -> bytes:
+    if wire_format == 'binary':
+        return encode_batch(ticks)
+    return json.dumps(ticks).encode('utf-8')
+
+
+def check_round_trip(ticks, wire_format: str, codec: str, level: int):
+    body = compress_body(encode(ticks, wire_format), codec, level)
+    decoded = decode_body(body, content_type_for(binary=wire_format == 'binary'), codec)
+    assert decoded == json.loads(json.dumps(ticks))
+
+
+def per_batch_ms(fn, *args) -> float:
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        fn(*args)
+    return (time.perf_counter() - start) / ROUNDS * 1e3
+
+
+if __name__ == "__main__":
+    import logging
+    import structlog
+    structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(logging.ERROR))
+    
+    random.seed(5)
+    batches = build_batches(build_cache())
+    
+    for ticks in batches.values():
+        for wire_format in ('json', 'binary'):
+            for codec, level in CODECS:
+                check_round_trip(ticks[:100], wire_format, codec, level)
+    print("round trip: compressed batches decode to the same dicts")
+    if lz4_frame is None:
+        print("lz4 package not installed - lz4 skipped")
+    
+    print(f"{'feed':>5} | {'format':>6} | {'batch':>6} | {'codec':>7} | {'raw KB':>8} | "
+          f"{'ratio':>6} | {'compress':>10} | {'decompress':>10}")
+    for feed, ticks in batches.items():
+        for wire_format in ('json', 'binary'):
+            for size in BATCH_SIZES:
+                body = encode(ticks[:size], wire_format)
+                for codec, level in CODECS:
+                    compressed = compress_body(body, codec, level)
+                    print(
+                        f"{feed:>5} | {wire_format:>6} | {size:>6} | {codec}:{level:<2} | "
+                        f"{len(body) / 1024:>8.1f} | {len(body) / len(compressed):>6.1f} | "
+                        f"{per_batch_ms(compress_body, body, codec, level):>8.3f}ms | "
+                        f"{per_batch_ms(decompress_body, compressed, codec):>8.3f}ms"
+                    )
@@ -0,0 +1,134 @@
+"""
+Parity check + benchmark: columnar (NumPy) vs dict decoding of Dhan full packets
+Checks enrich_full_batch() records equal dhan_tick_to_enriched(...).to_dict(),
+then times decode and decode+enrich at 1k, 10k and 100k packets per batch
+
+Usage:
+    python bench_dhan_columnar.py
+"""
+
+import random
+import time
+
+from bench_dhan_parser import build_packet
+from dhan_parser import decode_packet, RESPONSE_FULL, RESPONSE_OI, RESPONSE_PREV_CLOSE
+from dhan_columnar import decode_full_batch, enrich_full_batch
+from enricher import dhan_tick_to_enriched, dhan_tick_to_record
+from instrument_state import InstrumentStateStore
+from models import DhanTick, InstrumentInfo
+
+BATCH_SIZES = [1_000, 10_000, 100_000]
+NUM_INSTRUMENTS = 2_000
+
+
+def build_cache():
+    cache = {}
+    for i in range(NUM_INSTRUMENTS):
+        token = 10_000_000 + i
+        cache[token] = InstrumentInfo(
+            instrument_token=token,
+            trading_symbol=f"NIFTY{i}CE",
+            exchange='NSE',
+            instrument_type='CE',
+            security_id=str(35_000 + i),
+            source='dhan'
+        )
+    return cache
+
+
+def build_batch(count: int):
+    # A few unknown security_ids to exercise the drop path
+    return [
+        build_packet(RESPONSE_FULL, security_id=35_000 + random.randint(0, NUM_INSTRUMENTS + 20))
+        for _ in range(count)
+    ]
+
+
+def dict_path(packets, cache):
+    records = []
+    for packet in packets:
+        enriched = dhan_tick_to_enriched(DhanTick(**decode_packet(packet)), cache)
+        if enriched:
+            records.append(enriched.to_dict())
+    return records
+
+
+def numpy_path(packets, cache):
+    return enrich_full_batch(decode_full_batch(packets), cache)
+
+
+def check_parity(cache, count: int = 20_000):
+    packets = build_batch(count)
+    expected = dict_path(packets, cache)
+    actual = numpy_path(packets, cache)
+    assert len(expected) == len(actual)
+    for exp, act in zip(expected, actual):
+        if exp['last_trade_time'] is None:
+            # No exchange time in packet - both fall back to wall clock
+            exp = {**exp, 'time': None}
+            act = {**act, 'time': None}
+        assert exp == act, (exp, act)
+        assert list(exp) == list(act)
+    print(f"parity: {len(expected)} enriched records identical ({count - len(expected)} unknown dropped)")
+
+
+def check_state_parity(cache, count: int = 20_000):
+    """Same check with OI/prev-close packets folded in through InstrumentStateStore"""
+    security_ids = [35_000 + random.randint(0, NUM_INSTRUMENTS + 20) for _ in range(count)]
+    partial = [build_packet(random.choice([RESPONSE_OI, RESPONSE_PREV_CLOSE]), security_id=s) for s in security_ids]
+    packets = [build_packet(RESPONSE_FULL, security_id=s) for s in security_ids]
+
+    dict_state, numpy_state = InstrumentStateStore(), InstrumentStateStore()
+    for packet in partial:
+        dict_state.merge(decode_packet(packet))
+        numpy_state.merge(decode_packet(packet))
+
+    expected = []
+    for packet in packets:
+        record = dhan_tick_to_record(dict_state.merge(decode_packet(packet)), cache)
+        if record:
+            expected.append(record.to_dict())
+    batch = decode_full_batch(packets)
+    actual = enrich_full_batch(batch, cache, numpy_state.merge_full_batch(batch))
+
+    assert len(expected) == len(actual)
+    with_change = 0
+    for exp, act in zip(expected, actual):
+        if exp['last_trade_time'] is None:
+            exp = {**exp, 'time': None}
+            act = {**act, 'time': None}
+        assert exp == act, (exp, act)
+        with_change += exp['change'] is not None
+    print(f"state parity: {len(expected)} merged records identical ({with_change} with change from prev_close)")
+
+
+def timed(fn, *args) -> float:
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    import logging
+    import structlog
+    structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(logging.ERROR))
+
+    random.seed(11)
+    cache = build_cache()
+
+    check_parity(cache)
+    check_state_parity(cache)
+
+    print(f"{'batch':>8} | {'dict decode':>12} | {'np decode':>10} | {'dict+enrich':>12} | {'np+enrich':>10} | speedup")
+    for size in BATCH_SIZES:
+        packets = build_batch(size)
+        dict_decode = timed(lambda: [decode_packet(p) for p in packets])
+        np_decode = timed(decode_full_batch, packets)
+        dict_total = timed(dict_path, packets, cache)
+        np_total = timed(numpy_path, packets, cache)
+        print(
+            f"{size:>8} | {dict_decode / size * 1e6:9.2f} us | {np_decode / size * 1e6:7.3f} us | "
+            f"{dict_total / size * 1e6:9.2f} us | {np_total / size * 1e6:7.2f} us | "
+            f"{dict_total / np_total:6.1f}x"
+        )
+    print("(times are per packet)")
@@ -0,0 +1,114 @@
+"""
+Parity check + benchmark: Dhan packet decoding
+Verifies decode_packet() output matches parse_packet() exactly on randomized
+packets of every layout, then reports packets/sec for both decoders
+
+Usage:
+    python bench_dhan_parser.py [num_packets]
+"""
+
+import random
+import struct
+import sys
+import time
+from typing import List
+
+from dhan_parser import (
+    parse_packet,
+    decode_packet,
+    RESPONSE_INDEX,
+    RESPONSE_TICKER,
+    RESPONSE_QUOTE,
+    RESPONSE_OI,
+    RESPONSE_PREV_CLOSE,
+    RESPONSE_FULL,
+    PACKET_SIZES,
+)
+
+
+def _price() -> float:
+    # Mix in zero/negative values so the "> 0 else None" branches are exercised
+    return random.choice([0.0, -1.0, round(random.uniform(0.05, 30000), 2)])
+
+
+def _int(limit: int = 2**31 - 1) -> int:
+    return random.choice([0, -1, random.randint(1, limit)])
+
+
+def build_packet(response_code: int, security_id: int = None, segment: int = 2) -> bytes:
+    """Build a random, well-formed Dhan binary packet for the given response code"""
+    size = PACKET_SIZES[response_code]
+    security_id = security_id if security_id is not None else random.randint(1, 2_000_000)
+    header = struct.pack('<BhBi', response_code, size, segment, security_id)
+    epoch = random.choice([0, 1767000000 + random.randint(0, 100000)])
+
+    if response_code in (RESPONSE_INDEX, RESPONSE_TICKER):
+        body = struct.pack('<fi', _price(), epoch)
+    elif response_code == RESPONSE_QUOTE:
+        body = struct.pack(
+            '<fhifiiiffff', _price(), _int(32767), epoch, _price(),
+            _int(), _int(), _int(), _price(), _price(), _price(), _price()
+        )
+    elif response_code == RESPONSE_OI:
+        body = struct.pack('<i', _int())
+    elif response_code == RESPONSE_PREV_CLOSE:
+        body = struct.pack('<fi', _price(), _int())
+    elif response_code == RESPONSE_FULL:
+        body = struct.pack(
+            '<fhifiiiiiiffff', _price(), _int(32767), epoch, _price(),
+            _int(), _int(), _int(), _int(), _int(), _int(),
+            _price(), _price(), _price(), _price()
+        )
+        for _ in range(5):
+            body += struct.pack('<iihhff', _int(), _int(), _int(32767), _int(32767), _price(), _price())
+    else:
+        body = struct.pack('<h', random.randint(800, 820))
+
+    packet = header + body
+    assert len(packet) == size
+    return packet
+
+
+def build_mixed_packets(count: int) -> List[bytes]:
+    """Realistic mix for a full-mode option chain subscription"""
+    codes = [RESPONSE_FULL] * 7 + [RESPONSE_OI] * 2 + [RESPONSE_PREV_CLOSE]
+    return [build_packet(random.choice(codes)) for _ in range(count)]
+
+
+def check_parity(iterations: int = 20_000):
+    codes = list(PACKET_SIZES)
+    for _ in range(iterations):
+        packet = build_packet(random.choice(codes), segment=random.choice([0, 1, 2, 6, 8]))
+        expected = parse_packet(packet)
+        assert decode_packet(packet) == expected, packet.hex()
+        assert decode_packet(memoryview(packet)) == expected, packet.hex()
+        # Truncated packets must be rejected the same way
+        cut = random.randint(0, len(packet) - 1)
+        assert decode_packet(packet[:cut]) == parse_packet(packet[:cut]), packet[:cut].hex()
+    print(f"parity: {iterations} random packets (+ truncated variants) identical")
+
+
+def bench(name: str, fn, packets: List[bytes]) -> float:
+    start = time.perf_counter()
+    for packet in packets:
+        fn(packet)
+    elapsed = time.perf_counter() - start
+    rate = len(packets) / elapsed
+    print(f"{name:<24} {rate:>12,.0f} packets/sec")
+    return rate
+
+
+if __name__ == "__main__":
+    import logging
+    import structlog
+    structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(logging.ERROR))
+
+    random.seed(7)
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+
+    check_parity()
+
+    packets = build_mixed_packets(count)
+    before = bench("parse_packet (before)", parse_packet, packets)
+    after = bench("decode_packet (after)", decode_packet, packets)
+    print(f"speedup: {after / before:.2f}x")
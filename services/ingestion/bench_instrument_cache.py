@@ -0,0 +1,253 @@
+"""
+Benchmark: instruments cache load at startup
+Compares the previous fetchall() + pydantic InstrumentInfo load with the
+COPY stream parsed into InstrumentRecords (InstrumentCopySink) and with a
+warm start from the on-disk snapshot, and the previous KEYS + per-key
+HGETALL Redis fallback with SCAN + pipelined HGETALL
+
+No database or Redis is needed: the DB side replays synthetic driver rows /
+COPY text lines, and the Redis side uses an in-memory client that charges
+REDIS_RTT_MS per round trip.
+
+Usage:
+    python bench_instrument_cache.py
+"""
+
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Dict, List
+
+from models import InstrumentInfo
+from records import InstrumentRecord
+from instrument_snapshot import InstrumentCopySink, read_snapshot, write_snapshot
+from enricher import _gc_paused, _load_instruments_from_redis, _instruments_from_snapshot, _snapshot_columns
+
+SIZES = [10_000, 100_000]
+REDIS_SIZE = 20_000
+REDIS_RTT_MS = 0.2  # Same-host Docker network round trip
+
+
+def build_rows(size: int) -> List[tuple]:
+    """Synthetic instruments rows as psycopg2 returns them (Decimal strikes, date expiries)"""
+    rows = []
+    base_expiry = date(2026, 1, 29)
+    for i in range(size):
+        kind = i % 10
+        if kind == 0:
+            rows.append((
+                100_000 + i, f"STOCK{i}", 'NSE', None, 'EQ', f"Stock {i}",
+                None, None, Decimal('0.0500'), 1, str(1000 + i), 'kite'
+            ))
+        else:
+            rows.append((
+                10_000_000 + i, f"NIFTY26JAN{20000 + i % 400 * 50}{'CE' if i % 2 else 'PE'}", 'NFO', 'NFO-OPT',
+                'CE' if i % 2 else 'PE', 'NIFTY',
+                base_expiry + timedelta(days=7 * (i % 12)), Decimal(f"{20000 + i % 400 * 50}.00"),
+                Decimal('0.0500'), 75, str(35_000 + i) if i % 3 else None, 'dhan' if i % 3 else None
+            ))
+    return rows
+
+
+def copy_lines(rows: List[tuple]) -> List[bytes]:
+    """Render rows as the COPY text lines INSTRUMENTS_COPY_SQL produces"""
+    def field(value):
+        if value is None:
+            return '\\N'
+        if isinstance(value, date):
+            return value.isoformat()
+        return str(value)
+    
+    # SELECT order: token, symbol, exchange, type, expiry, strike, tick_size, lot_size, security_id, source
+    return [
+        ('\t'.join(field(row[i]) for i in (0, 1, 2, 4, 6, 7, 8, 9, 10, 11)) + '\n').encode()
+        for row in rows
+    ]
+
+
+def load_fetchall(rows: List[tuple]) -> Dict[int, InstrumentInfo]:
+    """Row loop as previously done in load_instruments_cache"""
+    instruments_cache = {}
+    for row in rows:
+        instruments_cache[row[0]] = InstrumentInfo(
+            instrument_token=row[0],
+            trading_symbol=row[1],
+            exchange=row[2],
+            instrument_type=row[4],
+            expiry=row[6].isoformat() if row[6] else None,
+            strike=float(row[7]) if row[7] else None,
+            lot_size=int(row[9]) if row[9] else None,
+            tick_size=float(row[8]) if row[8] else None,
+            security_id=row[10],
+            source=row[11] if row[11] else "kite"
+        )
+    return instruments_cache
+
+
+def load_copy(lines: List[bytes]) -> Dict[int, InstrumentRecord]:
+    """COPY path: psycopg2 hands the sink one row per write()"""
+    sink = InstrumentCopySink(InstrumentRecord)
+    with _gc_paused():
+        for line in lines:
+            sink.write(line)
+    return sink.instruments
+
+
+def measure(fn, data):
+    """(elapsed ms, peak traced MB) for one load; timed without tracemalloc running"""
+    start = time.perf_counter()
+    fn(data)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    
+    tracemalloc.start()
+    fn(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed_ms, peak / 1024 / 1024
+
+
+class FakeRedis:
+    """In-memory instrument:{token} hashes with a fixed cost per round trip"""
+    
+    def __init__(self, hashes: Dict[bytes, Dict[bytes, bytes]]):
+        self.hashes = hashes
+        self.round_trips = 0
+    
+    def _round_trip(self):
+        self.round_trips += 1
+        time.sleep(REDIS_RTT_MS / 1000)
+    
+    def keys(self, pattern):
+        self._round_trip()
+        return list(self.hashes)
+    
+    def hgetall(self, key):
+        self._round_trip()
+        return self.hashes.get(key, {})
+    
+    def scan_iter(self, match=None, count=10):
+        keys = list(self.hashes)
+        for start in range(0, len(keys), count):
+            self._round_trip()
+            yield from keys[start:start + count]
+    
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, client: FakeRedis):
+        self.client = client
+        self.commands = []
+    
+    def hgetall(self, key):
+        self.commands.append(key)
+    
+    def execute(self):
+        self.client._round_trip()
+        return [self.client.hashes.get(key, {}) for key in self.commands]
+
+
+def load_redis_keys(redis_client: FakeRedis) -> Dict[int, InstrumentInfo]:
+    """Redis fallback as previously done in load_instruments_cache"""
+    instruments_cache = {}
+    for key in redis_client.keys("instrument:*"):
+        token = int(key.decode('utf-8').split(':')[1])
+        data = redis_client.hgetall(key)
+        decoded_data = {k.decode('utf-8'): v.decode('utf-8') for k, v in data.items()}
+        instruments_cache[token] = InstrumentInfo(
+            instrument_token=token,
+            trading_symbol=decoded_data.get('tradingsymbol', ''),
+            exchange=decoded_data.get('exchange', ''),
+            instrument_type=decoded_data.get('instrument_type'),
+            expiry=decoded_data.get('expiry'),
+            strike=float(decoded_data['strike']) if decoded_data.get('strike') else None,
+            lot_size=int(decoded_data['lot_size']) if decoded_data.get('lot_size') else None,
+            tick_size=float(decoded_data['tick_size']) if decoded_data.get('tick_size') else None
+        )
+    return instruments_cache
+
+
+def build_redis(rows: List[tuple]) -> Dict[bytes, Dict[bytes, bytes]]:
+    """Hashes in the layout scripts/sync_instruments.py writes"""
+    return {
+        f"instrument:{row[0]}".encode(): {
+            b'tradingsymbol': row[1].encode(),
+            b'exchange': row[2].encode(),
+            b'instrument_type': row[4].encode(),
+            b'expiry': (row[6].isoformat() if row[6] else '').encode(),
+            b'strike': str(row[7] or 0).encode(),
+            b'tick_size': str(row[8]).encode(),
+            b'lot_size': str(row[9]).encode(),
+        }
+        for row in rows
+    }
+
+
+def same(record: InstrumentRecord, info: InstrumentInfo) -> bool:
+    return all(getattr(record, name) == getattr(info, name) for name in InstrumentRecord.__slots__)
+
+
+def run_db(size: int):
+    rows = build_rows(size)
+    lines = copy_lines(rows)
+    
+    # Both loads must produce the same instruments
+    old = load_fetchall(rows)
+    new = load_copy(lines)
+    assert old.keys() == new.keys()
+    assert all(same(new[token], info) for token, info in old.items())
+    
+    old_ms, old_mb = measure(load_fetchall, rows)
+    new_ms, new_mb = measure(load_copy, lines)
+    
+    print(
+        f"db    instruments={size:>7} | fetchall+pydantic: {old_ms:8.1f} ms {old_mb:7.1f} MB | "
+        f"COPY+records: {new_ms:8.1f} ms {new_mb:7.1f} MB | speedup: {old_ms / new_ms:4.1f}x"
+    )
+    
+    # Warm start: snapshot read + hash check + records
+    path = os.path.join(tempfile.mkdtemp(), 'instruments.snapshot')
+    write_snapshot(path, _snapshot_columns(new), db_version=1)
+    snapshot_ms, snapshot_mb = measure(lambda p: _instruments_from_snapshot(read_snapshot(p)), path)
+    assert _instruments_from_snapshot(read_snapshot(path)) == new
+    
+    print(
+        f"snap  instruments={size:>7} | snapshot read+records: {snapshot_ms:8.1f} ms {snapshot_mb:7.1f} MB | "
+        f"file: {os.path.getsize(path) / 1024 / 1024:5.1f} MB | vs COPY: {new_ms / snapshot_ms:4.1f}x"
+    )
+    os.remove(path)
+
+
+def run_redis(size: int):
+    hashes = build_redis(build_rows(size))
+    
+    old_client = FakeRedis(hashes)
+    start = time.perf_counter()
+    old = load_redis_keys(old_client)
+    old_ms = (time.perf_counter() - start) * 1000
+    
+    new_client = FakeRedis(hashes)
+    start = time.perf_counter()
+    new = _load_instruments_from_redis(new_client)
+    new_ms = (time.perf_counter() - start) * 1000
+    
+    assert old.keys() == new.keys()
+    assert all(same(new[token], info) for token, info in old.items())
+    
+    print(
+        f"redis instruments={size:>7} | KEYS+HGETALL: {old_ms:8.1f} ms ({old_client.round_trips} round trips) | "
+        f"SCAN+pipeline: {new_ms:8.1f} ms ({new_client.round_trips} round trips) | "
+        f"speedup: {old_ms / new_ms:4.1f}x"
+    )
+
+
+if __name__ == "__main__":
+    random.seed(42)
+    for size in SIZES:
+        run_db(size)
+    run_redis(REDIS_SIZE)
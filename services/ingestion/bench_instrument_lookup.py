@@ -0,0 +1,79 @@
+"""
+Micro-benchmark: Dhan security_id → instrument lookup
+Compares the old linear scan over instruments_cache with the
+(exchange_segment, security_id) secondary index used by dhan_tick_to_enriched
+
+Usage:
+    python bench_instrument_lookup.py
+"""
+
+import random
+import time
+from typing import Dict, Optional
+
+from models import InstrumentInfo
+from enricher import build_security_id_index, lookup_security_id, dhan_exchange_segment
+
+SIZES = [10_000, 50_000]
+LOOKUPS = 2_000
+
+
+def build_cache(size: int) -> Dict[int, InstrumentInfo]:
+    """Build a synthetic NFO option-chain sized instruments cache"""
+    cache = {}
+    for i in range(size):
+        token = 10_000_000 + i
+        cache[token] = InstrumentInfo(
+            instrument_token=token,
+            trading_symbol=f"NIFTY{i}CE",
+            exchange='NSE',
+            instrument_type='CE' if i % 2 else 'PE',
+            security_id=str(35_000 + i),
+            source='dhan'
+        )
+    return cache
+
+
+def linear_lookup(security_id: str, instruments_cache: Dict[int, InstrumentInfo]) -> Optional[int]:
+    """Lookup as previously done in dhan_tick_to_enriched"""
+    for token, info in instruments_cache.items():
+        if info.security_id == security_id:
+            return token
+    return None
+
+
+def run(size: int):
+    cache = build_cache(size)
+    infos = list(cache.values())
+    probes = [random.choice(infos) for _ in range(LOOKUPS)]
+    keys = [(dhan_exchange_segment(info), info.security_id) for info in probes]
+
+    start = time.perf_counter()
+    build_security_id_index(cache)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    for _, security_id in keys:
+        linear_lookup(security_id, cache)
+    linear_us = (time.perf_counter() - start) / LOOKUPS * 1e6
+
+    start = time.perf_counter()
+    for segment, security_id in keys:
+        lookup_security_id(segment, security_id, cache)
+    index_us = (time.perf_counter() - start) / LOOKUPS * 1e6
+
+    # Both lookups must agree
+    for segment, security_id in keys:
+        assert linear_lookup(security_id, cache) == lookup_security_id(segment, security_id, cache)
+
+    print(
+        f"instruments={size:>6} | index build: {build_ms:8.1f} ms | "
+        f"linear: {linear_us:10.2f} us/lookup | index: {index_us:6.3f} us/lookup | "
+        f"speedup: {linear_us / index_us:8.0f}x"
+    )
+
+
+if __name__ == "__main__":
+    random.seed(42)
+    for size in SIZES:
+        run(size)
@@ -0,0 +1,179 @@
+"""
+Benchmark: logging cost on the Dhan hot path
+Replays a peak-load packet stream through decode_packet() (with a share of
+unknown response codes, which log a warning per packet) and publishes one
+batch per INGESTION_BATCH_SIZE packets, comparing:
+
+    legacy   previous setup: uncached loggers, synchronous stdout, one
+             batch_published line per batch, every warning written
+    current  configure_logging(): cached loggers, per-event rate limit,
+             writer thread, batch_published folded into HotPathCounters
+
+Output goes to /dev/null. Reports CPU seconds of the hot thread
+(thread_time) and of the whole process (process_time, includes the writer).
+
+Usage:
+    python bench_logging.py [num_packets]
+"""
+
+import logging
+import os
+import random
+import sys
+import time
+
+import structlog
+
+from bench_dhan_parser import build_mixed_packets, build_packet
+import dhan_parser
+from dhan_parser import decode_packet, RESPONSE_FULL
+import log_config
+from log_config import HotPathCounters, configure_logging, get_logging_stats
+
+UNKNOWN_SHARE = 0.02  # Share of packets with an unknown response code
+BATCH_SIZE = 100  # Small batches: the batcher flushes on its timeout at peak fan-out
+REPEATS = 5
+
+
+def build_stream(count: int) -> list:
+    """Full/OI/prev-close mix with UNKNOWN_SHARE of packets re-stamped with response code 99"""
+    packets = build_mixed_packets(count)
+    for i in random.sample(range(count), int(count * UNKNOWN_SHARE)):
+        packets[i] = bytes([99]) + bytes(packets[i][1:])
+    return packets
+
+
+def configure_legacy(level: int = logging.INFO):
+    """structlog setup as previously done in main.py"""
+    structlog.configure(
+        processors=[
+            structlog.processors.TimeStamper(fmt="iso"),
+            structlog.processors.add_log_level,
+            structlog.processors.StackInfoRenderer(),
+            structlog.dev.set_exc_info,
+            structlog.processors.JSONRenderer()
+        ],
+        wrapper_class=structlog.make_filtering_bound_logger(level),
+        context_class=dict,
+        logger_factory=structlog.PrintLoggerFactory(),
+        cache_logger_on_first_use=False
+    )
+
+
+def run_decode_only(packets: list):
+    for packet in packets:
+        decode_packet(packet)
+
+
+def run_legacy(packets: list):
+    logger = structlog.get_logger()
+    for start in range(0, len(packets), BATCH_SIZE):
+        for packet in packets[start:start + BATCH_SIZE]:
+            decode_packet(packet)
+        logger.info("batch_published", total=BATCH_SIZE, successful=BATCH_SIZE, failed=0)
+
+
+def run_current(packets: list):
+    counters = HotPathCounters("publisher_summary")
+    for start in range(0, len(packets), BATCH_SIZE):
+        for packet in packets[start:start + BATCH_SIZE]:
+            decode_packet(packet)
+        counters.add("batch_published", ticks=BATCH_SIZE, bytes=BATCH_SIZE * 100)
+    counters.flush()
+
+
+def per_call_us(fn, calls: int = 20_000) -> float:
+    """Hot thread cpu microseconds per call"""
+    start = time.thread_time()
+    for _ in range(calls):
+        fn()
+    return (time.thread_time() - start) / calls * 1e6
+
+
+def measure_calls():
+    """Per-call cost of the two hot-path events under each setup"""
+    configure_legacy()
+    logger = structlog.get_logger()
+    legacy_warning = per_call_us(lambda: logger.warning("unknown_response_code", code=99, length=162))
+    legacy_batch = per_call_us(
+        lambda: logger.info("batch_published", total=BATCH_SIZE, successful=BATCH_SIZE, failed=0)
+    )
+    
+    configure_logging("INFO")
+    logger = structlog.get_logger()
+    counters = HotPathCounters("publisher_summary")
+    current_warning = per_call_us(lambda: logger.warning("unknown_response_code", code=99, length=162))
+    current_batch = per_call_us(lambda: counters.add("batch_published", ticks=BATCH_SIZE, bytes=BATCH_SIZE * 100))
+    
+    print(
+        f"per call  unknown_response_code: legacy {legacy_warning:5.2f} us, current {current_warning:5.2f} us | "
+        f"batch_published: legacy {legacy_batch:5.2f} us, current {current_batch:5.2f} us",
+        file=sys.__stdout__
+    )
+
+
+def measure(fn, packets: list) -> tuple:
+    """(hot thread cpu, process cpu, wall) seconds for one run"""
+    # Fresh module logger, as a process start would get under the active configuration
+    dhan_parser.logger = structlog.get_logger()
+    
+    process_start = time.process_time()
+    thread_start = time.thread_time()
+    wall_start = time.perf_counter()
+    fn(packets)
+    thread_cpu = time.thread_time() - thread_start
+    wall = time.perf_counter() - wall_start
+    
+    # Let the writer thread drain so its CPU is charged to this run
+    if log_config._writer is not None:
+        while log_config._writer._queue.qsize():
+            time.sleep(0.01)
+    process_cpu = time.process_time() - process_start
+    return thread_cpu, process_cpu, wall
+
+
+def report(name: str, runs: list, packets: list) -> float:
+    """Print the best of REPEATS runs; returns its hot thread cpu"""
+    thread_cpu, process_cpu, wall = min(runs)
+    print(
+        f"{name:<8} hot thread: {thread_cpu:6.3f} s cpu | process: {process_cpu:6.3f} s cpu | "
+        f"{len(packets) / wall:>10,.0f} packets/sec",
+        file=sys.__stdout__
+    )
+    return thread_cpu
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    random.seed(42)
+    
+    packets = build_stream(count)
+    sys.stdout = open(os.devnull, 'w')
+    
+    # Decoding alone, every log call filtered out (first pass warms up)
+    configure_legacy(logging.CRITICAL)
+    assert decode_packet(build_packet(RESPONSE_FULL)) is not None
+    assert decode_packet(bytes([99]) + bytes(packets[0][1:])) is None
+    run_decode_only(packets)
+    
+    # Runs are interleaved so machine noise hits all three alike
+    runs = {'decode': [], 'legacy': [], 'current': []}
+    for _ in range(REPEATS):
+        configure_legacy(logging.CRITICAL)
+        runs['decode'].append(measure(run_decode_only, packets))
+        configure_legacy()
+        runs['legacy'].append(measure(run_legacy, packets))
+        configure_logging("INFO")
+        runs['current'].append(measure(run_current, packets))
+    
+    baseline = report("decode", runs['decode'], packets)
+    legacy = report("legacy", runs['legacy'], packets)
+    current = report("current", runs['current'], packets)
+    
+    print(
+        f"logging overhead on the hot thread: legacy {legacy - baseline:6.3f} s, "
+        f"current {current - baseline:6.3f} s | {get_logging_stats()}",
+        file=sys.__stdout__
+    )
+    
+    measure_calls()
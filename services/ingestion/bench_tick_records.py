@@ -0,0 +1,202 @@
+"""
+Parity check + benchmark: slots TickRecord vs pydantic models on the hot path
+Checks kite_tick_to_record()/dhan_tick_to_record() produce the same wire dicts
+as the pydantic path (KiteTick + enrich_tick, DhanTick + dhan_tick_to_enriched),
+then measures throughput and memory per tick with tracemalloc
+
+Usage:
+    python bench_tick_records.py
+"""
+
+import random
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from bench_dhan_parser import build_packet
+from dhan_parser import decode_packet, RESPONSE_QUOTE, RESPONSE_FULL, RESPONSE_PREV_CLOSE
+from enricher import enrich_tick, kite_tick_to_record, dhan_tick_to_enriched, dhan_tick_to_record
+from models import KiteTick, MarketDepth, MarketDepthItem, DhanTick, InstrumentInfo
+from validator import validate_tick, validate_raw_tick
+
+NUM_TICKS = 50_000
+NUM_INSTRUMENTS = 2_000
+
+
+def build_cache():
+    cache = {}
+    for i in range(NUM_INSTRUMENTS):
+        token = 10_000_000 + i
+        cache[token] = InstrumentInfo(
+            instrument_token=token,
+            trading_symbol=f"NIFTY{i}CE",
+            exchange='NSE',
+            instrument_type='CE',
+            security_id=str(35_000 + i),
+            source='dhan'
+        )
+    return cache
+
+
+def build_kite_ticks(count: int):
+    """Full-mode tick dicts shaped like KiteTicker output"""
+    base = datetime(2026, 1, 5, 4, 0, 0)
+    ticks = []
+    for n in range(count):
+        price = round(random.uniform(50, 500), 2)
+        ts = base + timedelta(milliseconds=n * 10)
+        ticks.append({
+            'tradable': True,
+            'mode': 'full',
+            'instrument_token': 10_000_000 + random.randint(0, NUM_INSTRUMENTS + 20),
+            'last_price': price,
+            'last_traded_quantity': random.randint(1, 500),
+            'average_traded_price': round(price * 0.99, 2),
+            'volume_traded': random.randint(0, 10_000_000),
+            'total_buy_quantity': random.randint(0, 100_000),
+            'total_sell_quantity': random.randint(0, 100_000),
+            'ohlc': {'open': price, 'high': price + 5, 'low': price - 5, 'close': price - 1},
+            'change': round(random.uniform(-5, 5), 2),
+            'last_trade_time': ts,
+            'oi': random.randint(0, 1_000_000),
+            'oi_day_high': 1_000_000,
+            'oi_day_low': 0,
+            'exchange_timestamp': ts,
+            'depth': {
+                'buy': [
+                    {'quantity': random.randint(0, 900), 'price': round(price - 0.05 * (i + 1), 2), 'orders': random.randint(0, 9)}
+                    for i in range(5)
+                ],
+                'sell': [
+                    {'quantity': random.randint(0, 900), 'price': round(price + 0.05 * (i + 1), 2), 'orders': random.randint(0, 9)}
+                    for i in range(5)
+                ]
+            }
+        })
+    return ticks
+
+
+def build_dhan_ticks(count: int):
+    """Decoded quote/full/prev-close packets, a few with unknown security_ids"""
+    codes = [RESPONSE_FULL] * 6 + [RESPONSE_QUOTE] * 3 + [RESPONSE_PREV_CLOSE]
+    return [
+        decode_packet(build_packet(random.choice(codes), security_id=35_000 + random.randint(0, NUM_INSTRUMENTS + 20)))
+        for _ in range(count)
+    ]
+
+
+def kite_pydantic_path(ticks, cache):
+    """Previous KiteWebSocketHandler.on_ticks body"""
+    out = []
+    for raw in ticks:
+        depth = None
+        if raw.get('depth'):
+            depth = MarketDepth(
+                buy=[MarketDepthItem(quantity=d.get('quantity', 0), price=d.get('price', 0.0), orders=d.get('orders', 0)) for d in raw['depth'].get('buy', [])],
+                sell=[MarketDepthItem(quantity=d.get('quantity', 0), price=d.get('price', 0.0), orders=d.get('orders', 0)) for d in raw['depth'].get('sell', [])]
+            )
+        tick = KiteTick(
+            tradable=raw.get('tradable', True),
+            mode=raw.get('mode', 'quote'),
+            instrument_token=raw['instrument_token'],
+            last_price=raw.get('last_price'),
+            last_traded_quantity=raw.get('last_traded_quantity'),
+            average_traded_price=raw.get('average_traded_price'),
+            volume_traded=raw.get('volume_traded'),
+            total_buy_quantity=raw.get('total_buy_quantity'),
+            total_sell_quantity=raw.get('total_sell_quantity'),
+            ohlc=raw.get('ohlc'),
+            change=raw.get('change'),
+            last_trade_time=raw.get('last_trade_time'),
+            timestamp=raw.get('timestamp') or raw.get('exchange_timestamp'),
+            oi=raw.get('oi'),
+            oi_day_high=raw.get('oi_day_high'),
+            oi_day_low=raw.get('oi_day_low'),
+            depth=depth
+        )
+        if validate_tick(tick):
+            out.append(enrich_tick(tick, cache))
+    return out
+
+
+def kite_record_path(ticks, cache):
+    return [kite_tick_to_record(raw, cache) for raw in ticks if validate_raw_tick(raw)]
+
+
+def dhan_pydantic_path(decoded, cache):
+    out = []
+    for tick_data in decoded:
+        enriched = dhan_tick_to_enriched(DhanTick(**tick_data), cache)
+        if enriched:
+            out.append(enriched)
+    return out
+
+
+def dhan_record_path(decoded, cache):
+    out = []
+    for tick_data in decoded:
+        record = dhan_tick_to_record(tick_data, cache)
+        if record:
+            out.append(record)
+    return out
+
+
+def check_parity(name, expected, actual):
+    assert len(expected) == len(actual), (len(expected), len(actual))
+    for exp, act in zip(expected, actual):
+        exp, act = exp.to_dict(), act.to_dict()
+        if exp['last_trade_time'] is None:
+            # No exchange time - both fall back to wall clock
+            exp = {**exp, 'time': None}
+            act = {**act, 'time': None}
+        assert exp == act, (exp, act)
+        assert list(exp) == list(act)
+    print(f"parity ({name}): {len(expected)} wire dicts identical")
+
+
+def measure(fn, *args):
+    """Return (seconds, peak bytes held while building and retaining the output)"""
+    start = time.perf_counter()
+    fn(*args)
+    elapsed = time.perf_counter() - start
+    
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    result = fn(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return elapsed, peak
+
+
+def report(name, pydantic_fn, record_fn, inputs, cache):
+    count = len(inputs)
+    p_time, p_peak = measure(pydantic_fn, inputs, cache)
+    r_time, r_peak = measure(record_fn, inputs, cache)
+    # Wire encoding included, as on the publish path
+    p_wire = measure(lambda i, c: [t.to_dict() for t in pydantic_fn(i, c)], inputs, cache)[0]
+    r_wire = measure(lambda i, c: [t.to_dict() for t in record_fn(i, c)], inputs, cache)[0]
+    print(
+        f"{name:>5} | {'pydantic':>9} | {count / p_time:>10,.0f} | {count / p_wire:>10,.0f} | {p_peak / count:>8,.0f} B\n"
+        f"{'':>5} | {'record':>9} | {count / r_time:>10,.0f} | {count / r_wire:>10,.0f} | {r_peak / count:>8,.0f} B\n"
+        f"{'':>5} | {'speedup':>9} | {p_time / r_time:>9.1f}x | {p_wire / r_wire:>9.1f}x | {p_peak / r_peak:>7.1f}x less"
+    )
+
+
+if __name__ == "__main__":
+    import logging
+    import structlog
+    structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(logging.ERROR))
+    
+    random.seed(7)
+    cache = build_cache()
+    kite_ticks = build_kite_ticks(NUM_TICKS)
+    decoded = build_dhan_ticks(NUM_TICKS)
+    
+    check_parity("kite", kite_pydantic_path(kite_ticks, cache), kite_record_path(kite_ticks, cache))
+    check_parity("dhan", dhan_pydantic_path(decoded, cache), dhan_record_path(decoded, cache))
+    
+    print(f"{'feed':>5} | {'path':>9} | {'ticks/s':>10} | {'+to_dict':>10} | {'mem/tick':>10}")
+    report("kite", kite_pydantic_path, kite_record_path, kite_ticks, cache)
+    report("dhan", dhan_pydantic_path, dhan_record_path, decoded, cache)
+    print("(mem/tick = tracemalloc peak while building and holding the enriched ticks)")
@@ -0,0 +1,67 @@
+"""
+Round-trip check + benchmark: columnar binary vs JSON tick batches
+Checks decode_batch(encode_batch(ticks)) == json.loads(json.dumps(ticks)),
+then reports bytes per tick and encode/decode microseconds per tick
+
+Usage:
+    python bench_tick_wire.py
+"""
+
+import json
+import random
+import time
+
+from bench_tick_records import build_cache, build_kite_ticks, build_dhan_ticks, kite_record_path, dhan_record_path
+from tick_wire import encode_batch, decode_batch, decode_body, content_type_for
+
+BATCH_SIZES = [100, 500, 2_000]
+ROUNDS = 20
+
+
+def build_batches(cache):
+    """Enriched wire dicts from both feeds (Kite full mode, Dhan quote/full)"""
+    kite = [r.to_dict() for r in kite_record_path(build_kite_ticks(5_000), cache)]
+    dhan = [r.to_dict() for r in dhan_record_path(build_dhan_ticks(5_000), cache)]
+    return {'kite': kite, 'dhan': dhan}
+
+
+def check_round_trip(ticks):
+    expected = json.loads(json.dumps(ticks))
+    actual = decode_body(encode_batch(ticks), content_type_for(binary=True))
+    assert actual == expected
+    assert [list(t) for t in actual] == [list(t) for t in expected]
+    assert json.dumps(actual) == json.dumps(expected)
+
+
+def per_tick_us(fn, arg, count: int) -> float:
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        fn(arg)
+    return (time.perf_counter() - start) / ROUNDS / count * 1e6
+
+
+if __name__ == "__main__":
+    import logging
+    import structlog
+    structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(logging.ERROR))
+    
+    random.seed(5)
+    batches = build_batches(build_cache())
+    
+    for feed, ticks in batches.items():
+        for size in BATCH_SIZES:
+            check_round_trip(ticks[:size])
+    print("round trip: binary batches decode to the same dicts as JSON")
+    
+    print(f"{'feed':>5} | {'batch':>6} | {'json B/tick':>11} | {'bin B/tick':>10} | "
+          f"{'json enc':>8} | {'bin enc':>8} | {'json dec':>8} | {'bin dec':>8}")
+    for feed, ticks in batches.items():
+        for size in BATCH_SIZES:
+            batch = ticks[:size]
+            json_body = json.dumps(batch).encode('utf-8')
+            binary_body = encode_batch(batch)
+            print(
+                f"{feed:>5} | {size:>6} | {len(json_body) / size:>11.0f} | {len(binary_body) / size:>10.0f} | "
+                f"{per_tick_us(json.dumps, batch, size):>6.2f}us | {per_tick_us(encode_batch, batch, size):>6.2f}us | "
+                f"{per_tick_us(json.loads, json_body, size):>6.2f}us | {per_tick_us(decode_batch, binary_body, size):>6.2f}us"
+            )
@@ -0,0 +1,206 @@
+"""
+Backlog Conflation
+Opt-in stage in front of RabbitMQPublisher.publish_batch that kicks in when
+the broker queue backs up, keeping only the latest tick per instrument per
+interval until the backlog drains
+
+Enabled with INGESTION_CONFLATION_ENABLED=true
+"""
+
+import os
+import time
+import structlog
+from typing import Dict, List, Any, Optional
+
+from publisher import RabbitMQPublisher
+
+logger = structlog.get_logger()
+
+# Fields where an older tick's value is kept when the latest tick lacks one
+CARRY_FORWARD_FIELDS = (
+    'oi', 'oi_day_high', 'oi_day_low',
+    'day_open', 'day_close',
+    'average_traded_price',
+    'total_buy_quantity', 'total_sell_quantity'
+)
+
+
+class TickConflator:
+    """
+    Conflates enriched tick dicts per instrument_token while the queue is backed up
+    
+    Enters conflation when get_queue_depth() reaches INGESTION_CONFLATION_THRESHOLD and
+    leaves it once depth falls to INGESTION_CONFLATION_RESUME_DEPTH. While active,
+    process() folds ticks into one pending tick per instrument and releases
+    them once per INGESTION_CONFLATION_INTERVAL.
+    
+    Cumulative fields stay correct on the surviving tick: volume_traded and
+    day_high take the max, day_low the min, and OI/OHLC/book totals missing
+    from the latest tick are carried forward from the older ones.
+    
+    Must be called from the thread that publishes (get_queue_depth() uses the
+    publisher's channel).
+    """
+    
+    ENABLED = os.getenv("INGESTION_CONFLATION_ENABLED", "false").lower() == "true"
+    THRESHOLD = int(os.getenv("INGESTION_CONFLATION_THRESHOLD", 100000))  # Queue messages
+    RESUME_DEPTH = int(os.getenv("INGESTION_CONFLATION_RESUME_DEPTH", 0))  # 0 = THRESHOLD / 2
+    INTERVAL = float(os.getenv("INGESTION_CONFLATION_INTERVAL", 1.0))  # Seconds per conflated release
+    CHECK_INTERVAL = float(os.getenv("INGESTION_CONFLATION_CHECK_INTERVAL", 5.0))  # Seconds between depth checks
+    
+    def __init__(
+        self,
+        publisher: RabbitMQPublisher,
+        threshold: Optional[int] = None,
+        resume_depth: Optional[int] = None,
+        interval: Optional[float] = None,
+        check_interval: Optional[float] = None
+    ):
+        """
+        Initialize conflator
+        
+        Args:
+            publisher: RabbitMQ publisher (for queue depth checks)
+            threshold: Override for INGESTION_CONFLATION_THRESHOLD
+            resume_depth: Override for INGESTION_CONFLATION_RESUME_DEPTH
+            interval: Override for INGESTION_CONFLATION_INTERVAL (seconds)
+            check_interval: Override for INGESTION_CONFLATION_CHECK_INTERVAL (seconds)
+        """
+        self.publisher = publisher
+        self.threshold = threshold or self.THRESHOLD
+        self.resume_depth = resume_depth or self.RESUME_DEPTH or self.threshold // 2
+        self.interval = interval or self.INTERVAL
+        self.check_interval = check_interval or self.CHECK_INTERVAL
+        
+        self.active = False
+        self._pending: Dict[int, Dict[str, Any]] = {}
+        self._last_release_time = time.time()
+        self._last_check_time = 0.0
+        
+        # Statistics
+        self.last_queue_depth = 0
+        self.ticks_in = 0
+        self.ticks_conflated = 0
+        self.episodes = 0
+        self.active_since: Optional[float] = None
+        self.total_active_seconds = 0.0
+    
+    @property
+    def pending(self) -> int:
+        """Number of instruments with a held tick"""
+        return len(self._pending)
+    
+    def _check_backlog(self):
+        """Poll queue depth (rate limited) and switch conflation on/off"""
+        now = time.time()
+        if now - self._last_check_time < self.check_interval:
+            return
+        self._last_check_time = now
+        
+        depth = self.publisher.get_queue_depth()
+        if depth < 0:
+            # Depth unknown - keep the current mode
+            return
+        self.last_queue_depth = depth
+        
+        if not self.active and depth >= self.threshold:
+            self.active = True
+            self.episodes += 1
+            self.active_since = now
+            self._last_release_time = now
+            logger.warning(
+                "conflation_started",
+                queue_depth=depth,
+                threshold=self.threshold,
+                interval=self.interval
+            )
+        
+        elif self.active and depth <= self.resume_depth:
+            self.active = False
+            self.total_active_seconds += now - self.active_since
+            logger.info(
+                "conflation_stopped",
+                queue_depth=depth,
+                resume_depth=self.resume_depth,
+                duration_seconds=round(now - self.active_since, 1),
+                ticks_conflated=self.ticks_conflated
+            )
+            self.active_since = None
+    
+    def process(self, ticks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Pass ticks through, or conflate them while the backlog is high
+        
+        Args:
+            ticks: Enriched tick dicts about to be published
+        
+        Returns:
+            Ticks to publish now (may be empty while conflating)
+        """
+        self.ticks_in += len(ticks)
+        self._check_backlog()
+        
+        if not self.active:
+            if self._pending:
+                # Just left conflation - release held ticks ahead of new ones
+                return self.drain() + ticks
+            return ticks
+        
+        for tick in ticks:
+            self._fold(tick)
+        
+        if time.time() - self._last_release_time >= self.interval:
+            return self.drain()
+        return []
+    
+    def _fold(self, tick: Dict[str, Any]):
+        """Replace the held tick for the instrument, keeping cumulative fields correct"""
+        token = tick.get('instrument_token')
+        held = self._pending.pop(token, None)
+        
+        if held is not None:
+            self.ticks_conflated += 1
+            
+            for field in CARRY_FORWARD_FIELDS:
+                if tick.get(field) is None and held.get(field) is not None:
+                    tick[field] = held[field]
+            
+            if held.get('volume_traded') is not None and (tick.get('volume_traded') or 0) < held['volume_traded']:
+                tick['volume_traded'] = held['volume_traded']
+            if held.get('day_high') is not None and (tick.get('day_high') is None or tick['day_high'] < held['day_high']):
+                tick['day_high'] = held['day_high']
+            if held.get('day_low') is not None and (tick.get('day_low') is None or tick['day_low'] > held['day_low']):
+                tick['day_low'] = held['day_low']
+        
+        # Re-insert so release order follows the latest update
+        self._pending[token] = tick
+    
+    def drain(self) -> List[Dict[str, Any]]:
+        """
+        Release all held ticks (interval elapsed, conflation ended, or shutdown)
+        
+        Returns:
+            Latest tick per instrument
+        """
+        ticks = list(self._pending.values())
+        self._pending = {}
+        self._last_release_time = time.time()
+        return ticks
+    
+    def get_stats(self) -> Dict:
+        """Get conflation statistics"""
+        active_seconds = self.total_active_seconds
+        if self.active_since is not None:
+            active_seconds += time.time() - self.active_since
+        
+        return {
+            'conflation_active': self.active,
+            'conflation_queue_depth': self.last_queue_depth,
+            'conflation_threshold': self.threshold,
+            'conflation_resume_depth': self.resume_depth,
+            'conflation_pending': len(self._pending),
+            'conflation_ticks_in': self.ticks_in,
+            'conflation_ticks_conflated': self.ticks_conflated,
+            'conflation_episodes': self.episodes,
+            'conflation_active_seconds': round(active_seconds, 1)
+        }
@@ -0,0 +1,261 @@
+"""
+Dhan Columnar Decoder (NumPy)
+Decodes bursts of RESPONSE_FULL packets with a single np.frombuffer call into
+a structured array mirroring the 162-byte layout, then enriches whole columns
+instead of building a dict + pydantic model per packet
+
+Enabled with DHAN_DECODE_MODE=numpy (default "dict" uses dhan_parser.decode_packet)
+Output records match dhan_tick_to_enriched(...).to_dict() field for field
+(given the same InstrumentStateStore merge on both paths)
+"""
+
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+import structlog
+
+from dhan_parser import IST, EXCHANGE_SEGMENTS, RESPONSE_FULL, PACKET_SIZES
+from enricher import lookup_security_ids
+from records import InstrumentRecord
+
+logger = structlog.get_logger()
+
+# One market depth level (20 bytes)
+DEPTH_LEVEL_DTYPE = np.dtype([
+    ('bid_quantity', '<i4'),
+    ('ask_quantity', '<i4'),
+    ('bid_orders', '<i2'),
+    ('ask_orders', '<i2'),
+    ('bid_price', '<f4'),
+    ('ask_price', '<f4'),
+])
+
+# Full packet (Response Code 8) - 162 bytes, packed, Little Endian
+FULL_PACKET_DTYPE = np.dtype([
+    # Header (8 bytes)
+    ('response_code', 'u1'),
+    ('message_length', '<i2'),
+    ('exchange_segment', 'u1'),
+    ('security_id', '<i4'),
+    # Trade data
+    ('last_price', '<f4'),
+    ('last_traded_quantity', '<i2'),
+    ('last_trade_time', '<i4'),
+    ('average_traded_price', '<f4'),
+    ('volume_traded', '<i4'),
+    ('total_sell_quantity', '<i4'),
+    ('total_buy_quantity', '<i4'),
+    # Open interest
+    ('oi', '<i4'),
+    ('oi_day_high', '<i4'),
+    ('oi_day_low', '<i4'),
+    # OHLC
+    ('day_open', '<f4'),
+    ('day_close', '<f4'),
+    ('day_high', '<f4'),
+    ('day_low', '<f4'),
+    # Market depth (5 x 20 bytes)
+    ('depth', DEPTH_LEVEL_DTYPE, (5,)),
+])
+
+assert FULL_PACKET_DTYPE.itemsize == PACKET_SIZES[RESPONSE_FULL]
+
+FULL_PACKET_SIZE = FULL_PACKET_DTYPE.itemsize
+
+
+def is_full_packet(packet) -> bool:
+    """Check if a split packet can go through the columnar decoder"""
+    return len(packet) == FULL_PACKET_SIZE and packet[0] == RESPONSE_FULL
+
+
+def decode_full_batch(packets: List) -> np.ndarray:
+    """
+    Decode a burst of full packets into one structured array
+
+    Args:
+        packets: Full packets (bytes or memoryview), each exactly 162 bytes
+
+    Returns:
+        Structured array with FULL_PACKET_DTYPE, one row per packet
+    """
+    if not packets:
+        return np.empty(0, dtype=FULL_PACKET_DTYPE)
+
+    return np.frombuffer(b''.join(packets), dtype=FULL_PACKET_DTYPE, count=len(packets))
+
+
+def _positive_or_none(column: np.ndarray, decimals: Optional[int] = None) -> np.ndarray:
+    """
+    Vectorized "value if value > 0 else None" (with optional rounding)
+
+    float32 * 10**decimals is exact in float64, so np.round here gives the
+    same result as Python's round() on the unpacked value.
+    """
+    values = column.astype(np.float64) if decimals is not None else column.astype(np.int64)
+    if decimals is not None:
+        values = np.round(values, decimals)
+    return np.where(column > 0, values.astype(object), None)
+
+
+def enrich_full_batch(
+    batch: np.ndarray,
+    instruments_cache: Dict[int, InstrumentRecord],
+    state: Optional[Dict[str, List]] = None
+) -> List[Dict]:
+    """
+    Enrich a decoded full-packet batch column by column
+
+    Rows whose (exchange_segment, security_id) is not in the instruments
+    index are dropped, as in dhan_tick_to_enriched().
+
+    Args:
+        batch: Structured array from decode_full_batch()
+        instruments_cache: Dict mapping instrument_token to InstrumentRecord
+        state: Per-row 'prev_close' and OI columns from
+            InstrumentStateStore.merge_full_batch() (optional)
+
+    Returns:
+        List of enriched tick dicts in EnrichedTick.to_dict() format
+    """
+    if len(batch) == 0:
+        return []
+
+    # Resolve instruments for the whole batch
+    tokens = lookup_security_ids(
+        batch['exchange_segment'].tolist(),
+        batch['security_id'].tolist(),
+        instruments_cache
+    )
+    keep = np.fromiter((t is not None for t in tokens), dtype=bool, count=len(tokens))
+
+    if not keep.all():
+        missing = batch[~keep]
+        logger.warning(
+            "security_ids_not_found",
+            count=int((~keep).sum()),
+            sample=[
+                (EXCHANGE_SEGMENTS.get(seg, 'UNKNOWN'), str(sec))
+                for seg, sec in zip(missing['exchange_segment'][:5].tolist(), missing['security_id'][:5].tolist())
+            ]
+        )
+        batch = batch[keep]
+        tokens = [t for t in tokens if t is not None]
+        if state is not None:
+            keep_rows = keep.tolist()
+            state = {
+                field: [value for value, ok in zip(column, keep_rows) if ok]
+                for field, column in state.items()
+            }
+        if len(batch) == 0:
+            return []
+
+    # Timestamps - convert each distinct epoch once
+    epochs = batch['last_trade_time']
+    unique_epochs, inverse = np.unique(epochs, return_inverse=True)
+    unique_ltt = [
+        datetime.fromtimestamp(epoch, tz=IST).isoformat() if epoch > 0 else None
+        for epoch in unique_epochs.tolist()
+    ]
+    last_trade_times = [unique_ltt[i] for i in inverse.tolist()]
+    now_iso = datetime.now(IST).isoformat()
+    times = [ltt or now_iso for ltt in last_trade_times]
+
+    # Scalar columns
+    last_price = _positive_or_none(batch['last_price'], 2).tolist()
+    last_traded_quantity = _positive_or_none(batch['last_traded_quantity']).tolist()
+    average_traded_price = _positive_or_none(batch['average_traded_price'], 2).tolist()
+    volume_traded = _positive_or_none(batch['volume_traded']).tolist()
+    total_sell_quantity = _positive_or_none(batch['total_sell_quantity']).tolist()
+    total_buy_quantity = _positive_or_none(batch['total_buy_quantity']).tolist()
+    if state is not None:
+        # OI already merged with the last known state
+        oi = state['oi']
+        oi_day_high = state['oi_day_high']
+        oi_day_low = state['oi_day_low']
+    else:
+        oi = _positive_or_none(batch['oi']).tolist()
+        oi_day_high = _positive_or_none(batch['oi_day_high']).tolist()
+        oi_day_low = _positive_or_none(batch['oi_day_low']).tolist()
+    day_open = _positive_or_none(batch['day_open'], 2).tolist()
+    day_close = _positive_or_none(batch['day_close'], 2).tolist()
+    day_high = _positive_or_none(batch['day_high'], 2).tolist()
+    day_low = _positive_or_none(batch['day_low'], 2).tolist()
+
+    # Depth columns (n x 5)
+    depth = batch['depth']
+    bid_prices = _positive_or_none(depth['bid_price'], 2).tolist()
+    bid_quantities = _positive_or_none(depth['bid_quantity']).tolist()
+    bid_orders = _positive_or_none(depth['bid_orders']).tolist()
+    ask_prices = _positive_or_none(depth['ask_price'], 2).tolist()
+    ask_quantities = _positive_or_none(depth['ask_quantity']).tolist()
+    ask_orders = _positive_or_none(depth['ask_orders']).tolist()
+
+    # Derived fields - rows with a two-sided top of book
+    best_bid = np.round(depth['bid_price'][:, 0].astype(np.float64), 2)
+    best_ask = np.round(depth['ask_price'][:, 0].astype(np.float64), 2)
+    two_sided = ((depth['bid_price'][:, 0] > 0) & (depth['ask_price'][:, 0] > 0)).tolist()
+    bid_ask_spread = [
+        round(ask - bid, 2) if ok else None
+        for ask, bid, ok in zip(best_ask.tolist(), best_bid.tolist(), two_sided)
+    ]
+    mid_price = [
+        round((bid + ask) / 2, 2) if ok else None
+        for ask, bid, ok in zip(best_ask.tolist(), best_bid.tolist(), two_sided)
+    ]
+
+    # Change from the last known prev_close (full packets carry none)
+    change = [None] * len(tokens)
+    change_percent = [None] * len(tokens)
+    if state is not None:
+        for i, (price, prev_close) in enumerate(zip(last_price, state['prev_close'])):
+            if price and prev_close and prev_close > 0:
+                change[i] = round(price - prev_close, 2)
+                change_percent[i] = round((change[i] / prev_close) * 100, 4)
+
+    buy = batch['total_buy_quantity'].astype(np.int64)
+    sell = batch['total_sell_quantity'].astype(np.int64)
+    order_imbalance = np.where((buy > 0) & (sell > 0), (buy - sell).astype(object), None).tolist()
+
+    # Instrument metadata
+    infos = [instruments_cache.get(token) for token in tokens]
+
+    records = []
+    for i, token in enumerate(tokens):
+        info = infos[i]
+        records.append({
+            'time': times[i],
+            'last_trade_time': last_trade_times[i],
+            'instrument_token': token,
+            'trading_symbol': info.trading_symbol if info else None,
+            'exchange': info.exchange if info else None,
+            'instrument_type': info.instrument_type if info else None,
+            'last_price': last_price[i],
+            'last_traded_quantity': last_traded_quantity[i],
+            'average_traded_price': average_traded_price[i],
+            'volume_traded': volume_traded[i],
+            'oi': oi[i],
+            'oi_day_high': oi_day_high[i],
+            'oi_day_low': oi_day_low[i],
+            'day_open': day_open[i],
+            'day_high': day_high[i],
+            'day_low': day_low[i],
+            'day_close': day_close[i],
+            'change': change[i],
+            'change_percent': change_percent[i],
+            'total_buy_quantity': total_buy_quantity[i],
+            'total_sell_quantity': total_sell_quantity[i],
+            'bid_prices': bid_prices[i],
+            'bid_quantities': bid_quantities[i],
+            'bid_orders': bid_orders[i],
+            'ask_prices': ask_prices[i],
+            'ask_quantities': ask_quantities[i],
+            'ask_orders': ask_orders[i],
+            'tradable': True,
+            'mode': 'full',
+            'bid_ask_spread': bid_ask_spread[i],
+            'mid_price': mid_price[i],
+            'order_imbalance': order_imbalance[i]
+        })
+
+    return records
@@ -20,11 +20,11 @@ IST = ZoneInfo('Asia/Kolkata')
 # Feed Response Codes (from Annexure)
 RESPONSE_INDEX = 1           # Index Packet
 RESPONSE_TICKER = 2          # LTP + LTT (16 bytes)
-RESPONSE_QUOTE = 4           # Complete quote data (51 bytes)
+RESPONSE_QUOTE = 4           # Complete quote data (50 bytes)
 RESPONSE_OI = 5              # Open Interest (12 bytes)
 RESPONSE_PREV_CLOSE = 6      # Previous close (16 bytes)
 RESPONSE_MARKET_STATUS = 7   # Market Status Packet
-RESPONSE_FULL = 8            # Full packet with depth (163 bytes)
+RESPONSE_FULL = 8            # Full packet with depth (162 bytes)
 RESPONSE_DISCONNECT = 50     # Disconnection packet
 
 # Exchange Segment Enum (from Annexure)
@@ -143,7 +143,7 @@ def parse_ticker_packet(data: bytes) -> Optional[Dict]:
 
 def parse_quote_packet(data: bytes) -> Optional[Dict]:
     """
-    Parse Quote Packet (Response Code 4) - 51 bytes
+    Parse Quote Packet (Response Code 4) - 50 bytes
     
     Structure after header (bytes 9-50):
     - 9-12: Last Traded Price (float32)
@@ -158,7 +158,7 @@ def parse_quote_packet(data: bytes) -> Optional[Dict]:
     - 43-46: Day High (float32)
     - 47-50: Day Low (float32)
     """
-    if len(data) < 51:
+    if len(data) < 50:
         return None
     
     try:
@@ -288,7 +288,7 @@ def parse_market_depth_level(data: bytes, offset: int) -> Dict:
 
 def parse_full_packet(data: bytes) -> Optional[Dict]:
     """
-    Parse Full Packet (Response Code 8) - 163 bytes
+    Parse Full Packet (Response Code 8) - 162 bytes
     
     Complete trade data + 5 levels of market depth
     
@@ -310,7 +310,7 @@ def parse_full_packet(data: bytes) -> Optional[Dict]:
     - 59-62: Day Low (float32) - bytes 59-62
     - 63-162: Market Depth (5 levels × 20 bytes = 100 bytes)
     """
-    if len(data) < 163:
+    if len(data) < 162:
         return None
     
     try:
@@ -398,6 +398,9 @@ def parse_packet(data: bytes) -> Optional[Dict]:
     """
     Main packet parser - routes to appropriate parser based on response code
     
+    Per-field reference implementation; the WebSocket hot path uses
+    decode_packet(), which must produce identical output.
+    
     Args:
         data: Binary packet data
     
@@ -442,3 +445,250 @@ def parse_packet(data: bytes) -> Optional[Dict]:
     else:
         logger.warning("unknown_response_code", code=response_code, length=len(data))
         return None
+
+
+# ============================================================================
+# PRECOMPILED DECODER (hot path)
+# ============================================================================
+# One struct.Struct per packet layout, unpacked straight from the receive
+# buffer with unpack_from() - no per-field unpack and no byte slicing.
+# decode_packet() output matches parse_packet() exactly.
+
+HEADER_STRUCT = struct.Struct('<BhBi')              # 8 bytes
+INDEX_STRUCT = struct.Struct('<fi')                 # bytes 9-16
+TICKER_STRUCT = struct.Struct('<fi')                # bytes 9-16
+QUOTE_STRUCT = struct.Struct('<fhifiiiffff')        # bytes 9-50
+OI_STRUCT = struct.Struct('<i')                     # bytes 9-12
+PREV_CLOSE_STRUCT = struct.Struct('<fi')            # bytes 9-16
+FULL_STRUCT = struct.Struct('<fhifiiiiiiffff')      # bytes 9-62
+DEPTH_STRUCT = struct.Struct('<' + 'iihhff' * 5)    # bytes 63-162 (5 x 20)
+DISCONNECT_STRUCT = struct.Struct('<h')             # bytes 9-10
+
+HEADER_SIZE = HEADER_STRUCT.size
+DEPTH_OFFSET = HEADER_SIZE + FULL_STRUCT.size       # 62
+
+
+def _decode_header(response_code: int, message_length: int, segment: int, security_id: int) -> Dict:
+    """Build header dict from already-unpacked header fields"""
+    return {
+        'response_code': response_code,
+        'message_length': message_length,
+        'exchange_segment': EXCHANGE_SEGMENTS.get(segment, 'UNKNOWN'),
+        'exchange_segment_code': segment,
+        'security_id': str(security_id)
+    }
+
+
+def _decode_index(buf, header: Dict) -> Optional[Dict]:
+    if len(buf) < 16:
+        return None
+    index_value, epoch = INDEX_STRUCT.unpack_from(buf, HEADER_SIZE)
+    header['index_value'] = round(index_value, 2) if index_value > 0 else None
+    header['index_time'] = datetime.fromtimestamp(epoch, tz=IST) if epoch > 0 else None
+    header['packet_type'] = 'index'
+    return header
+
+
+def _decode_ticker(buf, header: Dict) -> Optional[Dict]:
+    if len(buf) < 16:
+        return None
+    ltp, epoch = TICKER_STRUCT.unpack_from(buf, HEADER_SIZE)
+    header['last_price'] = round(ltp, 2) if ltp > 0 else None
+    header['last_trade_time'] = datetime.fromtimestamp(epoch, tz=IST) if epoch > 0 else None
+    header['packet_type'] = 'ticker'
+    return header
+
+
+def _decode_quote(buf, header: Dict) -> Optional[Dict]:
+    if len(buf) < 50:
+        return None
+    (ltp, ltq, epoch, atp, volume, sell_qty, buy_qty,
+     day_open, day_close, day_high, day_low) = QUOTE_STRUCT.unpack_from(buf, HEADER_SIZE)
+    header['last_price'] = round(ltp, 2) if ltp > 0 else None
+    header['last_traded_quantity'] = ltq if ltq > 0 else None
+    header['last_trade_time'] = datetime.fromtimestamp(epoch, tz=IST) if epoch > 0 else None
+    header['average_traded_price'] = round(atp, 2) if atp > 0 else None
+    header['volume_traded'] = volume if volume > 0 else None
+    header['total_sell_quantity'] = sell_qty if sell_qty > 0 else None
+    header['total_buy_quantity'] = buy_qty if buy_qty > 0 else None
+    header['day_open'] = round(day_open, 2) if day_open > 0 else None
+    header['day_close'] = round(day_close, 2) if day_close > 0 else None
+    header['day_high'] = round(day_high, 2) if day_high > 0 else None
+    header['day_low'] = round(day_low, 2) if day_low > 0 else None
+    header['packet_type'] = 'quote'
+    return header
+
+
+def _decode_oi(buf, header: Dict) -> Optional[Dict]:
+    if len(buf) < 12:
+        return None
+    oi = OI_STRUCT.unpack_from(buf, HEADER_SIZE)[0]
+    header['oi'] = oi if oi > 0 else None
+    header['packet_type'] = 'oi'
+    return header
+
+
+def _decode_prev_close(buf, header: Dict) -> Optional[Dict]:
+    if len(buf) < 16:
+        return None
+    prev_close, prev_oi = PREV_CLOSE_STRUCT.unpack_from(buf, HEADER_SIZE)
+    header['prev_close'] = round(prev_close, 2) if prev_close > 0 else None
+    header['prev_oi'] = prev_oi if prev_oi > 0 else None
+    header['packet_type'] = 'prev_close'
+    return header
+
+
+def _decode_depth(buf) -> List[Dict]:
+    """Decode the 5 x 20-byte depth block with a single unpack_from"""
+    values = DEPTH_STRUCT.unpack_from(buf, DEPTH_OFFSET)
+    depth_levels = []
+    for i in range(0, 30, 6):
+        bid_qty, ask_qty, bid_orders, ask_orders, bid_price, ask_price = values[i:i + 6]
+        depth_levels.append({
+            'bid_quantity': bid_qty if bid_qty > 0 else None,
+            'ask_quantity': ask_qty if ask_qty > 0 else None,
+            'bid_orders': bid_orders if bid_orders > 0 else None,
+            'ask_orders': ask_orders if ask_orders > 0 else None,
+            'bid_price': round(bid_price, 2) if bid_price > 0 else None,
+            'ask_price': round(ask_price, 2) if ask_price > 0 else None
+        })
+    return depth_levels
+
+
+def _decode_full(buf, header: Dict) -> Optional[Dict]:
+    if len(buf) < 162:
+        return None
+    (ltp, ltq, epoch, atp, volume, sell_qty, buy_qty, oi, oi_high, oi_low,
+     day_open, day_close, day_high, day_low) = FULL_STRUCT.unpack_from(buf, HEADER_SIZE)
+    header['last_price'] = round(ltp, 2) if ltp > 0 else None
+    header['last_traded_quantity'] = ltq if ltq > 0 else None
+    header['last_trade_time'] = datetime.fromtimestamp(epoch, tz=IST) if epoch > 0 else None
+    header['average_traded_price'] = round(atp, 2) if atp > 0 else None
+    header['volume_traded'] = volume if volume > 0 else None
+    header['total_sell_quantity'] = sell_qty if sell_qty > 0 else None
+    header['total_buy_quantity'] = buy_qty if buy_qty > 0 else None
+    header['oi'] = oi if oi > 0 else None
+    header['oi_day_high'] = oi_high if oi_high > 0 else None
+    header['oi_day_low'] = oi_low if oi_low > 0 else None
+    header['day_open'] = round(day_open, 2) if day_open > 0 else None
+    header['day_close'] = round(day_close, 2) if day_close > 0 else None
+    header['day_high'] = round(day_high, 2) if day_high > 0 else None
+    header['day_low'] = round(day_low, 2) if day_low > 0 else None
+    header['depth'] = _decode_depth(buf)
+    header['packet_type'] = 'full'
+    return header
+
+
+def _decode_disconnect(buf, header: Dict) -> Optional[Dict]:
+    if len(buf) < 10:
+        return None
+    header['reason_code'] = DISCONNECT_STRUCT.unpack_from(buf, HEADER_SIZE)[0]
+    header['packet_type'] = 'disconnect'
+    return header
+
+
+_DECODERS = {
+    RESPONSE_INDEX: _decode_index,
+    RESPONSE_TICKER: _decode_ticker,
+    RESPONSE_QUOTE: _decode_quote,
+    RESPONSE_OI: _decode_oi,
+    RESPONSE_PREV_CLOSE: _decode_prev_close,
+    RESPONSE_FULL: _decode_full,
+    RESPONSE_DISCONNECT: _decode_disconnect
+    # RESPONSE_MARKET_STATUS (7) not implemented - rare packet
+}
+
+
+def decode_packet(data) -> Optional[Dict]:
+    """
+    Fast packet decoder using precompiled struct layouts
+    
+    Same output as parse_packet(), but the header is unpacked once and each
+    layout is read with a single unpack_from() directly from the buffer.
+    
+    Args:
+        data: Binary packet data (bytes, bytearray or memoryview)
+    
+    Returns:
+        Parsed packet dict or None if parsing fails
+    """
+    if len(data) < HEADER_SIZE:
+        logger.warning("packet_too_short", length=len(data))
+        return None
+    
+    response_code, message_length, segment, security_id = HEADER_STRUCT.unpack_from(data, 0)
+    
+    decoder = _DECODERS.get(response_code)
+    if decoder is None:
+        logger.warning("unknown_response_code", code=response_code, length=len(data))
+        return None
+    
+    try:
+        result = decoder(data, _decode_header(response_code, message_length, segment, security_id))
+    except Exception as e:
+        logger.error("parser_exception", code=response_code, error=str(e), length=len(data))
+        return None
+    
+    if result is None:
+        logger.debug("parser_returned_none", code=response_code, length=len(data))
+    
+    return result
+
+
+# ============================================================================
+# FRAME SPLITTING
+# ============================================================================
+# Under load Dhan coalesces several packets into one WebSocket frame.
+# Each header's message_length gives the size of that packet.
+
+# Fallback sizes when a header carries no usable message_length
+PACKET_SIZES = {
+    RESPONSE_INDEX: 16,
+    RESPONSE_TICKER: 16,
+    RESPONSE_QUOTE: 50,
+    RESPONSE_OI: 12,
+    RESPONSE_PREV_CLOSE: 16,
+    RESPONSE_FULL: 162,
+    RESPONSE_DISCONNECT: 10
+}
+
+FRAME_HEADER_STRUCT = struct.Struct('<Bh')  # response_code, message_length
+
+
+def split_frame(data) -> Tuple[List[memoryview], int]:
+    """
+    Split a WebSocket frame into individual Dhan packets without copying
+    
+    Walks the buffer header by header using message_length. Packets are
+    returned as memoryview slices of the original frame.
+    
+    Args:
+        data: Raw frame (bytes, bytearray or memoryview)
+    
+    Returns:
+        Tuple of (packets, truncated_bytes) where truncated_bytes counts
+        trailing bytes that did not form a complete packet
+    """
+    buf = data if isinstance(data, memoryview) else memoryview(data)
+    total = len(buf)
+    packets: List[memoryview] = []
+    offset = 0
+    
+    while total - offset >= HEADER_SIZE:
+        response_code, message_length = FRAME_HEADER_STRUCT.unpack_from(buf, offset)
+        
+        if message_length < HEADER_SIZE:
+            message_length = PACKET_SIZES.get(response_code, 0)
+            if not message_length:
+                # Unknown layout - cannot find the next boundary, pass the rest through
+                packets.append(buf[offset:])
+                return packets, 0
+        
+        end = offset + message_length
+        if end > total:
+            break
+        
+        packets.append(buf[offset:end])
+        offset = end
+    
+    return packets, total - offset
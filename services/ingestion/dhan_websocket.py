@@ -10,13 +10,16 @@ import asyncio
 import json
 import structlog
 import time
+import threading
 from typing import List, Dict, Set, Callable, Optional
 from datetime import datetime
 import websockets
 from websockets.exceptions import ConnectionClosed, WebSocketException
 
-from dhan_parser import parse_packet, RESPONSE_DISCONNECT
+from dhan_parser import decode_packet, split_frame, RESPONSE_DISCONNECT, RESPONSE_FULL
 from dhan_auth import get_dhan_credentials, get_websocket_url
+from handoff import FrameQueue
+from metrics import PARSE_SECONDS
 
 logger = structlog.get_logger()
 
@@ -44,19 +47,32 @@ class DhanWebSocketClient:
     def __init__(
         self,
         on_tick: Callable[[Dict], None],
+        on_batch: Optional[Callable[[List[Dict]], None]] = None,
+        on_full_batch: Optional[Callable] = None,
+        decode_mode: str = "dict",
         on_connect: Optional[Callable] = None,
         on_error: Optional[Callable[[Exception], None]] = None,
         on_close: Optional[Callable[[int, str], None]] = None,
         ping_interval: int = 30,
         ping_timeout: int = 10,
         max_reconnect_attempts: int = 5,
-        reconnect_delay: int = 5
+        reconnect_delay: int = 5,
+        handoff_queue_size: int = 0,
+        overflow_policy: str = FrameQueue.POLICY_BLOCK,
+        on_idle: Optional[Callable[[], None]] = None,
+        idle_interval: float = 0.5
     ):
         """
         Initialize Dhan WebSocket client
         
         Args:
             on_tick: Callback for parsed tick data
+            on_batch: Optional callback receiving all ticks of one frame
+                      (used instead of on_tick when set)
+            on_full_batch: Callback for a frame's full packets decoded as one
+                           NumPy structured array (decode_mode="numpy")
+            decode_mode: "dict" (per-packet dicts) or "numpy" (columnar
+                         decoding of full packets, see dhan_columnar.py)
             on_connect: Callback on successful connection
             on_error: Callback for errors
             on_close: Callback on connection close
@@ -64,8 +80,17 @@ class DhanWebSocketClient:
             ping_timeout: Seconds to wait for pong
             max_reconnect_attempts: Max reconnection tries
             reconnect_delay: Seconds between reconnect attempts
+            handoff_queue_size: Max frames queued for the processing thread
+                                (0 = process inline on the event loop)
+            overflow_policy: block, drop_oldest or conflate (see FrameQueue)
+            on_idle: Called from the processing thread when no frame arrived
+                     for idle_interval seconds (e.g. timer-driven batch flush)
+            idle_interval: Seconds between on_idle calls while idle
         """
         self.on_tick = on_tick
+        self.on_batch = on_batch
+        self.on_full_batch = on_full_batch
+        self.decode_mode = decode_mode
         self.on_connect = on_connect
         self.on_error = on_error
         self.on_close = on_close
@@ -73,12 +98,23 @@ class DhanWebSocketClient:
         self.ping_timeout = ping_timeout
         self.max_reconnect_attempts = max_reconnect_attempts
         self.reconnect_delay = reconnect_delay
+        self.on_idle = on_idle
+        self.idle_interval = idle_interval
+        
+        # Hand-off from receive coroutine to processing thread
+        self._handoff: Optional[FrameQueue] = None
+        self._processing_thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._handoff_space: Optional[asyncio.Event] = None  # Set when a refused frame may fit (block policy)
+        if handoff_queue_size > 0:
+            self._handoff = FrameQueue(maxsize=handoff_queue_size, policy=overflow_policy)
         
         # Connection state
         self.ws: Optional[websockets.WebSocketClientProtocol] = None
         self.subscribed_instruments: Set[str] = set()
         self.is_connected = False
         self.reconnect_count = 0
+        self.reconnects_total = 0
         self.should_run = True
         
         # Credentials (loaded on connect)
@@ -87,10 +123,26 @@ class DhanWebSocketClient:
         self.ws_url: Optional[str] = None
         
         # Statistics
+        self.frames_received = 0
+        self.multi_packet_frames = 0
+        self.truncated_bytes = 0
         self.packets_received = 0
         self.packets_parsed = 0
         self.packets_failed = 0
+        self.packets_by_code: Dict[int, int] = {}
         self.last_packet_time: Optional[datetime] = None
+        # Epoch seconds the frame being processed was read off the socket
+        # (callbacks pass it on as the batch's receive hop)
+        self.frame_received_at: Optional[float] = None
+        self.handoff_blocked_seconds = 0.0
+        self._parse_seconds = PARSE_SECONDS.labels(source='dhan')
+        
+        # Columnar decoding (NumPy only imported when enabled)
+        self._columnar = None
+        if self.decode_mode == "numpy":
+            import dhan_columnar
+            self._columnar = dhan_columnar
+            logger.info("dhan_columnar_decoding_enabled")
     
     async def connect(self):
         """Establish WebSocket connection to Dhan"""
@@ -134,6 +186,75 @@ class DhanWebSocketClient:
             await self.ws.close()
             self.is_connected = False
             logger.info("dhan_disconnected")
+        
+        self.stop_processing_thread()
+    
+    @property
+    def handoff_enabled(self) -> bool:
+        """True when frames are processed on a dedicated thread"""
+        return self._handoff is not None
+    
+    def _start_processing_thread(self):
+        """Start the frame processing thread (hand-off mode only)"""
+        if self._handoff is None or (self._processing_thread and self._processing_thread.is_alive()):
+            return
+        
+        # The processing thread wakes a receive loop waiting for space through the event loop
+        loop = self._loop
+        self._handoff_space = asyncio.Event()
+        self._handoff.on_space = lambda: loop.call_soon_threadsafe(self._handoff_space.set)
+        
+        self._processing_thread = threading.Thread(
+            target=self._processing_loop,
+            name="dhan-processing",
+            daemon=True
+        )
+        self._processing_thread.start()
+        
+        logger.info(
+            "dhan_processing_thread_started",
+            queue_size=self._handoff.maxsize,
+            overflow_policy=self._handoff.policy
+        )
+    
+    def stop_processing_thread(self, timeout: float = 5.0):
+        """Drain the hand-off queue and stop the processing thread"""
+        if self._handoff is None:
+            return
+        
+        self._handoff.close()
+        if self._processing_thread and self._processing_thread.is_alive():
+            self._processing_thread.join(timeout)
+            if self._processing_thread.is_alive():
+                logger.warning("dhan_processing_thread_stop_timeout", queued_frames=len(self._handoff))
+    
+    def _processing_loop(self):
+        """Processing thread: parse, enrich and publish frames off the event loop"""
+        while True:
+            item = self._handoff.get(timeout=self.idle_interval)
+            
+            if item is None:
+                if self._handoff.closed:
+                    break
+                if self.on_idle:
+                    try:
+                        self.on_idle()
+                    except Exception as e:
+                        logger.error("idle_callback_error", error=str(e))
+                continue
+            
+            payload, received_at = item
+            self.frame_received_at = time.time() - (time.perf_counter() - received_at)
+            try:
+                if isinstance(payload, list):
+                    # Conflated packets released as one batch
+                    self._process_packets(payload)
+                else:
+                    self._process_frame(payload)
+            except Exception as e:
+                logger.error("frame_processing_error", error=str(e))
+        
+        logger.info("dhan_processing_thread_stopped")
     
     def _build_subscription_message(
         self,
@@ -279,40 +400,163 @@ class DhanWebSocketClient:
         """
         Process incoming binary message
         
+        In hand-off mode the frame is queued for the processing thread so the
+        receive loop never waits on parsing or RabbitMQ. Otherwise it is
+        processed inline.
+        
+        Args:
+            message: Binary frame data
+        """
+        if self._handoff is None:
+            self.frame_received_at = time.time()
+            self._process_frame(message)
+            return
+        
+        received_at = time.perf_counter()
+        
+        # Block policy: wait for the processing thread to free a slot without
+        # blocking the event loop. Cleared before put(), so a slot freed in
+        # between still wakes the wait (on_space sets it on this loop)
+        while True:
+            self._handoff_space.clear()
+            if self._handoff.put(message, received_at):
+                break
+            await self._handoff_space.wait()
+            if self._handoff.closed:
+                return
+        
+        blocked = time.perf_counter() - received_at
+        if blocked > 0.001:
+            self.handoff_blocked_seconds += blocked
+    
+    def _process_frame(self, message: bytes):
+        """
+        Split and process one frame
+        
+        A single frame may carry several stacked packets; each one is
+        decoded and the frame's ticks are delivered together.
+        
         Args:
-            message: Binary packet data
+            message: Binary frame data
         """
-        self.packets_received += 1
+        started = time.perf_counter()
+        self.frames_received += 1
         self.last_packet_time = datetime.now()
         
-        # Parse packet
-        parsed = parse_packet(message)
+        # Split frame into packets (memoryview slices, no copies)
+        packets, truncated = split_frame(message)
+        
+        if truncated:
+            self.truncated_bytes += truncated
+            logger.warning(
+                "frame_truncated",
+                truncated_bytes=truncated,
+                frame_length=len(message),
+                total_truncated_bytes=self.truncated_bytes
+            )
+        
+        if len(packets) > 1:
+            self.multi_packet_frames += 1
+        
+        self._process_packets(packets, started)
+    
+    def _process_packets(self, packets: List, started: Optional[float] = None):
+        """
+        Decode packets and dispatch the resulting ticks
         
-        if parsed:
+        Decoding time (from `started`, default now) up to the first dispatch
+        is observed once per frame in ingestion_parse_seconds.
+        """
+        if started is None:
+            started = time.perf_counter()
+        codes = self.packets_by_code
+        
+        # Columnar mode: decode all full packets of the frame in one call
+        if self._columnar and self.on_full_batch:
+            full_packets = [p for p in packets if self._columnar.is_full_packet(p)]
+            if full_packets:
+                packets = [p for p in packets if not self._columnar.is_full_packet(p)]
+                self.packets_received += len(full_packets)
+                self.packets_parsed += len(full_packets)
+                codes[RESPONSE_FULL] = codes.get(RESPONSE_FULL, 0) + len(full_packets)
+                try:
+                    batch = self._columnar.decode_full_batch(full_packets)
+                    if not packets:
+                        self._parse_seconds.observe(time.perf_counter() - started)
+                    self.on_full_batch(batch)
+                except Exception as e:
+                    logger.error("full_batch_callback_error", error=str(e), batch_size=len(full_packets))
+                if not packets:
+                    return
+                # Time the remaining packets separately from the callback above
+                started = time.perf_counter()
+        
+        ticks = []
+        
+        for packet in packets:
+            self.packets_received += 1
+            if len(packet):
+                code = packet[0]
+                codes[code] = codes.get(code, 0) + 1
+            
+            # Parse packet
+            parsed = decode_packet(packet)
+            
+            if not parsed:
+                self.packets_failed += 1
+                if self.packets_failed % 100 == 0:
+                    logger.warning(
+                        "parsing_failures",
+                        failed=self.packets_failed,
+                        total=self.packets_received
+                    )
+                continue
+            
             self.packets_parsed += 1
             
             # Check for disconnect packet
             if parsed.get('response_code') == RESPONSE_DISCONNECT:
                 reason_code = parsed.get('reason_code', 0)
                 logger.warning("disconnect_received", reason_code=reason_code)
-                if self.on_close:
-                    self.on_close(reason_code, "Server disconnect")
+                self._parse_seconds.observe(time.perf_counter() - started)
+                self._dispatch_ticks(ticks)
+                self._notify_close(reason_code, "Server disconnect")
                 return
             
-            # Pass to callback
-            if self.on_tick:
+            ticks.append(parsed)
+        
+        self._parse_seconds.observe(time.perf_counter() - started)
+        self._dispatch_ticks(ticks)
+    
+    def _notify_close(self, code: int, reason: str):
+        """Call on_close on the event loop (marshalled there from the processing thread)"""
+        if not self.on_close:
+            return
+        
+        if self._loop is not None and threading.current_thread() is self._processing_thread:
+            self._loop.call_soon_threadsafe(self.on_close, code, reason)
+        else:
+            self.on_close(code, reason)
+    
+    def _dispatch_ticks(self, ticks: List[Dict]):
+        """Pass a frame's parsed ticks to the batch or per-tick callback"""
+        if not ticks:
+            return
+        
+        if self.on_batch:
+            try:
+                self.on_batch(ticks)
+            except Exception as e:
+                logger.error("batch_callback_error", error=str(e), batch_size=len(ticks))
+            return
+        
+        # Pass to callback
+        if self.on_tick:
+            for tick in ticks:
                 try:
-                    self.on_tick(parsed)
+                    self.on_tick(tick)
                 except Exception as e:
                     logger.error("tick_callback_error", error=str(e))
-        else:
-            self.packets_failed += 1
-            if self.packets_failed % 100 == 0:
-                logger.warning(
-                    "parsing_failures",
-                    failed=self.packets_failed,
-                    total=self.packets_received
-                )
     
     async def _receive_loop(self):
         """Main loop to receive and process messages"""
@@ -353,6 +597,9 @@ class DhanWebSocketClient:
     
     async def start(self):
         """Start WebSocket connection and receive loop"""
+        self._loop = asyncio.get_running_loop()
+        self._start_processing_thread()
+        
         while self.should_run and self.reconnect_count < self.max_reconnect_attempts:
             try:
                 await self.connect()
@@ -366,6 +613,7 @@ class DhanWebSocketClient:
             # Reconnection logic
             if self.should_run and self.reconnect_count < self.max_reconnect_attempts:
                 self.reconnect_count += 1
+                self.reconnects_total += 1
                 logger.info(
                     "reconnecting",
                     attempt=self.reconnect_count,
@@ -382,11 +630,18 @@ class DhanWebSocketClient:
         return {
             'is_connected': self.is_connected,
             'subscribed_instruments': len(self.subscribed_instruments),
+            'frames_received': self.frames_received,
+            'multi_packet_frames': self.multi_packet_frames,
+            'truncated_bytes': self.truncated_bytes,
             'packets_received': self.packets_received,
             'packets_parsed': self.packets_parsed,
             'packets_failed': self.packets_failed,
+            'packets_by_code': dict(self.packets_by_code),
             'last_packet_time': self.last_packet_time,
-            'reconnect_count': self.reconnect_count
+            'reconnect_count': self.reconnect_count,
+            'reconnects_total': self.reconnects_total,
+            'handoff_blocked_seconds': round(self.handoff_blocked_seconds, 3),
+            **(self._handoff.get_stats() if self._handoff is not None else {})
         }
 
 
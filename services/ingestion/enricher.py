@@ -4,135 +4,402 @@ Transforms raw Kite ticks into enriched format for database storage
 Adds instrument metadata and calculates derived metrics
 """
 
+import gc
+import os
+import time
+from contextlib import contextmanager
+from operator import attrgetter
 import redis
 import psycopg2
 import structlog
-from typing import Dict, Optional, List
+from typing import Dict, Optional, List, Tuple
 from datetime import datetime
 from zoneinfo import ZoneInfo
-from models import KiteTick, EnrichedTick, InstrumentInfo, DhanTick
+from models import KiteTick, EnrichedTick, DhanTick
+from records import TickRecord, InstrumentRecord
+from instrument_snapshot import (
+    INSTRUMENTS_COPY_SQL, SNAPSHOT_COLUMNS, SNAPSHOT_PATH, InstrumentCopySink, InstrumentSnapshot, SnapshotError,
+    fetch_instruments_version, read_snapshot, write_snapshot
+)
 
 logger = structlog.get_logger()
 
 # IST timezone for timestamp conversion
 IST = ZoneInfo('Asia/Kolkata')
+# Naive Kite timestamps are treated as UTC
+UTC = ZoneInfo('UTC')
 
+# Secondary index for the Dhan path: (exchange_segment_code, security_id) -> instrument_token
+# Rebuilt whenever load_instruments_cache() runs or a different cache dict is passed in
+_security_id_index: Dict[Tuple[int, str], int] = {}
+_security_id_index_source: Optional[Dict[int, InstrumentRecord]] = None
+_security_id_index_stats = {'hits': 0, 'misses': 0}
 
-def load_instruments_cache(database_url: str, redis_client: Optional[redis.Redis] = None) -> Dict[int, InstrumentInfo]:
+# Keys per SCAN call and HGETALLs per pipeline round trip in the Redis fallback
+REDIS_SCAN_COUNT = 1000
+
+
+def dhan_exchange_segment(info: InstrumentRecord) -> int:
     """
-    Load instruments metadata from Postgres (with optional Redis fallback)
+    Map instrument exchange/type to Dhan exchange segment code
     
-    Primary source: PostgreSQL
-    Fallback: Redis (if provided and DB fails)
+    Reference: https://dhanhq.co/docs/v2/annexure/#exchange-segment
     
     Args:
-        database_url: PostgreSQL connection URL
-        redis_client: Optional Redis client for fallback
+        info: Instrument metadata
+    
+    Returns:
+        Dhan exchange segment code (defaults to NSE_FNO)
+    """
+    if info.exchange == 'NSE':
+        # Options and Futures trade on NSE F&O (segment 2)
+        if info.instrument_type in ('CE', 'PE', 'FUT'):
+            return 2  # NSE_FNO
+        return 1  # NSE_EQ
+    elif info.exchange == 'BSE':
+        if info.instrument_type in ('CE', 'PE', 'FUT'):
+            return 8  # BSE_FNO
+        return 4  # BSE_EQ
+    elif info.exchange == 'MCX':
+        return 5  # MCX_COMM
+    elif info.exchange in ('CDS', 'NSE_CURRENCY'):
+        return 3  # NSE_CURRENCY
+    elif info.exchange in ('BCD', 'BSE_CURRENCY'):
+        return 7  # BSE_CURRENCY
+    return 2  # Default to NSE_FNO
+
+
+def build_security_id_index(instruments_cache: Dict[int, InstrumentRecord]) -> Dict[Tuple[int, str], int]:
+    """
+    Build (exchange_segment_code, security_id) -> instrument_token index
+    
+    Replaces the per-packet linear scan over instruments_cache in the Dhan
+    enrichment path with a single dict lookup.
+    
+    Args:
+        instruments_cache: Dict mapping instrument_token to InstrumentRecord
     
     Returns:
-        Dict mapping instrument_token to InstrumentInfo
+        The rebuilt index (also stored at module level)
+    """
+    global _security_id_index, _security_id_index_source
+    
+    index: Dict[Tuple[int, str], int] = {}
+    for token, info in instruments_cache.items():
+        if info.security_id:
+            index[(dhan_exchange_segment(info), str(info.security_id))] = token
+    
+    _security_id_index = index
+    _security_id_index_source = instruments_cache
+    
+    logger.info("security_id_index_built", entries=len(index))
+    
+    return index
+
+
+def lookup_security_id(
+    exchange_segment_code: int,
+    security_id: str,
+    instruments_cache: Dict[int, InstrumentRecord]
+) -> Optional[int]:
     """
-    instruments_cache = {}
+    Resolve a Dhan (exchange_segment_code, security_id) pair to instrument_token
+    
+    Args:
+        exchange_segment_code: Dhan exchange segment from packet header
+        security_id: Dhan security ID from packet header
+        instruments_cache: Cache the index must be built from
+    
+    Returns:
+        instrument_token, or None if not subscribed/known
+    """
+    if _security_id_index_source is not instruments_cache:
+        build_security_id_index(instruments_cache)
+    
+    instrument_token = _security_id_index.get((exchange_segment_code, security_id))
+    
+    if instrument_token is None:
+        _security_id_index_stats['misses'] += 1
+    else:
+        _security_id_index_stats['hits'] += 1
+    
+    return instrument_token
+
+
+def lookup_security_ids(
+    exchange_segment_codes: List[int],
+    security_ids: List[int],
+    instruments_cache: Dict[int, InstrumentRecord]
+) -> List[Optional[int]]:
+    """
+    Batch version of lookup_security_id() for columnar decoding
+    
+    Args:
+        exchange_segment_codes: Dhan exchange segments, one per packet
+        security_ids: Dhan security IDs (int or str), one per packet
+        instruments_cache: Cache the index must be built from
+    
+    Returns:
+        instrument_token (or None) for each packet
+    """
+    if _security_id_index_source is not instruments_cache:
+        build_security_id_index(instruments_cache)
+    
+    index_get = _security_id_index.get
+    tokens = [
+        index_get((segment, str(security_id)))
+        for segment, security_id in zip(exchange_segment_codes, security_ids)
+    ]
+    
+    misses = tokens.count(None)
+    _security_id_index_stats['misses'] += misses
+    _security_id_index_stats['hits'] += len(tokens) - misses
+    
+    return tokens
+
+
+def get_security_id_index_stats() -> Dict[str, int]:
+    """Get security_id index hit/miss counters"""
+    return {
+        'entries': len(_security_id_index),
+        'hits': _security_id_index_stats['hits'],
+        'misses': _security_id_index_stats['misses']
+    }
+
+
+def _load_instruments_from_db(
+    database_url: str,
+    snapshot: Optional[InstrumentSnapshot] = None,
+    snapshot_path: str = ""
+) -> Dict[int, InstrumentRecord]:
+    """
+    Load active instruments, from the snapshot if it is current, else with COPY
+    
+    instruments_version is read before the COPY, so a snapshot written from
+    this load is never labelled newer than its rows.
     
-    # Try loading from Postgres first
+    Args:
+        database_url: PostgreSQL connection URL
+        snapshot: Snapshot read at startup (used if its version matches the DB)
+        snapshot_path: Where to write a fresh snapshot after a COPY load ("" = don't)
+    
+    Returns:
+        Dict mapping instrument_token to InstrumentRecord
+    """
+    start = time.perf_counter()
+    conn = psycopg2.connect(database_url)
     try:
-        conn = psycopg2.connect(database_url)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT 
-                instrument_token, trading_symbol, exchange, segment,
-                instrument_type, name, expiry, strike, tick_size, lot_size,
-                security_id, source
-            FROM instruments
-            WHERE is_active = TRUE
-        """)
+        connected = time.perf_counter()
         
-        rows = cursor.fetchall()
-        
-        logger.info("loading_instruments_from_db", total_instruments=len(rows))
+        with conn.cursor() as cursor:
+            db_version = fetch_instruments_version(cursor)
+            
+            if snapshot is not None and db_version is not None and snapshot.db_version == db_version:
+                instruments = _instruments_from_snapshot(snapshot)
+                logger.info(
+                    "instruments_cache_loaded_from_snapshot",
+                    total_instruments=len(instruments),
+                    db_version=db_version,
+                    content_hash=snapshot.content_hash[:16],
+                    connect_ms=round((connected - start) * 1000, 1),
+                    elapsed_ms=round((time.perf_counter() - start) * 1000, 1)
+                )
+                conn.rollback()
+                return instruments
+            
+            sink = InstrumentCopySink(InstrumentRecord)
+            with _gc_paused():
+                cursor.copy_expert(INSTRUMENTS_COPY_SQL, sink)
+        conn.rollback()  # Read-only; don't leave the transaction open on pgbouncer
+    finally:
+        conn.close()
+    
+    logger.info(
+        "instruments_cache_loaded_from_db",
+        total_instruments=len(sink.instruments),
+        rows=sink.rows,
+        parse_failures=sink.parse_failures,
+        copy_bytes=sink.bytes,
+        db_version=db_version,
+        snapshot_db_version=snapshot.db_version if snapshot is not None else None,
+        connect_ms=round((connected - start) * 1000, 1),
+        copy_ms=round((time.perf_counter() - connected) * 1000, 1)
+    )
+    
+    if snapshot_path:
+        if db_version is None:
+            logger.warning(
+                "instruments_snapshot_skipped",
+                reason="instruments_version table missing (apply database/instruments_version.sql)"
+            )
+        else:
+            try:
+                write_snapshot(snapshot_path, _snapshot_columns(sink.instruments), db_version)
+            except OSError as e:
+                logger.warning("instruments_snapshot_write_failed", path=snapshot_path, error=str(e))
+    
+    return sink.instruments
+
+
+def _instruments_from_snapshot(snapshot: InstrumentSnapshot) -> Dict[int, InstrumentRecord]:
+    """Build the cache from snapshot columns (stored in InstrumentRecord field order)"""
+    with _gc_paused():
+        return dict(zip(snapshot.columns[0], map(InstrumentRecord, *snapshot.columns)))
+
+
+@contextmanager
+def _gc_paused():
+    """
+    Suspend the cyclic GC while the cache is bulk-built
+    Every 700 new records would otherwise trigger a collection that walks all of
+    them again - roughly half of the build time at 100k instruments
+    """
+    was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if was_enabled:
+            gc.enable()
+
+
+def _snapshot_columns(instruments: Dict[int, InstrumentRecord]) -> List[tuple]:
+    """Transpose the cache into one column per SNAPSHOT_COLUMNS entry"""
+    if not instruments:
+        return [() for _ in SNAPSHOT_COLUMNS]
+    return list(zip(*map(attrgetter(*SNAPSHOT_COLUMNS), instruments.values())))
+
+
+def _read_instruments_snapshot(path: str) -> Optional[InstrumentSnapshot]:
+    """Snapshot at path, or None if absent/invalid (logged; the DB load then rewrites it)"""
+    if not os.path.exists(path):
+        logger.info("instruments_snapshot_missing", path=path)
+        return None
+    
+    start = time.perf_counter()
+    try:
+        snapshot = read_snapshot(path)
+    except SnapshotError as e:
+        logger.warning("instruments_snapshot_invalid", path=path, error=str(e))
+        return None
+    
+    logger.info(
+        "instruments_snapshot_read",
+        path=path,
+        rows=snapshot.rows,
+        db_version=snapshot.db_version,
+        age_seconds=round(time.time() - snapshot.created_at),
+        read_ms=round((time.perf_counter() - start) * 1000, 1)
+    )
+    return snapshot
+
+
+def _load_instruments_from_redis(redis_client: redis.Redis) -> Dict[int, InstrumentRecord]:
+    """
+    Rebuild the cache from instrument:{token} hashes written by the sync scripts
+    
+    Keys are walked with SCAN (KEYS would block Redis for the whole keyspace)
+    and fetched with one pipelined HGETALL round trip per REDIS_SCAN_COUNT keys.
+    """
+    start = time.perf_counter()
+    instruments: Dict[int, InstrumentRecord] = {}
+    total_keys = 0
+    
+    def fetch(keys: List[bytes]):
+        pipe = redis_client.pipeline(transaction=False)
+        for key in keys:
+            pipe.hgetall(key)
         
-        for row in rows:
+        for key, data in zip(keys, pipe.execute()):
+            if not data:
+                continue
             try:
-                instrument = InstrumentInfo(
-                    instrument_token=row[0],
-                    trading_symbol=row[1],
-                    exchange=row[2],
-                    instrument_type=row[4],
-                    expiry=row[6].isoformat() if row[6] else None,
-                    strike=float(row[7]) if row[7] else None,
-                    lot_size=int(row[9]) if row[9] else None,
-                    tick_size=float(row[8]) if row[8] else None,
-                    security_id=row[10],  # Dhan security_id
-                    source=row[11] if row[11] else "kite"  # Data source
+                token = int(key.decode('utf-8').split(':')[1])
+                decoded_data = {
+                    k.decode('utf-8'): v.decode('utf-8')
+                    for k, v in data.items()
+                }
+                
+                instruments[token] = InstrumentRecord(
+                    instrument_token=token,
+                    trading_symbol=decoded_data.get('tradingsymbol', ''),
+                    exchange=decoded_data.get('exchange', ''),
+                    instrument_type=decoded_data.get('instrument_type'),
+                    expiry=decoded_data.get('expiry'),
+                    strike=float(decoded_data['strike']) if decoded_data.get('strike') else None,
+                    lot_size=int(decoded_data['lot_size']) if decoded_data.get('lot_size') else None,
+                    tick_size=float(decoded_data['tick_size']) if decoded_data.get('tick_size') else None
                 )
-                instruments_cache[row[0]] = instrument
             except Exception as e:
-                logger.error("instrument_parse_failed", row=row, error=str(e))
-                continue
-        
-        logger.info(
-            "instruments_cache_loaded_from_db",
-            total_instruments=len(instruments_cache)
-        )
-        
-        cursor.close()
-        conn.close()
-        
+                logger.error("redis_instrument_load_failed", key=key, error=str(e))
+    
+    keys = []
+    for key in redis_client.scan_iter(match="instrument:*", count=REDIS_SCAN_COUNT):
+        keys.append(key)
+        if len(keys) >= REDIS_SCAN_COUNT:
+            total_keys += len(keys)
+            fetch(keys)
+            keys = []
+    if keys:
+        total_keys += len(keys)
+        fetch(keys)
+    
+    logger.info(
+        "instruments_loaded_from_redis_fallback",
+        count=len(instruments),
+        total_keys=total_keys,
+        elapsed_ms=round((time.perf_counter() - start) * 1000, 1)
+    )
+    return instruments
+
+
+def load_instruments_cache(
+    database_url: str,
+    redis_client: Optional[redis.Redis] = None,
+    snapshot_path: str = SNAPSHOT_PATH
+) -> Dict[int, InstrumentRecord]:
+    """
+    Load instruments metadata from Postgres (with snapshot and Redis fallbacks)
+    
+    Primary source: on-disk snapshot if its version matches instruments_version,
+    otherwise PostgreSQL (streamed with COPY, then re-snapshotted)
+    Fallback: the snapshot unverified, then Redis (if provided), if the DB fails
+    
+    Args:
+        database_url: PostgreSQL connection URL
+        redis_client: Optional Redis client for fallback
+        snapshot_path: Snapshot file (INSTRUMENTS_SNAPSHOT_PATH; "" disables)
+    
+    Returns:
+        Dict mapping instrument_token to InstrumentRecord
+    """
+    snapshot = _read_instruments_snapshot(snapshot_path) if snapshot_path else None
+    
+    try:
+        instruments_cache = _load_instruments_from_db(database_url, snapshot, snapshot_path)
+        build_security_id_index(instruments_cache)
         return instruments_cache
     
     except psycopg2.Error as db_error:
         logger.error("db_load_failed", error=str(db_error))
         
-        # Cleanup connections before fallback
-        if 'cursor' in locals():
-            try:
-                cursor.close()
-            except:
-                pass
-        if 'conn' in locals():
-            try:
-                conn.close()
-            except:
-                pass
+        # A snapshot that can't be checked still has security_id/source, which Redis lacks
+        if snapshot is not None:
+            logger.warning(
+                "instruments_snapshot_unverified",
+                db_version=snapshot.db_version,
+                age_seconds=round(time.time() - snapshot.created_at)
+            )
+            instruments_cache = _instruments_from_snapshot(snapshot)
+            build_security_id_index(instruments_cache)
+            return instruments_cache
         
         # Fallback to Redis if database fails
         if redis_client:
             logger.warning("falling_back_to_redis_cache")
             try:
-                pattern = "instrument:*"
-                keys = redis_client.keys(pattern)
-                
-                logger.info("loading_from_redis_fallback", total_keys=len(keys))
-                
-                for key in keys:
-                    try:
-                        token_str = key.decode('utf-8').split(':')[1]
-                        token = int(token_str)
-                        data = redis_client.hgetall(key)
-                        
-                        if data:
-                            decoded_data = {
-                                k.decode('utf-8'): v.decode('utf-8') 
-                                for k, v in data.items()
-                            }
-                            
-                            instrument = InstrumentInfo(
-                                instrument_token=token,
-                                trading_symbol=decoded_data.get('tradingsymbol', ''),
-                                exchange=decoded_data.get('exchange', ''),
-                                instrument_type=decoded_data.get('instrument_type'),
-                                expiry=decoded_data.get('expiry'),
-                                strike=float(decoded_data['strike']) if decoded_data.get('strike') else None,
-                                lot_size=int(decoded_data['lot_size']) if decoded_data.get('lot_size') else None,
-                                tick_size=float(decoded_data['tick_size']) if decoded_data.get('tick_size') else None
-                            )
-                            instruments_cache[token] = instrument
-                    except Exception as e:
-                        logger.error("redis_instrument_load_failed", key=key, error=str(e))
-                        continue
-                
-                logger.info("instruments_loaded_from_redis_fallback", count=len(instruments_cache))
+                instruments_cache = _load_instruments_from_redis(redis_client)
+                build_security_id_index(instruments_cache)
                 return instruments_cache
             
             except Exception as redis_error:
@@ -141,14 +408,11 @@ def load_instruments_cache(database_url: str, redis_client: Optional[redis.Redis
         else:
             logger.error("no_fallback_available", message="Database failed and no Redis client provided")
             return {}
-    
-    # If we reach here without returning, DB succeeded
-    return instruments_cache
 
 
 def enrich_tick(
     raw_tick: KiteTick,
-    instruments_cache: Dict[int, InstrumentInfo]
+    instruments_cache: Dict[int, InstrumentRecord]
 ) -> EnrichedTick:
     """
     Transform raw Kite tick into enriched format for database
@@ -357,40 +621,41 @@ def _calculate_change_percent(change: Optional[float], close: Optional[float]) -
 
 def dhan_tick_to_enriched(
     raw_tick: DhanTick,
-    instruments_cache: Dict[int, InstrumentInfo]
+    instruments_cache: Dict[int, InstrumentRecord]
 ) -> Optional[EnrichedTick]:
     """
     Transform Dhan tick into enriched format for database
     
-    Maps Dhan's security_id → instrument_token using instruments cache
+    Maps Dhan's (exchange_segment, security_id) → instrument_token using
+    the secondary index built from instruments cache
     Calculates change/change_percent from prev_close
     Converts Dhan market depth to standard format
     
     Args:
         raw_tick: Parsed Dhan tick from binary packet
-        instruments_cache: Dict mapping instrument_token to InstrumentInfo
+        instruments_cache: Dict mapping instrument_token to InstrumentRecord
     
     Returns:
         EnrichedTick ready for database, or None if security_id not found
     """
-    # Find instrument by security_id
-    instrument_info = None
-    instrument_token = None
-    
-    for token, info in instruments_cache.items():
-        if info.security_id == raw_tick.security_id:
-            instrument_info = info
-            instrument_token = token
-            break
+    # Find instrument by (exchange_segment, security_id) via secondary index
+    instrument_token = lookup_security_id(
+        raw_tick.exchange_segment_code,
+        raw_tick.security_id,
+        instruments_cache
+    )
     
     if not instrument_token:
         logger.warning(
             "security_id_not_found",
             security_id=raw_tick.security_id,
-            exchange=raw_tick.exchange_segment
+            exchange=raw_tick.exchange_segment,
+            index_misses=_security_id_index_stats['misses']
         )
         return None
     
+    instrument_info = instruments_cache.get(instrument_token)
+    
     # Calculate change and change_percent from prev_close
     change = None
     change_percent = None
@@ -488,3 +753,223 @@ def dhan_tick_to_enriched(
     return enriched
 
 
+def kite_tick_to_record(
+    raw_tick: Dict,
+    instruments_cache: Dict[int, InstrumentRecord]
+) -> TickRecord:
+    """
+    Enrich a raw Kite tick dict straight into a TickRecord
+    
+    Same output as enrich_tick(KiteTick(...)) without building the pydantic
+    KiteTick/MarketDepth/EnrichedTick models. The tick must already have
+    passed validate_raw_tick().
+    
+    Args:
+        raw_tick: Tick dict as returned by KiteTicker
+        instruments_cache: Dictionary of instrument metadata
+    
+    Returns:
+        TickRecord: Enriched tick ready for publishing
+    """
+    get = raw_tick.get
+    instrument_token = raw_tick['instrument_token']
+    instrument_info = instruments_cache.get(instrument_token)
+    
+    # Extract OHLC values
+    day_open = day_high = day_low = day_close = None
+    ohlc = get('ohlc')
+    if ohlc:
+        day_open = _as_float(ohlc.get('open'))
+        day_high = _as_float(ohlc.get('high'))
+        day_low = _as_float(ohlc.get('low'))
+        day_close = _as_float(ohlc.get('close'))
+    
+    # Extract market depth arrays
+    bid_prices: List[Optional[float]] = [None] * 5
+    bid_quantities: List[Optional[int]] = [None] * 5
+    bid_orders: List[Optional[int]] = [None] * 5
+    
+    ask_prices: List[Optional[float]] = [None] * 5
+    ask_quantities: List[Optional[int]] = [None] * 5
+    ask_orders: List[Optional[int]] = [None] * 5
+    
+    depth = get('depth')
+    if depth:
+        for i, bid in enumerate(depth.get('buy', [])[:5]):
+            price = bid.get('price', 0.0)
+            bid_prices[i] = float(price) if price else None
+            bid_quantities[i] = bid.get('quantity', 0) or None
+            bid_orders[i] = bid.get('orders', 0) or None
+        
+        for i, ask in enumerate(depth.get('sell', [])[:5]):
+            price = ask.get('price', 0.0)
+            ask_prices[i] = float(price) if price else None
+            ask_quantities[i] = ask.get('quantity', 0) or None
+            ask_orders[i] = ask.get('orders', 0) or None
+    
+    total_buy_quantity = get('total_buy_quantity')
+    total_sell_quantity = get('total_sell_quantity')
+    change = _as_float(get('change'))
+    
+    # Convert timestamps from UTC to IST
+    utc_time = get('timestamp') or get('exchange_timestamp') or datetime.utcnow()
+    if utc_time.tzinfo is None:
+        utc_time = utc_time.replace(tzinfo=UTC)
+    
+    last_trade_time = get('last_trade_time')
+    if last_trade_time:
+        if last_trade_time.tzinfo is None:
+            last_trade_time = last_trade_time.replace(tzinfo=UTC)
+        last_trade_time = last_trade_time.astimezone(IST)
+    else:
+        last_trade_time = None
+    
+    return TickRecord(
+        utc_time.astimezone(IST),
+        last_trade_time,
+        instrument_token,
+        instrument_info.trading_symbol if instrument_info else None,
+        instrument_info.exchange if instrument_info else None,
+        instrument_info.instrument_type if instrument_info else None,
+        _as_float(get('last_price')),
+        get('last_traded_quantity'),
+        _as_float(get('average_traded_price')),
+        get('volume_traded'),
+        get('oi'),
+        get('oi_day_high'),
+        get('oi_day_low'),
+        day_open,
+        day_high,
+        day_low,
+        day_close,
+        change,
+        _calculate_change_percent(change, day_close),
+        total_buy_quantity,
+        total_sell_quantity,
+        bid_prices,
+        bid_quantities,
+        bid_orders,
+        ask_prices,
+        ask_quantities,
+        ask_orders,
+        bool(get('tradable', True)),
+        get('mode', 'quote'),
+        _calculate_spread(bid_prices[0], ask_prices[0]),
+        _calculate_mid_price(bid_prices[0], ask_prices[0]),
+        _calculate_order_imbalance(total_buy_quantity, total_sell_quantity)
+    )
+
+
+def dhan_tick_to_record(
+    tick_data: Dict,
+    instruments_cache: Dict[int, InstrumentRecord]
+) -> Optional[TickRecord]:
+    """
+    Enrich a decoded Dhan packet dict straight into a TickRecord
+    
+    Same output as dhan_tick_to_enriched(DhanTick(**tick_data)) without the
+    pydantic models. The binary decoder is the validation boundary: fields
+    are already typed and non-positive values are already None.
+    
+    Args:
+        tick_data: Dict from dhan_parser.decode_packet()
+        instruments_cache: Dict mapping instrument_token to InstrumentRecord
+    
+    Returns:
+        TickRecord ready for publishing, or None if security_id not found
+    """
+    get = tick_data.get
+    instrument_token = lookup_security_id(
+        tick_data['exchange_segment_code'],
+        tick_data['security_id'],
+        instruments_cache
+    )
+    
+    if not instrument_token:
+        logger.warning(
+            "security_id_not_found",
+            security_id=tick_data['security_id'],
+            exchange=tick_data['exchange_segment'],
+            index_misses=_security_id_index_stats['misses']
+        )
+        return None
+    
+    instrument_info = instruments_cache.get(instrument_token)
+    
+    # Calculate change and change_percent from prev_close
+    last_price = get('last_price')
+    prev_close = get('prev_close')
+    change = None
+    change_percent = None
+    
+    if last_price and prev_close and prev_close > 0:
+        change = round(last_price - prev_close, 2)
+        change_percent = round((change / prev_close) * 100, 4)
+    
+    # Extract market depth arrays from Dhan's 5-level depth
+    bid_prices: List[Optional[float]] = [None] * 5
+    bid_quantities: List[Optional[int]] = [None] * 5
+    bid_orders: List[Optional[int]] = [None] * 5
+    
+    ask_prices: List[Optional[float]] = [None] * 5
+    ask_quantities: List[Optional[int]] = [None] * 5
+    ask_orders: List[Optional[int]] = [None] * 5
+    
+    depth = get('depth')
+    if depth:
+        for i, level in enumerate(depth[:5]):
+            bid_prices[i] = level.get('bid_price')
+            bid_quantities[i] = level.get('bid_quantity')
+            bid_orders[i] = level.get('bid_orders')
+            ask_prices[i] = level.get('ask_price')
+            ask_quantities[i] = level.get('ask_quantity')
+            ask_orders[i] = level.get('ask_orders')
+    
+    total_buy_quantity = get('total_buy_quantity')
+    total_sell_quantity = get('total_sell_quantity')
+    
+    # Timestamp conversion (Dhan provides IST timestamps)
+    last_trade_time = get('last_trade_time')
+    ist_time = last_trade_time or datetime.now(IST)
+    if ist_time.tzinfo is None:
+        ist_time = ist_time.replace(tzinfo=IST)
+    
+    return TickRecord(
+        ist_time,
+        last_trade_time,
+        instrument_token,
+        instrument_info.trading_symbol if instrument_info else None,
+        instrument_info.exchange if instrument_info else None,
+        instrument_info.instrument_type if instrument_info else None,
+        last_price,
+        get('last_traded_quantity'),
+        get('average_traded_price'),
+        get('volume_traded'),
+        get('oi'),
+        get('oi_day_high'),
+        get('oi_day_low'),
+        get('day_open'),
+        get('day_high'),
+        get('day_low'),
+        get('day_close'),
+        change,
+        change_percent,
+        total_buy_quantity,
+        total_sell_quantity,
+        bid_prices,
+        bid_quantities,
+        bid_orders,
+        ask_prices,
+        ask_quantities,
+        ask_orders,
+        True,
+        "full" if depth else "quote",
+        _calculate_spread(bid_prices[0], ask_prices[0]),
+        _calculate_mid_price(bid_prices[0], ask_prices[0]),
+        _calculate_order_imbalance(total_buy_quantity, total_sell_quantity)
+    )
+
+
+def _as_float(value) -> Optional[float]:
+    """Coerce a numeric field to float the way the pydantic models do"""
+    return float(value) if value is not None else None
@@ -0,0 +1,211 @@
+"""
+Frame Hand-off Queue
+Bounded queue between the asyncio WebSocket receive loop and the processing thread
+Keeps socket reads independent of parsing, enrichment and RabbitMQ publishing
+"""
+
+import time
+import threading
+import structlog
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from dhan_parser import split_frame, HEADER_SIZE
+
+logger = structlog.get_logger()
+
+
+class FrameQueue:
+    """
+    Bounded FIFO of raw WebSocket frames with a configurable overflow policy
+    
+    Policies when the queue is full:
+    - block: put() refuses the frame; the receive loop waits for on_space,
+      called from get() once a slot frees up
+    - drop_oldest: the oldest queued frame is discarded
+    - conflate: packets are held in a side map keyed by
+      (response_code, exchange_segment, security_id), keeping only the latest
+      packet per key until the processing thread catches up
+    """
+    
+    POLICY_BLOCK = "block"
+    POLICY_DROP_OLDEST = "drop_oldest"
+    POLICY_CONFLATE = "conflate"
+    POLICIES = (POLICY_BLOCK, POLICY_DROP_OLDEST, POLICY_CONFLATE)
+    
+    def __init__(self, maxsize: int = 10000, policy: str = POLICY_BLOCK, on_space: Optional[Callable[[], None]] = None):
+        """
+        Initialize queue
+        
+        Args:
+            maxsize: Maximum number of queued frames
+            policy: Overflow policy (block, drop_oldest, conflate)
+            on_space: Called from the consumer thread after a refused put()
+                      once an item is dequeued (or the queue is closed)
+        """
+        if policy not in self.POLICIES:
+            raise ValueError(
+                f"Invalid overflow policy: {policy}. "
+                f"Must be one of: {', '.join(self.POLICIES)}"
+            )
+        
+        self.maxsize = maxsize
+        self.policy = policy
+        self.on_space = on_space
+        
+        # Items are (frame or list of packets, received_at)
+        self._items: deque = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._producer_waiting = False  # A put() was refused since the last on_space
+        
+        # Conflation side map: key -> latest packet (insertion ordered)
+        self._conflated: Dict[bytes, memoryview] = {}
+        self._conflated_since: Optional[float] = None
+        
+        # Statistics
+        self.frames_enqueued = 0
+        self.frames_dequeued = 0
+        self.frames_dropped = 0
+        self.frames_rejected = 0
+        self.packets_conflated = 0
+        self.max_depth = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.last_wait_seconds = 0.0
+    
+    def put(self, frame: bytes, received_at: Optional[float] = None) -> bool:
+        """
+        Enqueue a frame without blocking
+        
+        Args:
+            frame: Raw WebSocket frame
+            received_at: time.perf_counter() when the frame was received
+        
+        Returns:
+            bool: False if the frame was refused (block policy, queue full)
+        """
+        received_at = received_at if received_at is not None else time.perf_counter()
+        
+        with self._cond:
+            # While conflated packets are pending, keep folding new frames in
+            # so nothing overtakes them
+            if self._conflated:
+                self._conflate(frame, received_at)
+                self._cond.notify()
+                return True
+            
+            if len(self._items) >= self.maxsize:
+                if self.policy == self.POLICY_BLOCK:
+                    self.frames_rejected += 1
+                    self._producer_waiting = True
+                    return False
+                
+                if self.policy == self.POLICY_DROP_OLDEST:
+                    self._items.popleft()
+                    self.frames_dropped += 1
+                
+                else:
+                    self._conflate(frame, received_at)
+                    self._cond.notify()
+                    return True
+            
+            self._items.append((frame, received_at))
+            self.frames_enqueued += 1
+            self.max_depth = max(self.max_depth, len(self._items))
+            self._cond.notify()
+            return True
+    
+    def _conflate(self, frame: bytes, received_at: float):
+        """Fold a frame's packets into the conflation map (caller holds the lock)"""
+        packets, _ = split_frame(frame)
+        
+        for packet in packets:
+            if len(packet) < HEADER_SIZE:
+                continue
+            # response_code + exchange_segment + security_id
+            key = bytes(packet[0:1]) + bytes(packet[3:HEADER_SIZE])
+            if key in self._conflated:
+                self.packets_conflated += 1
+                # Re-insert so the latest packet keeps arrival order
+                del self._conflated[key]
+            self._conflated[key] = packet
+        
+        if self._conflated_since is None:
+            self._conflated_since = received_at
+        self.frames_enqueued += 1
+    
+    def get(self, timeout: Optional[float] = None) -> Optional[Tuple[Union[bytes, List[memoryview]], float]]:
+        """
+        Dequeue the next frame (or conflated packet list)
+        
+        Args:
+            timeout: Seconds to wait for an item (None = wait forever)
+        
+        Returns:
+            (frame or list of packets, received_at), or None on timeout/close
+        """
+        with self._cond:
+            if not self._items and not self._conflated and not self._closed:
+                self._cond.wait(timeout)
+            
+            if self._items:
+                item = self._items.popleft()
+            elif self._conflated:
+                # Queue drained - release the conflated packets as one batch
+                item = (list(self._conflated.values()), self._conflated_since)
+                self._conflated = {}
+                self._conflated_since = None
+            else:
+                return None
+            
+            self.frames_dequeued += 1
+            wait = time.perf_counter() - item[1]
+            self.last_wait_seconds = wait
+            self.total_wait_seconds += wait
+            self.max_wait_seconds = max(self.max_wait_seconds, wait)
+            
+            notify, self._producer_waiting = self._producer_waiting, False
+        
+        if notify and self.on_space:
+            self.on_space()
+        return item
+    
+    def close(self):
+        """Wake up the consumer (and a waiting producer); get() returns None once the queue is empty"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            notify, self._producer_waiting = self._producer_waiting, False
+        
+        if notify and self.on_space:
+            self.on_space()
+    
+    @property
+    def closed(self) -> bool:
+        return self._closed
+    
+    def __len__(self) -> int:
+        return len(self._items)
+    
+    def get_stats(self) -> Dict:
+        """Get queue statistics"""
+        with self._cond:
+            depth = len(self._items)
+            conflated_pending = len(self._conflated)
+        
+        return {
+            'queue_policy': self.policy,
+            'queue_maxsize': self.maxsize,
+            'queue_depth': depth,
+            'queue_max_depth': self.max_depth,
+            'queue_conflated_pending': conflated_pending,
+            'queue_frames_enqueued': self.frames_enqueued,
+            'queue_frames_dequeued': self.frames_dequeued,
+            'queue_frames_dropped': self.frames_dropped,
+            'queue_frames_rejected': self.frames_rejected,
+            'queue_packets_conflated': self.packets_conflated,
+            'queue_wait_last_ms': round(self.last_wait_seconds * 1000, 2),
+            'queue_wait_avg_ms': round(self.total_wait_seconds / self.frames_dequeued * 1000, 2) if self.frames_dequeued else 0,
+            'queue_wait_max_ms': round(self.max_wait_seconds * 1000, 2)
+        }
@@ -0,0 +1,192 @@
+"""
+Dhan Instrument State Store
+Last-known state per instrument, folded from partial packets
+
+Dhan sends OI (code 5) and previous close (code 6) as separate packets. They
+are folded into the instrument's state here instead of becoming their own
+mostly-empty ticks; price/volume packets (index, ticker, quote, full) are
+emitted with the missing OI and prev_close filled in, so change and
+change_percent can be calculated downstream.
+
+State lives in typed arrays (one row per instrument, 0 = unknown, matching
+the decoder which maps non-positive values to None).
+"""
+
+import threading
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+import structlog
+
+from dhan_parser import (
+    RESPONSE_INDEX, RESPONSE_TICKER, RESPONSE_QUOTE,
+    RESPONSE_OI, RESPONSE_PREV_CLOSE, RESPONSE_FULL
+)
+
+logger = structlog.get_logger()
+
+# Packets that carry a price/volume update and produce a tick
+PRICE_PACKETS = frozenset((RESPONSE_INDEX, RESPONSE_TICKER, RESPONSE_QUOTE, RESPONSE_FULL))
+
+# OI fields carried by full packets and filled from state otherwise
+OI_FIELDS = ('oi', 'oi_day_high', 'oi_day_low')
+
+
+class InstrumentStateStore:
+    """
+    Array-backed last-known state keyed by (exchange_segment_code, security_id)
+    """
+    
+    def __init__(self):
+        self._rows: Dict[Tuple[int, str], int] = {}
+        self._lock = threading.Lock()
+        
+        # State columns, one entry per row
+        self._prev_close = array('d')
+        self._prev_oi = array('q')
+        self._oi = array('q')
+        self._oi_day_high = array('q')
+        self._oi_day_low = array('q')
+        self._oi_columns = {
+            'oi': self._oi,
+            'oi_day_high': self._oi_day_high,
+            'oi_day_low': self._oi_day_low
+        }
+        
+        # Statistics
+        self.oi_packets_folded = 0
+        self.prev_close_packets_folded = 0
+        self.ticks_merged = 0
+        self.prev_close_filled = 0
+        self.oi_filled = 0
+    
+    def _row(self, exchange_segment_code: int, security_id: str) -> int:
+        """Get (or allocate) the state row for an instrument (caller holds the lock)"""
+        key = (exchange_segment_code, security_id)
+        row = self._rows.get(key)
+        if row is None:
+            row = len(self._prev_close)
+            self._rows[key] = row
+            self._prev_close.append(0.0)
+            self._prev_oi.append(0)
+            self._oi.append(0)
+            self._oi_day_high.append(0)
+            self._oi_day_low.append(0)
+        return row
+    
+    def merge(self, tick_data: Dict) -> Optional[Dict]:
+        """
+        Fold a decoded packet into the state
+        
+        Args:
+            tick_data: Dict from dhan_parser.decode_packet()
+        
+        Returns:
+            The packet dict with OI/prev_close filled in for price/volume
+            packets, None for OI and prev-close packets (folded only)
+        """
+        response_code = tick_data.get('response_code')
+        
+        if response_code not in PRICE_PACKETS and response_code not in (RESPONSE_OI, RESPONSE_PREV_CLOSE):
+            return tick_data
+        
+        with self._lock:
+            row = self._row(tick_data['exchange_segment_code'], tick_data['security_id'])
+            
+            if response_code == RESPONSE_OI:
+                if tick_data.get('oi'):
+                    self._oi[row] = tick_data['oi']
+                self.oi_packets_folded += 1
+                return None
+            
+            if response_code == RESPONSE_PREV_CLOSE:
+                if tick_data.get('prev_close'):
+                    self._prev_close[row] = tick_data['prev_close']
+                if tick_data.get('prev_oi'):
+                    self._prev_oi[row] = tick_data['prev_oi']
+                self.prev_close_packets_folded += 1
+                return None
+            
+            # Price/volume packet - update state from what it carries, fill the rest
+            for field in OI_FIELDS:
+                column = self._oi_columns[field]
+                value = tick_data.get(field)
+                if value:
+                    column[row] = value
+                elif column[row]:
+                    tick_data[field] = column[row]
+                    if field == 'oi':
+                        self.oi_filled += 1
+            
+            if not tick_data.get('prev_close') and self._prev_close[row]:
+                tick_data['prev_close'] = self._prev_close[row]
+                self.prev_close_filled += 1
+            if not tick_data.get('prev_oi') and self._prev_oi[row]:
+                tick_data['prev_oi'] = self._prev_oi[row]
+            
+            self.ticks_merged += 1
+            return tick_data
+    
+    def merge_full_batch(self, batch) -> Dict[str, List]:
+        """
+        Fold a columnar full-packet batch into the state
+        
+        Args:
+            batch: Structured array from dhan_columnar.decode_full_batch()
+        
+        Returns:
+            Per-row columns for enrich_full_batch(): 'prev_close' and the
+            OI fields (packet value if positive, else last known, else None)
+        """
+        segments = batch['exchange_segment'].tolist()
+        security_ids = batch['security_id'].tolist()
+        packet_oi = {field: batch[field].tolist() for field in OI_FIELDS}
+        
+        merged: Dict[str, List] = {field: [] for field in OI_FIELDS}
+        merged['prev_close'] = []
+        
+        with self._lock:
+            for i, (segment, security_id) in enumerate(zip(segments, security_ids)):
+                row = self._row(segment, str(security_id))
+                
+                for field in OI_FIELDS:
+                    column = self._oi_columns[field]
+                    value = packet_oi[field][i]
+                    if value > 0:
+                        column[row] = value
+                        merged[field].append(value)
+                    elif column[row]:
+                        merged[field].append(column[row])
+                        if field == 'oi':
+                            self.oi_filled += 1
+                    else:
+                        merged[field].append(None)
+                
+                prev_close = self._prev_close[row]
+                if prev_close:
+                    self.prev_close_filled += 1
+                merged['prev_close'].append(prev_close or None)
+            
+            self.ticks_merged += len(segments)
+        
+        return merged
+    
+    def get_prev_close(self, exchange_segment_code: int, security_id: str) -> Optional[float]:
+        """Last known previous close for an instrument"""
+        with self._lock:
+            row = self._rows.get((exchange_segment_code, security_id))
+            return (self._prev_close[row] or None) if row is not None else None
+    
+    def __len__(self) -> int:
+        return len(self._rows)
+    
+    def get_stats(self) -> Dict:
+        """Get state store statistics"""
+        return {
+            'state_instruments': len(self._rows),
+            'state_oi_packets_folded': self.oi_packets_folded,
+            'state_prev_close_packets_folded': self.prev_close_packets_folded,
+            'state_ticks_merged': self.ticks_merged,
+            'state_prev_close_filled': self.prev_close_filled,
+            'state_oi_filled': self.oi_filled
+        }
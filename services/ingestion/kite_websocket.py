@@ -6,14 +6,19 @@ Manages WebSocket connection to Kite and processes incoming ticks
 import sys
 import time
 import os
+import queue
+import threading
 import structlog
 import requests
-from typing import List, Dict
+from typing import List, Dict, Optional
 from kiteconnect import KiteTicker
-from models import KiteTick, MarketDepth, MarketDepthItem
-from validator import validate_tick
-from enricher import enrich_tick, InstrumentInfo
+from validator import validate_raw_tick
+from enricher import kite_tick_to_record, InstrumentRecord
 from publisher import RabbitMQPublisher
+from batcher import TickBatcher
+from conflator import TickConflator
+from log_config import get_logging_stats
+from metrics import ENRICH_SECONDS
 
 logger = structlog.get_logger()
 
@@ -38,6 +43,16 @@ def send_slack_notification(webhook_url: str, message: str, emoji: str = "🚨")
 class KiteWebSocketHandler:
     """
     Handles KiteConnect WebSocket connection and tick processing
+    
+    on_ticks runs on KiteTicker's reactor thread and only enqueues the raw
+    tick list. A pool of enrichment workers validates and enriches the ticks,
+    and a single publisher thread owns the TickBatcher (and the RabbitMQ
+    channel), so a slow publish never delays the reactor or its heartbeats.
+    
+    Workers can finish tick lists out of order, so each list is numbered as
+    it is dequeued and the publisher thread re-orders by that number before
+    batching: consecutive lists carry the same instruments, and the worker's
+    volume_delta / cvd assume each instrument's ticks arrive in order.
     """
     
     MODE_LTP = "ltp"
@@ -48,14 +63,20 @@ class KiteWebSocketHandler:
     BATCH_SIZE = int(os.getenv("INGESTION_BATCH_SIZE", 500))  # Number of ticks per batch
     BATCH_TIMEOUT = float(os.getenv("INGESTION_BATCH_TIMEOUT", 0.5))  # Seconds before forcing flush
     
+    # Reactor -> enrichment workers -> publisher thread
+    TICK_QUEUE_SIZE = int(os.getenv("KITE_TICK_QUEUE_SIZE", 10000))  # Tick lists buffered before enrichment
+    ENRICH_WORKERS = int(os.getenv("KITE_ENRICH_WORKERS", 2))  # Enrichment worker threads
+    STATS_INTERVAL = 60  # Seconds between statistics log lines
+    
     def __init__(
         self,
         api_key: str,
         access_token: str,
         instruments: List[int],
         publisher: RabbitMQPublisher,
-        instruments_cache: Dict[int, InstrumentInfo],
-        slack_webhook_url: str = ""
+        instruments_cache: Dict[int, InstrumentRecord],
+        slack_webhook_url: str = "",
+        conflator: Optional[TickConflator] = None
     ):
         """
         Initialize WebSocket handler
@@ -67,6 +88,7 @@ class KiteWebSocketHandler:
             publisher: RabbitMQ publisher instance
             instruments_cache: Dictionary of instrument metadata
             slack_webhook_url: Optional Slack webhook for error notifications
+            conflator: Optional backlog conflation stage applied before publishing
         """
         self.api_key = api_key
         self.access_token = access_token
@@ -74,21 +96,51 @@ class KiteWebSocketHandler:
         self.publisher = publisher
         self.instruments_cache = instruments_cache
         self.slack_webhook_url = slack_webhook_url
+        self.conflator = conflator
         
         # Statistics
         self.tick_count = 0
         self.valid_tick_count = 0
         self.invalid_tick_count = 0
-        self.published_count = 0
         self.start_time = time.time()
+        self.is_connected = False
+        
+        # Batch publishing (publisher thread only)
+        self.batcher = TickBatcher(
+            publisher,
+            batch_size=self.BATCH_SIZE,
+            batch_timeout=self.BATCH_TIMEOUT,
+            conflator=conflator,
+            source='kite'
+        )
         
-        # Batch publishing
-        self.tick_buffer = []
-        self.last_publish_time = time.time()
-        self.batch_publish_count = 0
+        # Processing pipeline
+        self._tick_queue: queue.Queue = queue.Queue(maxsize=self.TICK_QUEUE_SIZE)
+        self._publish_queue: queue.Queue = queue.Queue(maxsize=self.TICK_QUEUE_SIZE)
+        self._workers: List[threading.Thread] = []
+        self._publisher_thread = None
+        self._dequeue_lock = threading.Lock()
+        self._dequeued = 0  # Sequence number of the next tick list taken off _tick_queue
+        self._stats_lock = threading.Lock()
+        
+        # Pipeline metrics
+        self.dropped_tick_lists = 0
+        self.dropped_ticks = 0
+        self.callback_count = 0
+        self.callback_total_seconds = 0.0
+        self.callback_max_seconds = 0.0
+        self.callback_last_seconds = 0.0
+        self.lag_samples = 0
+        self.reordered_tick_lists = 0
+        self.reorder_max_pending = 0
+        self.queue_lag_total_seconds = 0.0
+        self.queue_lag_max_seconds = 0.0
+        self.queue_lag_last_seconds = 0.0
+        self._enrich_seconds = ENRICH_SECONDS.labels(source='kite')
         
         # Reconnection settings
         self.reconnect_attempts = 0
+        self.reconnects_total = 0
         self.max_reconnect_attempts = 10
         self.reconnect_delay = 5  # Initial delay in seconds
         self.max_reconnect_delay = 60
@@ -127,6 +179,7 @@ class KiteWebSocketHandler:
             response=response,
             instruments_count=len(self.instruments)
         )
+        self.is_connected = True
         
         try:
             # Subscribe to instruments in FULL mode to get market depth
@@ -147,79 +200,60 @@ class KiteWebSocketHandler:
     
     def on_ticks(self, ws, ticks):
         """
-        Callback when ticks are received
+        Callback when ticks are received (KiteTicker reactor thread)
         
-        Process each tick:
-        1. Parse into KiteTick model
-        2. Validate data quality
-        3. Enrich with metadata and derived metrics
-        4. Publish to RabbitMQ
+        Only enqueues the raw tick list; enrichment workers and the publisher
+        thread do the rest. If the queue is full the oldest list is dropped so
+        the reactor never blocks.
         """
+        received_at = time.perf_counter()
         self.tick_count += len(ticks)
         
+        try:
+            self._tick_queue.put_nowait((ticks, received_at))
+        except queue.Full:
+            try:
+                dropped, _ = self._tick_queue.get_nowait()
+                self.dropped_tick_lists += 1
+                self.dropped_ticks += len(dropped)
+                if self.dropped_tick_lists % 100 == 1:
+                    logger.warning(
+                        "tick_queue_full",
+                        dropped_tick_lists=self.dropped_tick_lists,
+                        dropped_ticks=self.dropped_ticks
+                    )
+            except queue.Empty:
+                pass
+            self._tick_queue.put_nowait((ticks, received_at))
+        
+        elapsed = time.perf_counter() - received_at
+        self.callback_count += 1
+        self.callback_last_seconds = elapsed
+        self.callback_total_seconds += elapsed
+        if elapsed > self.callback_max_seconds:
+            self.callback_max_seconds = elapsed
+    
+    def _enrich_ticks(self, ticks: List[dict]) -> List[dict]:
+        """
+        Validate and enrich one raw tick list (enrichment worker)
+        
+        Returns:
+            Enriched tick dicts ready for publishing
+        """
+        start = time.perf_counter()
+        enriched = []
+        invalid = 0
+        
         for raw_tick_data in ticks:
             try:
-                # Parse depth data if present
-                depth = None
-                if 'depth' in raw_tick_data and raw_tick_data['depth']:
-                    depth_data = raw_tick_data['depth']
-                    
-                    # Parse buy side
-                    buy_depth = [
-                        MarketDepthItem(
-                            quantity=item.get('quantity', 0),
-                            price=item.get('price', 0.0),
-                            orders=item.get('orders', 0)
-                        )
-                        for item in depth_data.get('buy', [])
-                    ]
-                    
-                    # Parse sell side
-                    sell_depth = [
-                        MarketDepthItem(
-                            quantity=item.get('quantity', 0),
-                            price=item.get('price', 0.0),
-                            orders=item.get('orders', 0)
-                        )
-                        for item in depth_data.get('sell', [])
-                    ]
-                    
-                    depth = MarketDepth(buy=buy_depth, sell=sell_depth)
-                
-                # Create KiteTick model
-                # Field names match exactly what KiteTicker library returns
-                tick = KiteTick(
-                    tradable=raw_tick_data.get('tradable', True),
-                    mode=raw_tick_data.get('mode', 'quote'),
-                    instrument_token=raw_tick_data['instrument_token'],
-                    last_price=raw_tick_data.get('last_price'),
-                    last_traded_quantity=raw_tick_data.get('last_traded_quantity'),
-                    average_traded_price=raw_tick_data.get('average_traded_price'),
-                    volume_traded=raw_tick_data.get('volume_traded'),
-                    total_buy_quantity=raw_tick_data.get('total_buy_quantity'),
-                    total_sell_quantity=raw_tick_data.get('total_sell_quantity'),
-                    ohlc=raw_tick_data.get('ohlc'),
-                    change=raw_tick_data.get('change'),
-                    last_trade_time=raw_tick_data.get('last_trade_time'),
-                    timestamp=raw_tick_data.get('timestamp') or raw_tick_data.get('exchange_timestamp'),
-                    oi=raw_tick_data.get('oi'),
-                    oi_day_high=raw_tick_data.get('oi_day_high'),
-                    oi_day_low=raw_tick_data.get('oi_day_low'),
-                    depth=depth
-                )
-                
-                # Validate tick
-                if not validate_tick(tick):
-                    self.invalid_tick_count += 1
+                # Validate once at the boundary on the raw dict
+                if not validate_raw_tick(raw_tick_data):
+                    invalid += 1
                     continue
                 
-                self.valid_tick_count += 1
-                
-                # Enrich tick with metadata and derived metrics
-                enriched_tick = enrich_tick(tick, self.instruments_cache)
-                
-                # Add to batch buffer
-                self.tick_buffer.append(enriched_tick.to_dict())
+                # Enrich straight into a slots record (no pydantic models on the hot path)
+                record = kite_tick_to_record(raw_tick_data, self.instruments_cache)
+                enriched.append(record.to_dict())
             
             except Exception as e:
                 logger.error(
@@ -227,20 +261,122 @@ class KiteWebSocketHandler:
                     error=str(e),
                     instrument_token=raw_tick_data.get('instrument_token')
                 )
-                self.invalid_tick_count += 1
+                invalid += 1
+        
+        self._enrich_seconds.observe(time.perf_counter() - start)
+        with self._stats_lock:
+            self.valid_tick_count += len(enriched)
+            self.invalid_tick_count += invalid
+        
+        return enriched
+    
+    def _enrich_loop(self):
+        """Enrichment worker: drain tick lists, enrich, hand to the publisher thread"""
+        while True:
+            # Sequence follows queue order; the publisher thread re-orders by it
+            with self._dequeue_lock:
+                item = self._tick_queue.get()
+                sequence = self._dequeued
+                self._dequeued += 1
+            if item is None:
+                break
+            
+            ticks, received_at = item
+            lag = time.perf_counter() - received_at
+            received_epoch = time.time() - lag
+            with self._stats_lock:
+                self.lag_samples += 1
+                self.queue_lag_last_seconds = lag
+                self.queue_lag_total_seconds += lag
+                self.queue_lag_max_seconds = max(self.queue_lag_max_seconds, lag)
+            
+            enriched = self._enrich_ticks(ticks)
+            # Handed on even when empty, so the publisher never waits on a missing sequence.
+            # Blocks while the publisher is behind; on_ticks then drops oldest
+            self._publish_queue.put((sequence, enriched, received_epoch))
+    
+    def _publish_loop(self):
+        """Publisher thread: sole user of the batcher and the RabbitMQ channel"""
+        last_stats_time = time.time()
+        
+        # Tick lists that finished enrichment ahead of an earlier one, by sequence
+        pending: Dict[int, tuple] = {}
+        next_sequence = 0
+        
+        while True:
+            try:
+                item = self._publish_queue.get(timeout=self.batcher.batch_timeout)
+            except queue.Empty:
+                item = []
+            
+            if item is None:
+                break
+            
+            if item:
+                sequence, enriched, received_at = item
+                pending[sequence] = (enriched, received_at)
+                if sequence != next_sequence:
+                    self.reordered_tick_lists += 1
+                    self.reorder_max_pending = max(self.reorder_max_pending, len(pending))
+                
+                # Batch in reception order
+                while next_sequence in pending:
+                    enriched, received_at = pending.pop(next_sequence)
+                    next_sequence += 1
+                    if enriched:
+                        self.batcher.extend(enriched, received_at)
+            else:
+                self.batcher.flush_if_due()
+            
+            if time.time() - last_stats_time >= self.STATS_INTERVAL:
+                last_stats_time = time.time()
+                self._log_statistics()
+        
+        flushed = self.batcher.flush()
+        logger.info("flushed_remaining_ticks_on_stop", count=flushed)
+    
+    def _start_pipeline(self):
+        """Start enrichment workers and the publisher thread"""
+        if self._publisher_thread is not None:
+            return
+        
+        self._dequeued = 0
+        self._publisher_thread = threading.Thread(target=self._publish_loop, name="kite-publisher", daemon=True)
+        self._publisher_thread.start()
+        
+        for i in range(max(1, self.ENRICH_WORKERS)):
+            worker = threading.Thread(target=self._enrich_loop, name=f"kite-enrich-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
         
-        # Check if we should flush batch
-        should_flush = (
-            len(self.tick_buffer) >= self.BATCH_SIZE or
-            (time.time() - self.last_publish_time) >= self.BATCH_TIMEOUT
+        logger.info(
+            "kite_pipeline_started",
+            enrich_workers=len(self._workers),
+            tick_queue_size=self.TICK_QUEUE_SIZE
         )
+    
+    def _stop_pipeline(self, timeout: float = 10.0):
+        """Drain queued ticks, stop the threads and flush the final batch"""
+        if self._publisher_thread is None:
+            return
         
-        if should_flush and self.tick_buffer:
-            self._flush_tick_buffer()
+        # Sentinels queue up behind pending tick lists, so those are processed first
+        for _ in self._workers:
+            try:
+                self._tick_queue.put(None, timeout=timeout)
+            except queue.Full:
+                logger.warning("tick_queue_full_on_stop", pending=self._tick_queue.qsize())
+        for worker in self._workers:
+            worker.join(timeout)
         
-        # Log statistics every 100 ticks
-        if self.tick_count % 100 == 0:
-            self._log_statistics()
+        try:
+            self._publish_queue.put(None, timeout=timeout)
+        except queue.Full:
+            logger.warning("publish_queue_full_on_stop", pending=self._publish_queue.qsize())
+        self._publisher_thread.join(timeout)
+        
+        self._workers = []
+        self._publisher_thread = None
     
     def on_close(self, ws, code, reason):
         """Callback when WebSocket connection is closed"""
@@ -249,12 +385,9 @@ class KiteWebSocketHandler:
             code=code,
             reason=reason
         )
+        self.is_connected = False
         
-        # Flush remaining ticks before closing
-        if self.tick_buffer:
-            logger.info("flushing_remaining_ticks_on_close", count=len(self.tick_buffer))
-            self._flush_tick_buffer()
-        
+        # Pipeline keeps running across KiteTicker reconnects; stop() flushes
         self._log_statistics()
     
     def on_error(self, ws, code, reason):
@@ -296,6 +429,7 @@ class KiteWebSocketHandler:
     def on_reconnect(self, ws, attempts_count):
         """Callback when WebSocket attempts to reconnect"""
         self.reconnect_attempts = attempts_count
+        self.reconnects_total += 1
         
         logger.info(
             "websocket_reconnecting",
@@ -311,49 +445,10 @@ class KiteWebSocketHandler:
         )
         
         # Flush remaining ticks before crashing
-        if self.tick_buffer:
-            logger.info("flushing_remaining_ticks_before_crash", count=len(self.tick_buffer))
-            self._flush_tick_buffer()
+        self._stop_pipeline()
         
         sys.exit(1)
     
-    def _flush_tick_buffer(self):
-        """Flush buffered ticks to RabbitMQ"""
-        if not self.tick_buffer:
-            return
-        
-        buffer_to_publish = self.tick_buffer.copy()
-        batch_size = len(buffer_to_publish)
-        
-        try:
-            # Publish batch to RabbitMQ
-            success_count = self.publisher.publish_batch(buffer_to_publish)
-            
-            if success_count > 0:
-                self.published_count += success_count
-                self.batch_publish_count += 1
-                self.tick_buffer = []
-                self.last_publish_time = time.time()
-                
-                logger.debug(
-                    "batch_published",
-                    batch_size=batch_size,
-                    successful=success_count,
-                    total_batches=self.batch_publish_count
-                )
-            else:
-                logger.warning(
-                    "batch_publish_failed",
-                    batch_size=batch_size
-                )
-        
-        except Exception as e:
-            logger.error(
-                "batch_publish_error",
-                error=str(e),
-                batch_size=batch_size
-            )
-    
     def _log_statistics(self):
         """Log ingestion statistics"""
         elapsed_time = time.time() - self.start_time
@@ -364,13 +459,50 @@ class KiteWebSocketHandler:
             total_ticks=self.tick_count,
             valid_ticks=self.valid_tick_count,
             invalid_ticks=self.invalid_tick_count,
-            published_ticks=self.published_count,
-            batch_count=self.batch_publish_count,
             elapsed_seconds=round(elapsed_time, 2),
             ticks_per_second=round(tps, 2),
-            buffered_ticks=len(self.tick_buffer)
+            **self.get_pipeline_stats(),
+            **self.batcher.get_stats(),
+            **self.publisher.get_stats(),
+            **get_logging_stats()
         )
     
+    def get_stats(self) -> Dict:
+        """
+        Combined connection, pipeline, batching and publishing statistics
+        Kite delivers parsed ticks, so each tick counts as one received packet
+        """
+        with self._stats_lock:
+            valid, invalid = self.valid_tick_count, self.invalid_tick_count
+        
+        return {
+            'is_connected': self.is_connected,
+            'packets_received': self.tick_count,
+            'packets_parsed': valid,
+            'packets_failed': invalid,
+            'reconnects_total': self.reconnects_total,
+            **self.get_pipeline_stats(),
+            **self.batcher.get_stats(),
+            **self.publisher.get_stats()
+        }
+    
+    def get_pipeline_stats(self) -> Dict:
+        """Get reactor callback and queue lag statistics"""
+        return {
+            'tick_queue_depth': self._tick_queue.qsize(),
+            'publish_queue_depth': self._publish_queue.qsize(),
+            'dropped_tick_lists': self.dropped_tick_lists,
+            'dropped_ticks': self.dropped_ticks,
+            'reordered_tick_lists': self.reordered_tick_lists,
+            'reorder_max_pending': self.reorder_max_pending,
+            'callback_last_us': round(self.callback_last_seconds * 1e6, 1),
+            'callback_avg_us': round(self.callback_total_seconds / self.callback_count * 1e6, 1) if self.callback_count else 0,
+            'callback_max_us': round(self.callback_max_seconds * 1e6, 1),
+            'queue_lag_last_ms': round(self.queue_lag_last_seconds * 1000, 2),
+            'queue_lag_avg_ms': round(self.queue_lag_total_seconds / self.lag_samples * 1000, 2) if self.lag_samples else 0,
+            'queue_lag_max_ms': round(self.queue_lag_max_seconds * 1000, 2)
+        }
+    
     def start(self):
         """
         Start WebSocket connection with auto-reconnect
@@ -378,9 +510,14 @@ class KiteWebSocketHandler:
         """
         logger.info("starting_websocket_connection")
         
+        self._start_pipeline()
+        
         try:
             # Start ticker (blocking)
             self.kws.connect(threaded=False)
+            
+            # Reactor stopped - flush whatever is still in flight
+            self._stop_pipeline()
         
         except KeyboardInterrupt:
             logger.info("websocket_interrupted_by_user")
@@ -395,14 +532,12 @@ class KiteWebSocketHandler:
         logger.info("stopping_websocket_connection")
         
         try:
-            # Flush remaining ticks
-            if self.tick_buffer:
-                logger.info("flushing_remaining_ticks_on_stop", count=len(self.tick_buffer))
-                self._flush_tick_buffer()
-            
             if self.kws:
                 self.kws.close()
             
+            # Drain queued ticks and flush remaining batch
+            self._stop_pipeline()
+            
             self._log_statistics()
             
             logger.info("websocket_stopped")
@@ -7,6 +7,22 @@ Environment Variables:
     KITE_API_KEY: For Kite source
     DHAN_API_KEY: For Dhan source (legacy)
     DHAN_CLIENT_ID: For Dhan source (legacy)
+    DHAN_DECODE_MODE: "dict" (default) or "numpy" (columnar full-packet decoding)
+    DHAN_HANDOFF_QUEUE_SIZE: Frames buffered between receive loop and processing thread (0 = inline)
+    DHAN_OVERFLOW_POLICY: "block" (default), "drop_oldest" or "conflate" when the hand-off queue is full
+    INGESTION_CONFLATION_ENABLED: "true" to conflate ticks per instrument while the RabbitMQ backlog is high
+    INGESTION_WIRE_FORMAT: "json" (default) or "binary" (columnar tick batches; smaller, not faster to decode for Dhan)
+    INGESTION_PUBLISHER: "blocking" (default) or "async" (pipelined publisher confirms)
+    TICK_QUEUE_PARTITIONS: Number of instrument-partitioned tick queues (1 = single ticks_queue)
+    INGESTION_COMPRESSION: "none" (default), "zlib" or "lz4" for batches over INGESTION_COMPRESSION_MIN_BYTES
+    INGESTION_SPOOL_DIR: Directory for the publish spool used while RabbitMQ is unreachable (empty = disabled)
+    INSTRUMENTS_SNAPSHOT_PATH: Instruments snapshot file for warm starts, checked against instruments_version (empty = disabled)
+    INGESTION_METRICS_PORT: Port for the Prometheus /metrics endpoint (0 = disabled)
+    INGESTION_TRACE_ENABLED: "true" (default) to send x-tick-trace hop timestamps with every batch
+    LOG_RATE_LIMIT: Log lines per second per event name (0 = unlimited); extra lines are reported as suppressed=N
+    LOG_SAMPLE_RATES: "event=N,..." keeps 1 in N lines of the named events
+    LOG_QUEUE_SIZE: Lines buffered for the log writer thread (0 = write inline)
+    LOG_SUMMARY_INTERVAL: Seconds between publisher_summary lines
 """
 
 import sys
@@ -14,15 +30,29 @@ import os
 import signal
 import time
 import asyncio
-import logging
 import structlog
 import redis
 from config import config
+from log_config import configure_logging, get_logging_stats
 from publisher import RabbitMQPublisher
-from enricher import load_instruments_cache, dhan_tick_to_enriched
+from async_publisher import AsyncRabbitMQPublisher
+from batcher import TickBatcher
+from conflator import TickConflator
+from instrument_state import InstrumentStateStore
+from metrics import ENRICH_SECONDS, register_stats, start_metrics_server
+from enricher import (
+    load_instruments_cache,
+    dhan_tick_to_record,
+    dhan_exchange_segment,
+    get_security_id_index_stats
+)
 
 # Conditional imports based on data source
 DATA_SOURCE = os.getenv('DATA_SOURCE', 'kite').lower()
+DHAN_DECODE_MODE = os.getenv('DHAN_DECODE_MODE', 'dict').lower()
+DHAN_HANDOFF_QUEUE_SIZE = int(os.getenv('DHAN_HANDOFF_QUEUE_SIZE', 10000))
+DHAN_OVERFLOW_POLICY = os.getenv('DHAN_OVERFLOW_POLICY', 'block').lower()
+INGESTION_PUBLISHER = os.getenv('INGESTION_PUBLISHER', 'blocking').lower()
 
 if DATA_SOURCE == 'dhan':
     from dhan_auth import get_dhan_credentials, get_websocket_url
@@ -33,20 +63,8 @@ else:
     from kite_websocket import KiteWebSocketHandler
     logger_context = {"data_source": "kite"}
 
-# Configure structured logging
-structlog.configure(
-    processors=[
-        structlog.processors.TimeStamper(fmt="iso"),
-        structlog.processors.add_log_level,
-        structlog.processors.StackInfoRenderer(),
-        structlog.dev.set_exc_info,
-        structlog.processors.JSONRenderer()
-    ],
-    wrapper_class=structlog.make_filtering_bound_logger(getattr(logging, config.LOG_LEVEL.upper())),
-    context_class=dict,
-    logger_factory=structlog.PrintLoggerFactory(),
-    cache_logger_on_first_use=False
-)
+# Configure structured logging (rate limited, queued writer - see log_config.py)
+configure_logging(config.LOG_LEVEL)
 
 logger = structlog.get_logger()
 
@@ -54,34 +72,133 @@ logger = structlog.get_logger()
 websocket_handler = None
 publisher = None
 dhan_websocket_client = None
+dhan_batcher = None
+dhan_state = InstrumentStateStore()
 
+# Seconds between Dhan ingestion statistics log lines
+DHAN_STATS_INTERVAL = 60
 
-def on_dhan_tick(tick_data: dict):
-    """
-    Callback for Dhan ticks
-    Enriches and publishes to RabbitMQ
+# Enrichment latency per frame (dict and columnar paths)
+dhan_enrich_seconds = ENRICH_SECONDS.labels(source='dhan')
+
+
+def enrich_dhan_tick(tick_data: dict):
     """
-    global publisher, instruments_cache
+    Merge and enrich one decoded Dhan packet
     
+    Returns:
+        Enriched tick dict, or None for state-only packets and unknown instruments
+    """
     try:
-        from models import DhanTick
+        # Fold OI/prev-close packets into instrument state; only price/volume
+        # packets come back (with OI and prev_close filled in)
+        tick_data = dhan_state.merge(tick_data)
+        if tick_data is None:
+            return None
         
-        # Parse tick into DhanTick model
-        dhan_tick = DhanTick(**tick_data)
+        # Enrich the decoded packet straight into a slots record
+        # (None if the security_id is not in the cache)
+        record = dhan_tick_to_record(tick_data, instruments_cache)
+        return record.to_dict() if record else None
+    
+    except Exception as e:
+        logger.error("dhan_tick_processing_error", error=str(e))
+        return None
+
+
+def on_dhan_ticks(ticks: list):
+    """
+    Callback for all ticks of one Dhan frame
+    Enriches and buffers them for batched publishing to RabbitMQ
+    """
+    start = time.perf_counter()
+    enriched = [tick for tick in map(enrich_dhan_tick, ticks) if tick is not None]
+    dhan_enrich_seconds.observe(time.perf_counter() - start)
+    
+    if enriched and dhan_batcher:
+        dhan_batcher.extend(enriched, dhan_websocket_client.frame_received_at if dhan_websocket_client else None)
+
+
+def on_dhan_tick(tick_data: dict):
+    """Callback for a single Dhan tick (same path as a one-tick frame)"""
+    on_dhan_ticks([tick_data])
+
+
+def on_dhan_full_batch(batch):
+    """
+    Callback for a burst of Dhan full packets (DHAN_DECODE_MODE=numpy)
+    Enriches the structured array column-wise and buffers for batched publishing
+    """
+    try:
+        from dhan_columnar import enrich_full_batch
         
-        # Enrich tick
-        enriched = dhan_tick_to_enriched(dhan_tick, instruments_cache)
+        start = time.perf_counter()
+        records = enrich_full_batch(batch, instruments_cache, dhan_state.merge_full_batch(batch))
+        dhan_enrich_seconds.observe(time.perf_counter() - start)
         
-        if enriched:
-            # Publish to RabbitMQ
-            if publisher:
-                publisher.publish(enriched.model_dump())
-        else:
-            # Log if enrichment failed (security_id not found)
-            pass
+        if records and dhan_batcher:
+            dhan_batcher.extend(records, dhan_websocket_client.frame_received_at if dhan_websocket_client else None)
     
     except Exception as e:
-        logger.error("dhan_tick_processing_error", error=str(e))
+        logger.error("dhan_full_batch_processing_error", error=str(e), batch_size=len(batch))
+
+
+def create_publisher() -> RabbitMQPublisher:
+    """RabbitMQ publisher selected by INGESTION_PUBLISHER"""
+    if INGESTION_PUBLISHER == 'async':
+        return AsyncRabbitMQPublisher(config.RABBITMQ_URL)
+    if INGESTION_PUBLISHER != 'blocking':
+        raise ValueError(f"Invalid INGESTION_PUBLISHER: {INGESTION_PUBLISHER}. Must be one of: blocking, async")
+    return RabbitMQPublisher(config.RABBITMQ_URL)
+
+
+def create_conflator(publisher: RabbitMQPublisher):
+    """Backlog conflation stage if INGESTION_CONFLATION_ENABLED, else None"""
+    if not TickConflator.ENABLED:
+        return None
+    
+    conflator = TickConflator(publisher)
+    logger.info(
+        "conflation_enabled",
+        threshold=conflator.threshold,
+        resume_depth=conflator.resume_depth,
+        interval=conflator.interval
+    )
+    return conflator
+
+
+def get_dhan_stats() -> dict:
+    """Combined Dhan connection and batching statistics"""
+    stats = {}
+    if dhan_websocket_client:
+        stats.update(dhan_websocket_client.get_stats())
+    if dhan_batcher:
+        stats.update(dhan_batcher.get_stats())
+    stats.update(dhan_state.get_stats())
+    if publisher:
+        stats.update(publisher.get_stats())
+    stats.update({f"index_{k}": v for k, v in get_security_id_index_stats().items()})
+    stats.update(get_logging_stats())
+    return stats
+
+
+async def dhan_flush_timer():
+    """
+    Flush the Dhan batch on a timer even when no ticks arrive
+    In hand-off mode the processing thread does this via on_idle, so the
+    event loop never runs a blocking publish
+    """
+    last_stats_time = time.time()
+    
+    while True:
+        await asyncio.sleep(dhan_batcher.batch_timeout)
+        
+        if not dhan_websocket_client.handoff_enabled:
+            dhan_batcher.flush_if_due()
+        
+        if time.time() - last_stats_time >= DHAN_STATS_INTERVAL:
+            logger.info("dhan_ingestion_statistics", **get_dhan_stats())
+            last_stats_time = time.time()
 
 
 def on_dhan_connect():
@@ -100,18 +217,17 @@ def on_dhan_close(code: int, reason: str):
 
 
 def signal_handler(signum, frame):
-    """Handle shutdown signals gracefully"""
-    global websocket_handler, dhan_websocket_client
-    
+    """
+    Handle shutdown signals gracefully (Kite; while the Dhan event loop runs,
+    its own handlers in run_dhan take over)
+    """
     logger.info(
         "shutdown_signal_received",
         signal=signal.Signals(signum).name
     )
     
-    # Stop WebSocket based on data source
-    if DATA_SOURCE == 'dhan' and dhan_websocket_client:
-        asyncio.run(dhan_websocket_client.disconnect())
-    elif websocket_handler:
+    # Stop WebSocket
+    if websocket_handler:
         websocket_handler.stop()
     
     # Close publisher
@@ -124,7 +240,7 @@ def signal_handler(signum, frame):
 
 def main():
     """Main entry point for ingestion service"""
-    global websocket_handler, publisher, dhan_websocket_client, instruments_cache
+    global websocket_handler, publisher, dhan_websocket_client, dhan_batcher, instruments_cache
     
     # Register signal handlers
     signal.signal(signal.SIGINT, signal_handler)
@@ -183,7 +299,9 @@ def main():
         
         # Load instruments cache from database
         logger.info("loading_instruments_cache_from_database")
+        load_start = time.perf_counter()
         instruments_cache = load_instruments_cache(config.DATABASE_URL, redis_client)
+        load_ms = round((time.perf_counter() - load_start) * 1000, 1)
         
         if not instruments_cache:
             logger.warning(
@@ -193,13 +311,20 @@ def main():
         else:
             logger.info(
                 "instruments_cache_loaded",
-                count=len(instruments_cache)
+                count=len(instruments_cache),
+                load_ms=load_ms
             )
         
         # Initialize RabbitMQ publisher
         logger.info("initializing_rabbitmq_publisher")
-        publisher = RabbitMQPublisher(config.RABBITMQ_URL)
-        logger.info("rabbitmq_publisher_ready")
+        publisher = create_publisher()
+        if isinstance(publisher, AsyncRabbitMQPublisher) and DATA_SOURCE != 'dhan':
+            # Kite has no event loop of its own - run the publisher on a loop thread
+            publisher.start()
+        logger.info("rabbitmq_publisher_ready", publisher=INGESTION_PUBLISHER)
+        
+        # Prometheus /metrics (collectors are registered once the feed handler exists)
+        start_metrics_server()
         
         # Initialize WebSocket based on data source
         if DATA_SOURCE == 'dhan':
@@ -207,27 +332,8 @@ def main():
             dhan_instruments = []
             for token, info in instruments_cache.items():
                 if info.security_id and info.source == 'dhan':
-                    # Map exchange to Dhan exchange segment based on exchange AND instrument_type
-                    # Reference: https://dhanhq.co/docs/v2/annexure/#exchange-segment
-                    if info.exchange == 'NSE':
-                        # Options and Futures trade on NSE F&O (segment 2)
-                        if info.instrument_type in ('CE', 'PE', 'FUT'):
-                            exchange_segment = 2  # NSE_FNO
-                        else:
-                            exchange_segment = 1  # NSE_EQ
-                    elif info.exchange == 'BSE':
-                        if info.instrument_type in ('CE', 'PE', 'FUT'):
-                            exchange_segment = 8  # BSE_FNO
-                        else:
-                            exchange_segment = 4  # BSE_EQ
-                    elif info.exchange == 'MCX':
-                        exchange_segment = 5  # MCX_COMM
-                    elif info.exchange in ('CDS', 'NSE_CURRENCY'):
-                        exchange_segment = 3  # NSE_CURRENCY
-                    elif info.exchange in ('BCD', 'BSE_CURRENCY'):
-                        exchange_segment = 7  # BSE_CURRENCY
-                    else:
-                        exchange_segment = 2  # Default to NSE_FNO
+                    # Same mapping the enricher's security_id index is keyed on
+                    exchange_segment = dhan_exchange_segment(info)
                     
                     dhan_instruments.append({
                         'security_id': info.security_id,
@@ -244,23 +350,59 @@ def main():
                 logger.error("no_dhan_instruments_found", message="No active Dhan instruments in database")
                 sys.exit(1)
             
+            # Batch Dhan ticks the same way the Kite handler does
+            dhan_batcher = TickBatcher(publisher, conflator=create_conflator(publisher), source='dhan')
+            logger.info(
+                "dhan_batcher_initialized",
+                batch_size=dhan_batcher.batch_size,
+                batch_timeout=dhan_batcher.batch_timeout
+            )
+            
             # Initialize Dhan WebSocket client
             logger.info("initializing_dhan_websocket_client")
             dhan_websocket_client = DhanWebSocketClient(
                 on_tick=on_dhan_tick,
+                on_batch=on_dhan_ticks,
+                on_full_batch=on_dhan_full_batch if DHAN_DECODE_MODE == 'numpy' else None,
+                decode_mode=DHAN_DECODE_MODE,
                 on_connect=on_dhan_connect,
                 on_error=on_dhan_error,
-                on_close=on_dhan_close
+                on_close=on_dhan_close,
+                handoff_queue_size=DHAN_HANDOFF_QUEUE_SIZE,
+                overflow_policy=DHAN_OVERFLOW_POLICY,
+                on_idle=dhan_batcher.flush_if_due,
+                idle_interval=dhan_batcher.batch_timeout
             )
             
             logger.info("dhan_websocket_client_initialized")
+            
+            register_stats('dhan', get_dhan_stats)
             logger.info("starting_dhan_websocket_connection")
             
             # Start Dhan connection (async)
             async def run_dhan():
+                loop = asyncio.get_running_loop()
+                if isinstance(publisher, AsyncRabbitMQPublisher):
+                    # Publish on the Dhan client's event loop
+                    publisher.start(loop)
+                
+                # Shutdown signals run on the loop: stop the client, and the finally
+                # below flushes the batcher and closes the publisher
+                stop_tasks = []
+                
+                def on_stop_signal(signum):
+                    logger.info("shutdown_signal_received", signal=signal.Signals(signum).name)
+                    stop_tasks.append(loop.create_task(dhan_websocket_client.disconnect()))
+                
+                for signum in (signal.SIGINT, signal.SIGTERM):
+                    loop.add_signal_handler(signum, on_stop_signal, signum)
+                
                 # Start connection
                 connect_task = asyncio.create_task(dhan_websocket_client.start())
                 
+                # Timer-driven flush of buffered ticks
+                flush_task = asyncio.create_task(dhan_flush_timer())
+                
                 # Wait for connection
                 await asyncio.sleep(2)
                 
@@ -276,7 +418,16 @@ def main():
                         logger.error("subscription_failed", error=str(e))
                 
                 # Keep running
-                await connect_task
+                try:
+                    await connect_task
+                finally:
+                    flush_task.cancel()
+                    dhan_websocket_client.stop_processing_thread()
+                    flushed = dhan_batcher.flush()
+                    logger.info("flushed_remaining_ticks_on_stop", count=flushed)
+                    logger.info("dhan_ingestion_statistics", **get_dhan_stats())
+                    if isinstance(publisher, AsyncRabbitMQPublisher):
+                        await publisher.aclose()
             
             # Run async event loop
             asyncio.run(run_dhan())
@@ -294,11 +445,14 @@ def main():
                 instruments=config.INSTRUMENTS,
                 publisher=publisher,
                 instruments_cache=instruments_cache,
-                slack_webhook_url=config.SLACK_WEBHOOK_URL
+                slack_webhook_url=config.SLACK_WEBHOOK_URL,
+                conflator=create_conflator(publisher)
             )
             
             logger.info("websocket_handler_initialized")
             
+            register_stats('kite', websocket_handler.get_stats)
+            
             # Start WebSocket (blocking call)
             logger.info("starting_websocket_connection")
             websocket_handler.start()
@@ -0,0 +1,260 @@
+"""
+Prometheus Metrics
+Embedded /metrics endpoint for the ingestion service (INGESTION_METRICS_PORT)
+
+Hot-path code only observes histograms, once per frame / tick list / batch,
+through label children bound up front. Counters the components already keep
+(packets, reconnects, queue depths, published ticks) are read from their
+get_stats() when Prometheus scrapes, so they cost nothing between scrapes.
+"""
+
+import os
+import time
+import threading
+import structlog
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional
+
+from prometheus_client import Histogram, REGISTRY, start_http_server
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from dhan_parser import IST
+
+logger = structlog.get_logger()
+
+METRICS_PORT = int(os.getenv("INGESTION_METRICS_PORT", 9108))  # 0 = disabled
+
+# Per-frame / per-batch work is sub-millisecond normally, seconds when stalled
+LATENCY_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0
+)
+BATCH_SIZE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+LAG_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+PARSE_SECONDS = Histogram(
+    'ingestion_parse_seconds',
+    'Time to split and decode one WebSocket frame',
+    ['source'],
+    buckets=LATENCY_BUCKETS
+)
+ENRICH_SECONDS = Histogram(
+    'ingestion_enrich_seconds',
+    'Time to validate/merge and enrich one tick list or decoded frame',
+    ['source'],
+    buckets=LATENCY_BUCKETS
+)
+PUBLISH_SECONDS = Histogram(
+    'ingestion_publish_seconds',
+    'Time spent in publish_batch for one batch (encode, compress, publish or spool)',
+    buckets=LATENCY_BUCKETS
+)
+BATCH_SIZE = Histogram(
+    'ingestion_batch_size_ticks',
+    'Ticks per published batch',
+    buckets=BATCH_SIZE_BUCKETS
+)
+TICK_LAG_SECONDS = Histogram(
+    'ingestion_tick_lag_seconds',
+    'Exchange last_trade_time to publish lag per tick',
+    ['segment'],
+    buckets=LAG_BUCKETS
+)
+
+# Stats keys exported as counters: key -> (metric, help)
+STATS_COUNTERS = {
+    'packets_received': ('ingestion_packets_received', 'Packets (Dhan) or ticks (Kite) received from the WebSocket'),
+    'packets_parsed': ('ingestion_packets_parsed', 'Packets decoded (Dhan) or ticks that passed validation (Kite)'),
+    'packets_failed': ('ingestion_packets_failed', 'Packets that failed to decode (Dhan) or validate (Kite)'),
+    'reconnects_total': ('ingestion_reconnects', 'WebSocket reconnect attempts'),
+    'published_ticks': ('ingestion_published_ticks', 'Ticks accepted by the publisher'),
+    'failed_ticks': ('ingestion_failed_ticks', 'Ticks in batches the publisher rejected'),
+    'published_bytes': ('ingestion_published_bytes', 'Message body bytes published'),
+    'dropped_ticks': ('ingestion_dropped_ticks', 'Ticks dropped because the Kite tick queue was full'),
+    'queue_frames_dropped': ('ingestion_dropped_frames', 'Frames dropped from the Dhan hand-off queue'),
+    'conflation_ticks_conflated': ('ingestion_conflated_ticks', 'Ticks replaced by a newer tick while conflating'),
+    'spool_spooled_batches': ('ingestion_spooled_batches', 'Batches written to the disk spool'),
+    'spool_drained_batches': ('ingestion_spool_drained_batches', 'Spooled batches re-published'),
+}
+
+# Stats keys exported as gauges: key -> (metric, help)
+STATS_GAUGES = {
+    # Alert when > 0 for several minutes while ingestion_broker_connected is 1: draining is not keeping up
+    'spool_growth_per_sec': (
+        'ingestion_spool_growth_per_second', 'Spooled minus drained batches per second over the last minute'
+    ),
+    'broker_connected': ('ingestion_broker_connected', '1 while the publisher is connected to RabbitMQ'),
+}
+
+# Stats keys exported as ingestion_queue_depth{queue=...}
+STATS_QUEUES = {
+    'queue_depth': 'handoff',
+    'tick_queue_depth': 'tick',
+    'publish_queue_depth': 'publish',
+    'buffered_ticks': 'batcher',
+    'conflation_pending': 'conflation',
+    'spool_pending_batches': 'spool',
+}
+
+
+class StatsCollector:
+    """
+    Custom collector that turns a get_stats() dict into metric families on scrape
+    
+    Args:
+        source: "kite" or "dhan", added as the source label
+        get_stats: Callable returning the combined statistics dict
+    """
+    
+    def __init__(self, source: str, get_stats: Callable[[], Dict]):
+        self.source = source
+        self.get_stats = get_stats
+    
+    def describe(self) -> Iterable:
+        # Nothing to check at registration; families are built per scrape
+        return []
+    
+    def collect(self) -> Iterable:
+        try:
+            stats = self.get_stats()
+        except Exception as e:
+            logger.warning("metrics_stats_failed", error=str(e))
+            return
+        
+        for key, (name, documentation) in STATS_COUNTERS.items():
+            value = stats.get(key)
+            if value is None:
+                continue
+            family = CounterMetricFamily(name, documentation, labels=['source'])
+            family.add_metric([self.source], value)
+            yield family
+        
+        for key, (name, documentation) in STATS_GAUGES.items():
+            value = stats.get(key)
+            if value is None:
+                continue
+            family = GaugeMetricFamily(name, documentation, labels=['source'])
+            family.add_metric([self.source], float(value))
+            yield family
+        
+        codes = stats.get('packets_by_code')
+        if codes:
+            family = CounterMetricFamily(
+                'ingestion_packets_by_code',
+                'Packets received per Dhan response code',
+                labels=['source', 'code']
+            )
+            for code, count in sorted(codes.items()):
+                family.add_metric([self.source, str(code)], count)
+            yield family
+        
+        depth = GaugeMetricFamily(
+            'ingestion_queue_depth',
+            'Items waiting in a local queue (frames, tick lists, ticks or spooled batches)',
+            labels=['source', 'queue']
+        )
+        for key, queue_name in STATS_QUEUES.items():
+            value = stats.get(key)
+            if value is not None and value >= 0:
+                depth.add_metric([self.source, queue_name], value)
+        yield depth
+        
+        if 'is_connected' in stats:
+            connected = GaugeMetricFamily(
+                'ingestion_websocket_connected',
+                '1 while the WebSocket is connected',
+                labels=['source']
+            )
+            connected.add_metric([self.source], 1 if stats['is_connected'] else 0)
+            yield connected
+
+
+class TickLagRecorder:
+    """
+    Observes exchange last_trade_time -> publish lag for a batch of tick dicts
+    
+    last_trade_time arrives as an ISO string with second resolution, so most
+    ticks in a batch share a handful of values; each distinct string is
+    parsed once per batch. Label children are cached per segment.
+    """
+    
+    def __init__(self):
+        self._children: Dict[str, object] = {}
+        self._lock = threading.Lock()
+    
+    def _child(self, segment: str):
+        child = self._children.get(segment)
+        if child is None:
+            with self._lock:
+                child = self._children.get(segment)
+                if child is None:
+                    child = TICK_LAG_SECONDS.labels(segment=segment)
+                    self._children[segment] = child
+        return child
+    
+    def observe_batch(self, ticks: List[Dict], published_at: Optional[float] = None):
+        """
+        Args:
+            ticks: Published tick dicts (to_dict() format)
+            published_at: Epoch seconds of the publish (defaults to now)
+        """
+        now = published_at if published_at is not None else time.time()
+        parsed: Dict[str, Optional[float]] = {}
+        
+        for tick in ticks:
+            ltt = tick.get('last_trade_time')
+            if not ltt:
+                continue
+            
+            epoch = parsed.get(ltt, -1.0)
+            if epoch == -1.0:
+                epoch = _epoch(ltt)
+                parsed[ltt] = epoch
+            if epoch is None:
+                continue
+            
+            self._child(tick.get('exchange') or 'unknown').observe(max(now - epoch, 0.0))
+
+
+def _epoch(value) -> Optional[float]:
+    """Epoch seconds of an ISO string or datetime (naive values are IST)"""
+    try:
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value)
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=IST)
+        return value.timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+tick_lag = TickLagRecorder()
+
+_registered: Dict[str, StatsCollector] = {}
+
+
+def register_stats(source: str, get_stats: Callable[[], Dict]):
+    """Export a component's get_stats() counters under the given source label"""
+    collector = _registered.pop(source, None)
+    if collector is not None:
+        REGISTRY.unregister(collector)
+    
+    collector = StatsCollector(source, get_stats)
+    REGISTRY.register(collector)
+    _registered[source] = collector
+
+
+def start_metrics_server(port: int = METRICS_PORT) -> bool:
+    """
+    Serve /metrics on a background thread
+    
+    Returns:
+        bool: True if the server was started (port > 0)
+    """
+    if port <= 0:
+        logger.info("metrics_server_disabled")
+        return False
+    
+    start_http_server(port)
+    logger.info("metrics_server_started", port=port)
+    return True
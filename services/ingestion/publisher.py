@@ -3,11 +3,19 @@ RabbitMQ Publisher
 Publishes enriched tick data to RabbitMQ queue for worker consumption
 """
 
+import os
 import json
 import time
 import pika
 import structlog
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
+
+from tick_wire import (
+    encode_batch, content_type_for, check_compression, compress_body, WireFormatError,
+    QUEUE_NAME, queue_name, partition_for, trace_headers
+)
+from spool import DiskSpool
+from log_config import HotPathCounters
 
 logger = structlog.get_logger()
 
@@ -17,31 +25,106 @@ class RabbitMQPublisher:
     RabbitMQ publisher with connection management and retry logic
     """
     
-    QUEUE_NAME = "ticks_queue"
+    QUEUE_NAME = QUEUE_NAME
     EXCHANGE_NAME = ""  # Use default exchange
+    PARTITIONS = int(os.getenv("TICK_QUEUE_PARTITIONS", 1))  # Queues batches are split across by instrument_token
+    QUEUE_ARGUMENTS = {
+        'x-max-length': 1000000,  # Max 1M messages
+        'x-message-ttl': 86400000  # 24 hours TTL
+    }
     MAX_RETRIES = 5
     RETRY_DELAY = 5  # seconds
+    WIRE_FORMAT = os.getenv("INGESTION_WIRE_FORMAT", "json").lower()  # Batch encoding: json or binary
+    COMPRESSION = os.getenv("INGESTION_COMPRESSION", "none").lower()  # none, zlib or lz4
+    COMPRESSION_MIN_BYTES = int(os.getenv("INGESTION_COMPRESSION_MIN_BYTES", 16384))  # Smaller bodies go uncompressed
+    COMPRESSION_LEVEL = int(os.getenv("INGESTION_COMPRESSION_LEVEL", 1))
+    SPOOL_DIR = os.getenv("INGESTION_SPOOL_DIR", "")  # Empty = no spool (failed batches are dropped)
+    SPOOL_DRAIN_RATE = float(os.getenv("INGESTION_SPOOL_DRAIN_RATE", 50))  # Catch-up messages per second on top of the live rate
+    SPOOL_GROWTH_CHECK_INTERVAL = 60  # Seconds between checks for a spool growing while connected
+    SPOOL_RECONNECT_INTERVAL = float(os.getenv("INGESTION_SPOOL_RECONNECT_INTERVAL", 5))  # Seconds between reconnect attempts while spooling
     
-    def __init__(self, rabbitmq_url: str):
+    def __init__(
+        self,
+        rabbitmq_url: str,
+        wire_format: Optional[str] = None,
+        compression: Optional[str] = None,
+        compression_min_bytes: Optional[int] = None,
+        spool_dir: Optional[str] = None,
+        partitions: Optional[int] = None
+    ):
         """
         Initialize RabbitMQ publisher
         
         Args:
             rabbitmq_url: RabbitMQ connection URL (amqp://...)
+            wire_format: Override for INGESTION_WIRE_FORMAT ("json" or "binary")
+            compression: Override for INGESTION_COMPRESSION ("none", "zlib" or "lz4")
+            compression_min_bytes: Override for INGESTION_COMPRESSION_MIN_BYTES
+            spool_dir: Override for INGESTION_SPOOL_DIR
+            partitions: Override for TICK_QUEUE_PARTITIONS
         """
         self.rabbitmq_url = rabbitmq_url
+        self.wire_format = (wire_format or self.WIRE_FORMAT).lower()
+        if self.wire_format not in ("json", "binary"):
+            raise ValueError(f"Invalid wire format: {self.wire_format}. Must be one of: json, binary")
+        
+        self.compression = (compression or self.COMPRESSION).lower()
+        if self.compression == "none":
+            self.compression = None
+        else:
+            check_compression(self.compression)
+        self.compression_min_bytes = (
+            compression_min_bytes if compression_min_bytes is not None else self.COMPRESSION_MIN_BYTES
+        )
+        
+        # One queue per partition; a single partition keeps the original ticks_queue
+        self.partitions = partitions or self.PARTITIONS
+        if self.partitions < 1:
+            raise ValueError(f"Invalid TICK_QUEUE_PARTITIONS: {self.partitions}. Must be >= 1")
+        self.queue_names = [queue_name(p, self.partitions) for p in range(self.partitions)]
+        
         self.connection = None
         self.channel = None
+        
+        # Disk spool for batches published while the broker is unreachable
+        spool_dir = spool_dir if spool_dir is not None else self.SPOOL_DIR
+        self.spool = DiskSpool(spool_dir) if spool_dir else None
+        self._last_reconnect_attempt = 0.0
+        self._drain_allowance = 0.0
+        self._last_drain_time = time.time()
+        self._spool_arrivals = 0
+        self._growth_check = (time.time(), 0)
+        
+        # Per-batch events, logged as a periodic publisher_summary line
+        self.log_counters = HotPathCounters("publisher_summary")
+        
+        # Statistics
+        self.batches_published = 0
+        self.ticks_published = 0
+        self.bytes_published = 0
+        self.wire_fallbacks = 0
+        self.encode_seconds = 0.0
+        self.compressed_batches = 0
+        self.compress_bytes_in = 0
+        self.compress_bytes_out = 0
+        self.compress_seconds = 0.0
+        
         self._connect()
     
-    def _connect(self):
-        """Establish connection to RabbitMQ with retry logic"""
-        for attempt in range(self.MAX_RETRIES):
+    def _connect(self, max_retries: Optional[int] = None):
+        """
+        Establish connection to RabbitMQ with retry logic
+        
+        Args:
+            max_retries: Override for MAX_RETRIES (1 = single attempt, no backoff)
+        """
+        max_retries = max_retries or self.MAX_RETRIES
+        for attempt in range(max_retries):
             try:
                 logger.info(
                     "rabbitmq_connecting",
                     attempt=attempt + 1,
-                    max_retries=self.MAX_RETRIES
+                    max_retries=max_retries
                 )
                 
                 # Parse connection parameters
@@ -53,19 +136,18 @@ class RabbitMQPublisher:
                 self.connection = pika.BlockingConnection(parameters)
                 self.channel = self.connection.channel()
                 
-                # Declare queue (idempotent - creates if doesn't exist)
-                self.channel.queue_declare(
-                    queue=self.QUEUE_NAME,
-                    durable=True,  # Survive broker restart
-                    arguments={
-                        'x-max-length': 1000000,  # Max 1M messages
-                        'x-message-ttl': 86400000  # 24 hours TTL
-                    }
-                )
+                # Declare queues (idempotent - creates if doesn't exist)
+                for queue in self.queue_names:
+                    self.channel.queue_declare(
+                        queue=queue,
+                        durable=True,  # Survive broker restart
+                        arguments=self.QUEUE_ARGUMENTS
+                    )
                 
                 logger.info(
                     "rabbitmq_connected",
                     queue=self.QUEUE_NAME,
+                    partitions=self.partitions,
                     durable=True
                 )
                 
@@ -78,10 +160,10 @@ class RabbitMQPublisher:
                     error=str(e)
                 )
                 
-                if attempt < self.MAX_RETRIES - 1:
+                if attempt < max_retries - 1:
                     time.sleep(self.RETRY_DELAY * (attempt + 1))  # Exponential backoff
                 else:
-                    raise Exception(f"Failed to connect to RabbitMQ after {self.MAX_RETRIES} attempts: {e}")
+                    raise Exception(f"Failed to connect to RabbitMQ after {max_retries} attempts: {e}")
     
     def publish(self, message: Dict[str, Any]) -> bool:
         """
@@ -105,7 +187,7 @@ class RabbitMQPublisher:
             # Publish with persistence
             self.channel.basic_publish(
                 exchange=self.EXCHANGE_NAME,
-                routing_key=self.QUEUE_NAME,
+                routing_key=self.queue_names[partition_for(message.get('instrument_token'), self.partitions)],
                 body=body,
                 properties=pika.BasicProperties(
                     delivery_mode=2,  # Make message persistent
@@ -131,49 +213,70 @@ class RabbitMQPublisher:
             
             return False
     
-    def publish_batch(self, messages: list) -> int:
+    def publish_batch(self, messages: list, trace: Optional[Tuple[str, float, float]] = None) -> int:
         """
         Publish batch of messages as a SINGLE message containing array
         This is much more efficient than publishing each tick individually
         
+        With TICK_QUEUE_PARTITIONS > 1 the batch is split by instrument_token
+        and each part goes to its partition's queue as one message.
+        
+        With a spool configured, a batch that cannot be published is written
+        to disk instead (and so is every later batch until the spool has
+        drained, keeping order); spooled ticks count as accepted.
+        
         Args:
             messages: List of dictionaries to publish as batch
+            trace: Optional (source, received_at, enriched_at) of the batch's
+                   oldest tick; sent as x-tick-trace headers with the publish
+                   time added (spooled batches keep theirs)
         
         Returns:
-            int: Number of ticks in batch if successful, 0 otherwise
+            int: Number of ticks in batch if published or spooled, 0 otherwise
         """
         if not messages:
             return 0
         
+        return sum(
+            self._publish_partition(routing_key, batch, trace)
+            for routing_key, batch in self._partition_batch(messages)
+        )
+    
+    def _partition_batch(self, messages: list) -> List[Tuple[str, list]]:
+        """Split a batch into (queue, ticks) per instrument partition"""
+        if self.partitions == 1:
+            return [(self.queue_names[0], messages)]
+        
+        groups: Dict[int, list] = {}
+        for message in messages:
+            partition = partition_for(message.get('instrument_token'), self.partitions)
+            groups.setdefault(partition, []).append(message)
+        return [(self.queue_names[partition], batch) for partition, batch in sorted(groups.items())]
+    
+    def _publish_partition(self, routing_key: str, messages: list, trace: Optional[Tuple] = None) -> int:
+        """Encode and publish (or spool) one partition's share of a batch"""
         batch_size = len(messages)
         
+        # Serialize entire batch (columnar binary or JSON array)
+        body, content_type = self._encode_batch(messages)
+        body, content_encoding = self._compress(body)
+        
+        if self.spool is not None:
+            return self._publish_or_spool(body, content_type, content_encoding, routing_key, batch_size, trace)
+        
         try:
             # Check connection
             if not self.connection or self.connection.is_closed:
                 logger.warning("rabbitmq_connection_lost", action="reconnecting")
                 self._connect()
             
-            # Serialize entire batch as single JSON array
-            body = json.dumps(messages)
+            self._basic_publish(body, content_type, content_encoding, routing_key, trace)
             
-            # Publish batch as ONE message
-            self.channel.basic_publish(
-                exchange=self.EXCHANGE_NAME,
-                routing_key=self.QUEUE_NAME,
-                body=body,
-                properties=pika.BasicProperties(
-                    delivery_mode=2,  # Make message persistent
-                    content_type='application/json',
-                    timestamp=int(time.time())
-                )
-            )
+            self.batches_published += 1
+            self.ticks_published += batch_size
+            self.bytes_published += len(body)
             
-            logger.info(
-                "batch_published",
-                total=batch_size,
-                successful=batch_size,
-                failed=0
-            )
+            self.log_counters.add("batch_published", ticks=batch_size, bytes=len(body))
             
             return batch_size
         
@@ -192,23 +295,253 @@ class RabbitMQPublisher:
             
             return 0
     
+    def _basic_publish(
+        self,
+        body: bytes,
+        content_type: str,
+        content_encoding: Optional[str],
+        routing_key: str,
+        trace: Optional[Tuple] = None
+    ):
+        """Publish one encoded batch as ONE persistent message"""
+        now = time.time()
+        self.channel.basic_publish(
+            exchange=self.EXCHANGE_NAME,
+            routing_key=routing_key,
+            body=body,
+            properties=pika.BasicProperties(
+                delivery_mode=2,  # Make message persistent
+                content_type=content_type,
+                content_encoding=content_encoding,
+                timestamp=int(now),
+                headers=trace_headers(*trace, now) if trace else None
+            )
+        )
+    
+    def _ensure_connected(self) -> bool:
+        """
+        Non-blocking connection check for the spool path
+        At most one single-attempt reconnect per SPOOL_RECONNECT_INTERVAL
+        """
+        if self.connection and self.connection.is_open:
+            return True
+        
+        now = time.time()
+        if now - self._last_reconnect_attempt < self.SPOOL_RECONNECT_INTERVAL:
+            return False
+        self._last_reconnect_attempt = now
+        
+        try:
+            self._connect(max_retries=1)
+            return True
+        except Exception:
+            return False
+    
+    def _publish_or_spool(
+        self,
+        body: bytes,
+        content_type: str,
+        content_encoding: Optional[str],
+        routing_key: str,
+        batch_size: int,
+        trace: Optional[Tuple] = None
+    ) -> int:
+        """Publish directly, or append to the spool while it is non-empty or the broker is down"""
+        backlogged = bool(self.spool.pending_batches)
+        if not backlogged and self._ensure_connected():
+            try:
+                self._basic_publish(body, content_type, content_encoding, routing_key, trace)
+                
+                self.batches_published += 1
+                self.ticks_published += batch_size
+                self.bytes_published += len(body)
+                
+                self.log_counters.add("batch_published", ticks=batch_size, bytes=len(body))
+                return batch_size
+            
+            except Exception as e:
+                logger.error("batch_publish_failed", error=str(e), batch_size=batch_size, action="spooling")
+                self._mark_disconnected()
+        
+        try:
+            self.spool.append(body, content_type, content_encoding, routing_key, trace)
+        except Exception as e:
+            logger.error("spool_append_failed", error=str(e), batch_size=batch_size)
+            return 0
+        
+        if backlogged and self.connection is not None and self.connection.is_open:
+            # Live message queued behind the backlog: it adds to the drain allowance,
+            # so draining keeps up with any arrival rate and SPOOL_DRAIN_RATE is the catch-up
+            self._spool_arrivals += 1
+            self.log_counters.add("batch_spooled_behind_backlog", batch_size=batch_size)
+        else:
+            logger.warning("batch_spooled", batch_size=batch_size, spool_pending=self.spool.pending_batches)
+        self.drain_spool()
+        return batch_size
+    
+    def _mark_disconnected(self):
+        """Drop a broken connection so the next attempt reconnects (after the interval)"""
+        self._last_reconnect_attempt = time.time()
+        self._growth_check = (self._last_reconnect_attempt, 0)  # Outage growth is expected
+        try:
+            if self.connection and self.connection.is_open:
+                self.connection.close()
+        except Exception:
+            pass
+        self.connection = None
+        self.channel = None
+    
+    def drain_spool(self) -> int:
+        """
+        Re-publish spooled batches in order
+        Call periodically from the publishing thread (pika channels are not thread-safe)
+        
+        The allowance is one message per live message spooled behind the
+        backlog, plus SPOOL_DRAIN_RATE per second (burst of one second) to
+        catch up, so the spool shrinks whatever the live rate; messages, not
+        batches, are counted (a batch is one message per partition).
+        
+        Returns:
+            int: Number of batches drained
+        """
+        if self.spool is None or not self.spool.pending_batches:
+            return 0
+        
+        # Token bucket: up to one second of catch-up burst, plus the live arrivals
+        now = time.time()
+        self._drain_allowance = min(
+            self._drain_allowance + (now - self._last_drain_time) * self.SPOOL_DRAIN_RATE,
+            max(self._drain_allowance, self.SPOOL_DRAIN_RATE)
+        ) + self._spool_arrivals
+        self._spool_arrivals = 0
+        self._last_drain_time = now
+        
+        if self._drain_allowance < 1 or not self._ensure_connected():
+            return 0
+        
+        self._check_spool_growth(now)
+        
+        drained = 0
+        while self._drain_allowance >= 1:
+            record = self.spool.peek()
+            if record is None:
+                break
+            
+            body, content_type, content_encoding, routing_key, trace = record
+            try:
+                self._basic_publish(body, content_type, content_encoding, routing_key, trace)
+            except Exception as e:
+                logger.error("spool_drain_failed", error=str(e), spool_pending=self.spool.pending_batches)
+                self._mark_disconnected()
+                break
+            
+            self.spool.commit()
+            self.batches_published += 1
+            self.bytes_published += len(body)
+            self._drain_allowance -= 1
+            drained += 1
+        
+        if drained and not self.spool.pending_batches:
+            logger.info("spool_drained", drained_batches=self.spool.drained_batches)
+            self._drain_allowance = 0.0
+        
+        return drained
+    
+    def _check_spool_growth(self, now: float):
+        """Warn when the backlog grew over a check interval with the broker connected"""
+        checked_at, pending = self._growth_check
+        if now - checked_at < self.SPOOL_GROWTH_CHECK_INTERVAL:
+            return
+        
+        self._growth_check = (now, self.spool.pending_batches)
+        if pending and self.spool.pending_batches > pending:
+            logger.warning(
+                "spool_growing_while_connected",
+                spool_pending=self.spool.pending_batches,
+                previous_pending=pending,
+                interval_seconds=round(now - checked_at)
+            )
+    
+    def _encode_batch(self, messages: list) -> Tuple[bytes, str]:
+        """
+        Encode a batch in the configured wire format
+        Falls back to JSON if the batch does not fit the binary schema
+        
+        Returns:
+            (body, content_type)
+        """
+        start = time.perf_counter()
+        try:
+            if self.wire_format == "binary":
+                try:
+                    return encode_batch(messages), content_type_for(binary=True)
+                except WireFormatError as e:
+                    self.wire_fallbacks += 1
+                    logger.warning("wire_format_fallback_to_json", error=str(e), batch_size=len(messages))
+            
+            return json.dumps(messages).encode('utf-8'), content_type_for(binary=False)
+        finally:
+            self.encode_seconds += time.perf_counter() - start
+    
+    def _compress(self, body: bytes) -> Tuple[bytes, Optional[str]]:
+        """
+        Compress the body if compression is enabled and it is over the size threshold
+        
+        Returns:
+            (body, content_encoding) - content_encoding is None when sent as-is
+        """
+        if not self.compression or len(body) < self.compression_min_bytes:
+            return body, None
+        
+        start = time.perf_counter()
+        compressed = compress_body(body, self.compression, self.COMPRESSION_LEVEL)
+        self.compress_seconds += time.perf_counter() - start
+        
+        self.compressed_batches += 1
+        self.compress_bytes_in += len(body)
+        self.compress_bytes_out += len(compressed)
+        
+        return compressed, self.compression
+    
+    def get_stats(self) -> Dict:
+        """Get publishing statistics"""
+        return {
+            'partitions': self.partitions,
+            'wire_format': self.wire_format,
+            'published_batches': self.batches_published,
+            'published_bytes': self.bytes_published,
+            'bytes_per_tick': round(self.bytes_published / self.ticks_published, 1) if self.ticks_published else 0,
+            'encode_us_per_tick': round(self.encode_seconds / self.ticks_published * 1e6, 2) if self.ticks_published else 0,
+            'wire_fallbacks': self.wire_fallbacks,
+            'compression': self.compression or 'none',
+            'compressed_batches': self.compressed_batches,
+            'compression_ratio': round(self.compress_bytes_in / self.compress_bytes_out, 2) if self.compress_bytes_out else 0,
+            'compress_ms_per_batch': round(self.compress_seconds / self.compressed_batches * 1e3, 3) if self.compressed_batches else 0,
+            'compress_seconds_total': round(self.compress_seconds, 3),
+            'broker_connected': bool(self.connection and self.connection.is_open),
+            **(self.spool.get_stats() if self.spool is not None else {})
+        }
+    
     def get_queue_depth(self) -> int:
         """
         Get current queue depth (number of messages waiting)
         
         Returns:
-            int: Number of messages in queue
+            int: Number of messages in queue (summed over partitions)
         """
         try:
             if not self.channel:
                 return -1
             
-            method = self.channel.queue_declare(
-                queue=self.QUEUE_NAME,
-                passive=True  # Don't create, just check
-            )
+            depth = 0
+            for queue in self.queue_names:
+                method = self.channel.queue_declare(
+                    queue=queue,
+                    passive=True  # Don't create, just check
+                )
+                depth += method.method.message_count
             
-            return method.method.message_count
+            return depth
         
         except Exception as e:
             logger.error("queue_depth_check_failed", error=str(e))
@@ -216,6 +549,11 @@ class RabbitMQPublisher:
     
     def close(self):
         """Close RabbitMQ connection gracefully"""
+        self.log_counters.flush()
+        
+        if self.spool is not None:
+            self.spool.close()
+        
         try:
             if self.channel and self.channel.is_open:
                 self.channel.close()
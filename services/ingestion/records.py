@@ -0,0 +1,218 @@
+"""
+Tick Records for the Ingestion Hot Path
+Compact __slots__ records used instead of pydantic models between the
+WebSocket callbacks and the publisher
+
+Raw ticks are validated once at the boundary (validator.validate_raw_tick for
+Kite, the binary decoder for Dhan) and enriched straight into a TickRecord.
+TickRecord.to_dict() produces exactly EnrichedTick.to_dict(), so the wire
+format is unchanged. The pydantic models in models.py remain the schema for
+external API use (see TickRecord.to_model()).
+
+InstrumentRecord plays the same role for the instruments cache, which holds
+one entry per active instrument for the life of the process.
+"""
+
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from models import EnrichedTick, InstrumentInfo
+
+
+class TickRecord:
+    """
+    Enriched tick with the EnrichedTick fields, stored in __slots__
+    No per-instance __dict__ and no validation on construction
+    """
+    
+    __slots__ = (
+        # Timestamps
+        'time', 'last_trade_time',
+        # Instrument identification
+        'instrument_token', 'trading_symbol', 'exchange', 'instrument_type',
+        # Price data
+        'last_price', 'last_traded_quantity', 'average_traded_price',
+        # Volume & OI
+        'volume_traded', 'oi', 'oi_day_high', 'oi_day_low',
+        # OHLC
+        'day_open', 'day_high', 'day_low', 'day_close',
+        # Change metrics
+        'change', 'change_percent',
+        # Order book totals
+        'total_buy_quantity', 'total_sell_quantity',
+        # Market depth (5 levels)
+        'bid_prices', 'bid_quantities', 'bid_orders',
+        'ask_prices', 'ask_quantities', 'ask_orders',
+        # Metadata
+        'tradable', 'mode',
+        # Derived fields
+        'bid_ask_spread', 'mid_price', 'order_imbalance',
+    )
+    
+    def __init__(
+        self,
+        time: datetime,
+        last_trade_time: Optional[datetime],
+        instrument_token: int,
+        trading_symbol: Optional[str],
+        exchange: Optional[str],
+        instrument_type: Optional[str],
+        last_price: Optional[float],
+        last_traded_quantity: Optional[int],
+        average_traded_price: Optional[float],
+        volume_traded: Optional[int],
+        oi: Optional[int],
+        oi_day_high: Optional[int],
+        oi_day_low: Optional[int],
+        day_open: Optional[float],
+        day_high: Optional[float],
+        day_low: Optional[float],
+        day_close: Optional[float],
+        change: Optional[float],
+        change_percent: Optional[float],
+        total_buy_quantity: Optional[int],
+        total_sell_quantity: Optional[int],
+        bid_prices: List[Optional[float]],
+        bid_quantities: List[Optional[int]],
+        bid_orders: List[Optional[int]],
+        ask_prices: List[Optional[float]],
+        ask_quantities: List[Optional[int]],
+        ask_orders: List[Optional[int]],
+        tradable: bool,
+        mode: Optional[str],
+        bid_ask_spread: Optional[float],
+        mid_price: Optional[float],
+        order_imbalance: Optional[int]
+    ):
+        self.time = time
+        self.last_trade_time = last_trade_time
+        self.instrument_token = instrument_token
+        self.trading_symbol = trading_symbol
+        self.exchange = exchange
+        self.instrument_type = instrument_type
+        self.last_price = last_price
+        self.last_traded_quantity = last_traded_quantity
+        self.average_traded_price = average_traded_price
+        self.volume_traded = volume_traded
+        self.oi = oi
+        self.oi_day_high = oi_day_high
+        self.oi_day_low = oi_day_low
+        self.day_open = day_open
+        self.day_high = day_high
+        self.day_low = day_low
+        self.day_close = day_close
+        self.change = change
+        self.change_percent = change_percent
+        self.total_buy_quantity = total_buy_quantity
+        self.total_sell_quantity = total_sell_quantity
+        self.bid_prices = bid_prices
+        self.bid_quantities = bid_quantities
+        self.bid_orders = bid_orders
+        self.ask_prices = ask_prices
+        self.ask_quantities = ask_quantities
+        self.ask_orders = ask_orders
+        self.tradable = tradable
+        self.mode = mode
+        self.bid_ask_spread = bid_ask_spread
+        self.mid_price = mid_price
+        self.order_imbalance = order_imbalance
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize to the publisher wire format (same as EnrichedTick.to_dict())"""
+        return {
+            'time': self.time.isoformat() if self.time else self.time,
+            'last_trade_time': self.last_trade_time.isoformat() if self.last_trade_time else None,
+            'instrument_token': self.instrument_token,
+            'trading_symbol': self.trading_symbol,
+            'exchange': self.exchange,
+            'instrument_type': self.instrument_type,
+            'last_price': self.last_price,
+            'last_traded_quantity': self.last_traded_quantity,
+            'average_traded_price': self.average_traded_price,
+            'volume_traded': self.volume_traded,
+            'oi': self.oi,
+            'oi_day_high': self.oi_day_high,
+            'oi_day_low': self.oi_day_low,
+            'day_open': self.day_open,
+            'day_high': self.day_high,
+            'day_low': self.day_low,
+            'day_close': self.day_close,
+            'change': self.change,
+            'change_percent': self.change_percent,
+            'total_buy_quantity': self.total_buy_quantity,
+            'total_sell_quantity': self.total_sell_quantity,
+            'bid_prices': list(self.bid_prices),
+            'bid_quantities': list(self.bid_quantities),
+            'bid_orders': list(self.bid_orders),
+            'ask_prices': list(self.ask_prices),
+            'ask_quantities': list(self.ask_quantities),
+            'ask_orders': list(self.ask_orders),
+            'tradable': self.tradable,
+            'mode': self.mode,
+            'bid_ask_spread': self.bid_ask_spread,
+            'mid_price': self.mid_price,
+            'order_imbalance': self.order_imbalance
+        }
+    
+    def to_model(self) -> EnrichedTick:
+        """Convert to the validated pydantic model (for API use, not the hot path)"""
+        return EnrichedTick(**{name: getattr(self, name) for name in self.__slots__})
+    
+    def __repr__(self) -> str:
+        return (
+            f"TickRecord(instrument_token={self.instrument_token}, "
+            f"time={self.time}, last_price={self.last_price})"
+        )
+
+
+class InstrumentRecord:
+    """
+    Instrument metadata with the InstrumentInfo fields, stored in __slots__
+    Built straight from the instruments COPY stream / Redis hashes without validation
+    """
+    
+    __slots__ = (
+        'instrument_token', 'trading_symbol', 'exchange', 'instrument_type',
+        'expiry', 'strike', 'lot_size', 'tick_size',
+        # Dhan compatibility
+        'security_id', 'source',
+    )
+    
+    def __init__(
+        self,
+        instrument_token: int,
+        trading_symbol: str,
+        exchange: str,
+        instrument_type: Optional[str] = None,
+        expiry: Optional[str] = None,
+        strike: Optional[float] = None,
+        lot_size: Optional[int] = None,
+        tick_size: Optional[float] = None,
+        security_id: Optional[str] = None,
+        source: str = "kite"
+    ):
+        self.instrument_token = instrument_token
+        self.trading_symbol = trading_symbol
+        self.exchange = exchange
+        self.instrument_type = instrument_type
+        self.expiry = expiry
+        self.strike = strike
+        self.lot_size = lot_size
+        self.tick_size = tick_size
+        self.security_id = security_id
+        self.source = source
+    
+    def to_model(self) -> InstrumentInfo:
+        """Convert to the validated pydantic model (for API use, not the hot path)"""
+        return InstrumentInfo(**{name: getattr(self, name) for name in self.__slots__})
+    
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, InstrumentRecord):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+    
+    def __repr__(self) -> str:
+        return (
+            f"InstrumentRecord(instrument_token={self.instrument_token}, "
+            f"trading_symbol={self.trading_symbol!r}, source={self.source!r})"
+        )
@@ -0,0 +1,323 @@
+"""
+Publisher Disk Spool
+Append-only, segment-rotated write-ahead log for batches that could not be
+published (RabbitMQ unreachable)
+
+Records hold the already-encoded message (body, content_type,
+content_encoding and routing key) plus the batch's trace tuple, so
+draining is a plain re-publish with the original hop timestamps. Segments are read
+oldest-first; a segment is deleted once fully drained, and the read position
+is persisted so a restart resumes where draining stopped. Delivery is
+at-least-once - the worker insert skips duplicate ticks.
+
+Enabled with INGESTION_SPOOL_DIR
+"""
+
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+import structlog
+
+logger = structlog.get_logger()
+
+# body length, crc32 of everything after the header, content_type / content_encoding / routing key / trace lengths
+RECORD_HEADER = struct.Struct('<IIBBBB')
+# Trace tuple: received_at, enriched_at (epoch seconds), then the source as utf-8
+TRACE_STRUCT = struct.Struct('<dd')
+SEGMENT_PREFIX = 'spool-'
+SEGMENT_SUFFIX = '.log'
+OFFSET_FILE = 'spool.offset'
+
+
+class DiskSpool:
+    """
+    Segment-rotated on-disk FIFO of encoded batches
+    
+    append() writes to the newest segment (rotating at segment_bytes);
+    peek()/commit() read from the oldest. When the spool grows past
+    max_bytes the oldest segment is dropped (logged and counted).
+    """
+    
+    SEGMENT_MB = int(os.getenv("INGESTION_SPOOL_SEGMENT_MB", 64))
+    MAX_MB = int(os.getenv("INGESTION_SPOOL_MAX_MB", 2048))
+    
+    def __init__(self, directory: str, segment_mb: Optional[int] = None, max_mb: Optional[int] = None):
+        """
+        Open (or create) the spool directory
+        
+        Args:
+            directory: Spool directory (INGESTION_SPOOL_DIR)
+            segment_mb: Override for INGESTION_SPOOL_SEGMENT_MB
+            max_mb: Override for INGESTION_SPOOL_MAX_MB
+        """
+        self.directory = directory
+        self.segment_bytes = (segment_mb or self.SEGMENT_MB) * 1024 * 1024
+        self.max_bytes = (max_mb or self.MAX_MB) * 1024 * 1024
+        
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        
+        self._segments: List[int] = sorted(
+            int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+            for name in os.listdir(directory)
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)
+        )
+        self._read_segment, self._read_offset = self._load_offset()
+        self._reader = None
+        self._writer = None
+        self._write_segment: Optional[int] = None
+        
+        # Statistics
+        self.pending_batches = 0
+        self.spooled_batches = 0
+        self.drained_batches = 0
+        self.dropped_batches = 0
+        self.corrupt_records = 0
+        # [epoch second, appended, drained] for the last minute's rates
+        self._rate_buckets = deque(maxlen=61)
+        
+        self.pending_batches = sum(self._count_records(seq) for seq in self._segments)
+        if self.pending_batches:
+            logger.warning(
+                "spool_recovered",
+                directory=directory,
+                segments=len(self._segments),
+                pending_batches=self.pending_batches,
+                pending_bytes=self.pending_bytes
+            )
+    
+    def _path(self, seq: int) -> str:
+        return os.path.join(self.directory, f"{SEGMENT_PREFIX}{seq:012d}{SEGMENT_SUFFIX}")
+    
+    def _load_offset(self) -> Tuple[int, int]:
+        """Persisted (segment, offset) read position; segment start if missing/stale"""
+        try:
+            with open(os.path.join(self.directory, OFFSET_FILE)) as f:
+                seq, offset = (int(v) for v in f.read().split())
+            if seq in self._segments:
+                return seq, offset
+        except (OSError, ValueError):
+            pass
+        return (self._segments[0] if self._segments else 0), 0
+    
+    def _save_offset(self):
+        path = os.path.join(self.directory, OFFSET_FILE)
+        with open(path + '.tmp', 'w') as f:
+            f.write(f"{self._read_segment} {self._read_offset}")
+        os.replace(path + '.tmp', path)
+    
+    def _count_records(self, seq: int) -> int:
+        """Readable records in a segment past the read position (startup only)"""
+        count = 0
+        offset = self._read_offset if seq == self._read_segment else 0
+        with open(self._path(seq), 'rb') as f:
+            f.seek(offset)
+            while self._read_record(f) is not None:
+                count += 1
+        return count
+    
+    def _read_record(self, f) -> Optional[Tuple[bytes, Optional[str], Optional[str], str, Optional[Tuple]]]:
+        """Read one record at the file position; None at end of segment or torn/corrupt tail"""
+        header = f.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            return None
+        
+        body_len, crc, type_len, encoding_len, key_len, trace_len = RECORD_HEADER.unpack(header)
+        meta_len = type_len + encoding_len + key_len + trace_len
+        payload = f.read(meta_len + body_len)
+        if len(payload) < meta_len + body_len or zlib.crc32(payload) != crc:
+            self.corrupt_records += 1
+            logger.error("spool_corrupt_record", segment=f.name, offset=f.tell())
+            return None
+        
+        content_type = payload[:type_len].decode() or None
+        content_encoding = payload[type_len:type_len + encoding_len].decode() or None
+        key_end = type_len + encoding_len + key_len
+        routing_key = payload[type_len + encoding_len:key_end].decode()
+        
+        trace = None
+        if trace_len:
+            received_at, enriched_at = TRACE_STRUCT.unpack_from(payload, key_end)
+            trace = (payload[key_end + TRACE_STRUCT.size:meta_len].decode(), received_at, enriched_at)
+        return payload[meta_len:], content_type, content_encoding, routing_key, trace
+    
+    @property
+    def pending_bytes(self) -> int:
+        """Bytes on disk not yet drained"""
+        total = 0
+        for seq in self._segments:
+            try:
+                total += os.path.getsize(self._path(seq))
+            except OSError:
+                pass
+        return max(total - self._read_offset, 0)
+    
+    def __len__(self) -> int:
+        return self.pending_batches
+    
+    def append(
+        self,
+        body: bytes,
+        content_type: Optional[str],
+        content_encoding: Optional[str],
+        routing_key: str,
+        trace: Optional[Tuple[str, float, float]] = None
+    ):
+        """
+        Append an encoded batch to the spool
+        
+        Args:
+            body: Message body as it would be published
+            content_type: AMQP content_type property
+            content_encoding: AMQP content_encoding property
+            routing_key: Queue the batch is published to
+            trace: (source, received_at, enriched_at) for the x-tick-trace headers
+        """
+        type_bytes = (content_type or '').encode()
+        encoding_bytes = (content_encoding or '').encode()
+        key_bytes = routing_key.encode()
+        trace_bytes = b''
+        if trace:
+            source, received_at, enriched_at = trace
+            trace_bytes = TRACE_STRUCT.pack(received_at, enriched_at) + source.encode()
+        payload = type_bytes + encoding_bytes + key_bytes + trace_bytes + body
+        record = RECORD_HEADER.pack(
+            len(body), zlib.crc32(payload), len(type_bytes), len(encoding_bytes), len(key_bytes), len(trace_bytes)
+        ) + payload
+        
+        with self._lock:
+            if self._writer is None or self._writer.tell() >= self.segment_bytes:
+                self._rotate()
+            
+            self._writer.write(record)
+            self._writer.flush()  # Survives a process crash; the OS owns it from here
+            
+            self.pending_batches += 1
+            self.spooled_batches += 1
+            self._count_rate(1)
+            
+            if self.pending_bytes > self.max_bytes:
+                self._drop_oldest_segment()
+    
+    def _rotate(self):
+        """Start a new segment (never appends to a segment from a previous run)"""
+        if self._writer is not None:
+            self._writer.close()
+        
+        self._write_segment = (self._segments[-1] + 1) if self._segments else 1
+        self._segments.append(self._write_segment)
+        self._writer = open(self._path(self._write_segment), 'ab')
+        
+        if len(self._segments) == 1:
+            self._read_segment, self._read_offset = self._write_segment, 0
+        
+        logger.info("spool_segment_opened", segment=self._write_segment, segments=len(self._segments))
+    
+    def _drop_oldest_segment(self):
+        """Enforce max_bytes by discarding the oldest segment"""
+        if len(self._segments) < 2:
+            return
+        
+        seq = self._segments[0]
+        dropped = self._count_records(seq)
+        self._remove_segment(seq)
+        
+        self.pending_batches -= dropped
+        self.dropped_batches += dropped
+        logger.error("spool_full_dropped_segment", segment=seq, dropped_batches=dropped, max_bytes=self.max_bytes)
+    
+    def _remove_segment(self, seq: int):
+        if self._reader is not None and seq == self._read_segment:
+            self._reader.close()
+            self._reader = None
+        
+        self._segments.remove(seq)
+        try:
+            os.remove(self._path(seq))
+        except OSError as e:
+            logger.error("spool_segment_remove_failed", segment=seq, error=str(e))
+        
+        self._read_segment = self._segments[0] if self._segments else 0
+        self._read_offset = 0
+        self._save_offset()
+    
+    def peek(self) -> Optional[Tuple[bytes, Optional[str], Optional[str], str, Optional[Tuple]]]:
+        """
+        Oldest spooled batch without removing it
+        
+        Returns:
+            (body, content_type, content_encoding, routing_key, trace), or None if the spool is empty
+        """
+        with self._lock:
+            while self._segments:
+                if self._reader is None:
+                    if self._writer is not None and self._read_segment == self._write_segment:
+                        self._writer.flush()
+                    self._reader = open(self._path(self._read_segment), 'rb')
+                
+                self._reader.seek(self._read_offset)
+                record = self._read_record(self._reader)
+                if record is not None:
+                    return record
+                
+                if self._read_segment == self._write_segment:
+                    # Caught up with the writer
+                    return None
+                
+                # Segment fully drained (or torn tail from a crash)
+                self._remove_segment(self._read_segment)
+            
+            return None
+    
+    def commit(self):
+        """Remove the batch returned by the last peek() (it was published)"""
+        with self._lock:
+            self._read_offset = self._reader.tell()
+            self._save_offset()
+            self.pending_batches = max(self.pending_batches - 1, 0)
+            self.drained_batches += 1
+            self._count_rate(2)
+    
+    def _count_rate(self, column: int):
+        """Count an append (1) or drain (2) in the current second's bucket"""
+        second = int(time.time())
+        if not self._rate_buckets or self._rate_buckets[-1][0] != second:
+            self._rate_buckets.append([second, 0, 0])
+        self._rate_buckets[-1][column] += 1
+    
+    def close(self):
+        """Close open segment files"""
+        with self._lock:
+            for f in (self._reader, self._writer):
+                if f is not None:
+                    f.close()
+            self._reader = None
+            self._writer = None
+            self._write_segment = None
+    
+    def get_stats(self) -> Dict:
+        """Get spool statistics"""
+        cutoff = int(time.time()) - 60
+        with self._lock:
+            buckets = [bucket for bucket in self._rate_buckets if bucket[0] > cutoff]
+        appended = sum(bucket[1] for bucket in buckets)
+        recent = sum(bucket[2] for bucket in buckets)
+        
+        return {
+            'spool_pending_batches': self.pending_batches,
+            'spool_pending_bytes': self.pending_bytes,
+            'spool_segments': len(self._segments),
+            'spool_spooled_batches': self.spooled_batches,
+            'spool_drained_batches': self.drained_batches,
+            'spool_drain_rate_per_sec': round(recent / 60, 2),
+            'spool_append_rate_per_sec': round(appended / 60, 2),
+            # > 0 while the backlog grows (over the last minute)
+            'spool_growth_per_sec': round((appended - recent) / 60, 2),
+            'spool_dropped_batches': self.dropped_batches,
+            'spool_corrupt_records': self.corrupt_records
+        }
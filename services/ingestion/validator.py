@@ -4,7 +4,7 @@ Validates incoming tick data for quality and consistency
 """
 
 import structlog
-from typing import Optional
+from typing import Any, Dict, Optional
 from models import KiteTick
 
 logger = structlog.get_logger()
@@ -61,3 +61,38 @@ def validate_tick_basic(tick: KiteTick) -> bool:
         bool: True if basic validation passes
     """
     return tick.instrument_token is not None and (tick.last_price is None or tick.last_price > 0)
+
+
+def validate_raw_tick(tick: Dict[str, Any]) -> bool:
+    """
+    Validate a raw Kite tick dict (same checks as validate_tick)
+    Used by the record path, which skips building a KiteTick model
+    
+    Args:
+        tick: Tick dict as returned by KiteTicker
+    
+    Returns:
+        bool: True if tick is valid, False otherwise
+    """
+    instrument_token = tick.get('instrument_token')
+    
+    try:
+        if not instrument_token:
+            logger.warning("validation_failed", reason="missing_instrument_token")
+            return False
+        
+        last_price = tick.get('last_price')
+        if last_price is not None and last_price < 0:
+            logger.warning("validation_failed", reason="negative_last_price", value=last_price, instrument_token=instrument_token)
+            return False
+        
+        volume_traded = tick.get('volume_traded')
+        if volume_traded is not None and volume_traded < 0:
+            logger.warning("validation_failed", reason="negative_volume", value=volume_traded, instrument_token=instrument_token)
+            return False
+        
+        return True
+    
+    except Exception as e:
+        logger.error("validation_error", error=str(e), instrument_token=instrument_token)
+        return False
@@ -0,0 +1,185 @@
+"""
+Parity check + benchmark: TICK_METRICS_MODE=numpy vs scalar
+Replays recorded Dhan NIFTY futures ticks (dhan_nifty_futures_ticks.csv in the
+repo root, also fanned out as several interleaved instruments) and synthetic
+edge cases (missing/None fields, empty/short depth, zero ticks at the
+weighted mid, duplicates, seeded state with a NULL aggressor_side) through
+enrich_ticks() in both modes, in random-sized batches, carrying the
+previous-tick state across batches like bulk_insert_ticks does. Every
+enriched tick (values and Python types, in order) and the resulting state
+must be identical; the scalar mode is calculate_tick_metrics per tick.
+Then times the enrichment step of bulk_insert_ticks in both modes at 1k, 10k
+and 50k-tick batches over 300 instruments
+
+Usage:
+    DATABASE_URL=postgresql://localhost/bench python bench_tick_metrics.py
+(db_writer builds its engine at import; no connection is made)
+"""
+
+import csv
+import gc
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Dict
+
+from db_writer import enrich_ticks
+from tick_state import snapshot
+
+RECORDED_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'dhan_nifty_futures_ticks.csv')
+BATCH_SIZES = [1_000, 10_000, 50_000]
+NUM_INSTRUMENTS = 300
+LEVELS = 5
+
+
+def load_recorded(fan_out: int = 4):
+    """Full-mode rows as worker tick dicts; copy k is instrument 13 + k, shifted k ticks in price"""
+    with open(RECORDED_CSV, newline='') as f:
+        rows = [row for row in csv.DictReader(f) if row['type'] == 'full']
+    
+    ticks = []
+    for k in range(fan_out):
+        for row in rows:
+            offset = 0.05 * k
+            ticks.append({
+                'time': row['time'],
+                'instrument_token': 13 + k,
+                'last_price': float(row['ltp']) + offset,
+                'volume_traded': int(row['volume']),
+                'oi': int(row['oi']),
+                'total_buy_quantity': int(row['total_buy_qty']),
+                'total_sell_quantity': int(row['total_sell_qty']),
+                'bid_prices': [float(row[f'bid_price_{i}']) + offset for i in range(1, LEVELS + 1)],
+                'bid_quantities': [int(row[f'bid_qty_{i}']) for i in range(1, LEVELS + 1)],
+                'ask_prices': [float(row[f'ask_price_{i}']) + offset for i in range(1, LEVELS + 1)],
+                'ask_quantities': [int(row[f'ask_qty_{i}']) for i in range(1, LEVELS + 1)],
+            })
+    ticks.sort(key=lambda t: (t['time'], t['instrument_token']))
+    return ticks
+
+
+def build_synthetic(count: int, instruments: int = NUM_INSTRUMENTS, edge_cases: bool = True):
+    start = datetime(2026, 1, 5, 9, 15)
+    state = {}
+    ticks = []
+    for i in range(count):
+        token = 1_000 + random.randrange(instruments)
+        price, volume = state.get(token, (100.0, 0))
+        price = round(max(price + random.choice([-0.1, -0.05, 0, 0, 0.05, 0.1]), 0.05), 2)
+        volume += random.choice([0, 0, 25, 75, 150])
+        state[token] = (price, volume)
+        
+        spread = random.choice([0.05, 0.1, 0.2])
+        bid_qty = [random.choice([0, 25, 50, 75, 300]) for _ in range(LEVELS)]
+        ask_qty = [random.choice([0, 25, 50, 75, 300]) for _ in range(LEVELS)]
+        tick = {
+            'time': (start + timedelta(milliseconds=i * 3)).isoformat(),
+            'instrument_token': token,
+            'last_price': price,
+            'volume_traded': volume,
+            'oi': random.randint(0, 10 ** 6),
+            'total_buy_quantity': random.randint(0, 10 ** 5),
+            'total_sell_quantity': random.randint(0, 10 ** 5),
+            'bid_prices': [round(price - spread / 2 - 0.05 * k, 2) for k in range(LEVELS)],
+            'bid_quantities': bid_qty,
+            'ask_prices': [round(price + spread / 2 + 0.05 * k, 2) for k in range(LEVELS)],
+            'ask_quantities': ask_qty,
+        }
+        if random.random() < 0.3:
+            # Symmetric top of book: the trade prints at the weighted mid (tick rule, zero ticks)
+            tick['bid_prices'][0] = round(price - 0.05, 2)
+            tick['ask_prices'][0] = round(price + 0.05, 2)
+            bid_qty[0] = ask_qty[0] = 50
+        
+        if edge_cases:
+            roll = random.random()
+            if roll < 0.03:
+                tick.pop(random.choice(['volume_traded', 'oi', 'last_price', 'total_buy_quantity']))
+            elif roll < 0.05:
+                tick[random.choice(['volume_traded', 'last_price', 'total_sell_quantity'])] = None
+            elif roll < 0.08:
+                tick[random.choice(['bid_prices', 'ask_prices', 'bid_quantities', 'ask_quantities'])] = []
+            elif roll < 0.10:
+                tick['bid_prices'][0] = None
+                tick['ask_quantities'] = [None, 10, None]
+            elif roll < 0.12:
+                tick['aggressor_side'] = random.choice(['BUY', 'SELL', None])
+            elif roll < 0.14 and ticks:
+                # Duplicate delivery of an earlier tick
+                tick = dict(random.choice(ticks[-50:]))
+            elif roll < 0.16:
+                tick['last_price'] = tick['bid_prices'][0]
+        
+        ticks.append(tick)
+    
+    ticks.sort(key=lambda t: (t['time'], t['instrument_token']))
+    return ticks
+
+
+def seed_state(ticks):
+    """Previous-tick state as restored from a checkpoint or SEED_SQL, some rows with NULL aggressor_side"""
+    state = {}
+    for tick in ticks:
+        seeded = snapshot(tick)
+        seeded['aggressor_side'] = random.choice(['BUY', 'SELL', 'NEUTRAL', None])
+        state[tick['instrument_token']] = seeded
+    return state
+
+
+def typed(tick):
+    return [(key, type(value), value) for key, value in tick.items()]
+
+
+def check_parity(name: str, ticks, previous):
+    scalar_previous, numpy_previous = dict(previous), dict(previous)
+    position = 0
+    batches = 0
+    aggressors = {}
+    while position < len(ticks):
+        size = random.choice([1, 2, 7, 50, 333, 1_000])
+        batch = ticks[position:position + size]
+        position += size
+        batches += 1
+        
+        expected, expected_state = enrich_ticks(batch, scalar_previous, "scalar")
+        actual, actual_state = enrich_ticks(batch, numpy_previous, "numpy")
+        assert list(expected) == list(actual)
+        for key, tick in expected.items():
+            assert typed(tick) == typed(actual[key]), (tick, actual[key])
+            aggressors[tick['aggressor_side']] = aggressors.get(tick['aggressor_side'], 0) + 1
+        assert expected_state == actual_state
+        
+        scalar_previous.update(expected_state)
+        numpy_previous.update(actual_state)
+    
+    print(f"parity ({name}): {len(ticks)} ticks in {batches} batches identical, aggressor mix {aggressors}")
+
+
+def timed(ticks, previous, rounds: int = 9) -> Dict[str, float]:
+    """Best of several rounds per mode; the modes alternate inside each round so drift hits both"""
+    best = {"scalar": float('inf'), "numpy": float('inf')}
+    for _ in range(rounds):
+        for mode in best:
+            gc.collect()
+            start = time.perf_counter()
+            enrich_ticks(ticks, previous, mode)
+            best[mode] = min(best[mode], time.perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    random.seed(23)
+    
+    check_parity('recorded', load_recorded(), {})
+    check_parity('synthetic', build_synthetic(30_000), seed_state(build_synthetic(NUM_INSTRUMENTS * 5)))
+    
+    print(f"{'batch':>8} | {'scalar':>10} | {'numpy':>10} | speedup")
+    for size in BATCH_SIZES:
+        ticks = build_synthetic(size, edge_cases=False)
+        # Previous ticks for every instrument, as in steady state
+        previous = seed_state(build_synthetic(NUM_INSTRUMENTS * 5, edge_cases=False))
+        best = timed(ticks, previous)
+        scalar, vectorized = best["scalar"], best["numpy"]
+        print(f"{size:>8} | {scalar / size * 1e6:7.2f} us | {vectorized / size * 1e6:7.2f} us | {scalar / vectorized:6.1f}x")
+    print("(times are per tick: metrics, merge into tick copies, dedup and previous-tick state, as in bulk_insert_ticks)")
@@ -1,46 +1,75 @@
 """
 RabbitMQ Consumer for Tick Data
 Consumes messages from ticks_queue and writes directly to database
+
+Two stages: the main thread owns the pika connection, decodes messages and
+accumulates a batch; full (or timed out) batches are handed to a writer
+thread through a one-slot queue, so one batch can be written while the next
+one fills (double buffering) and the connection keeps servicing heartbeats
+and deliveries during slow inserts. After a commit the writer schedules one
+basic_ack(multiple=True) for the batch's last delivery tag back on the
+connection thread (add_callback_threadsafe; pika is not thread safe).
 """
 
 import os
 import sys
 import json
+import queue
 import signal
+import threading
 import time
 import pika
 import structlog
-import logging
+from functools import partial
 from typing import Dict, Any, List
-from db_writer import bulk_insert_ticks, test_connection
-
-# Configure logging
-structlog.configure(
-    processors=[
-        structlog.processors.TimeStamper(fmt="iso"),
-        structlog.processors.add_log_level,
-        structlog.processors.JSONRenderer()
-    ],
-    wrapper_class=structlog.make_filtering_bound_logger(logging.INFO),
-    context_class=dict,
-    logger_factory=structlog.PrintLoggerFactory(),
+from db_writer import (
+    bulk_insert_ticks, test_connection, close_connections, restore_previous_ticks, checkpoint_previous_ticks,
+    log_counters as db_writer_counters
 )
+from tick_wire import decode_body, WireFormatError, queue_name
+from log_config import configure_logging, HotPathCounters
+from latency import LatencyTracker, start_metrics_server
+
+# Configure logging (rate limited, queued writer - see log_config.py)
+configure_logging(os.getenv("LOG_LEVEL", "INFO"))
 
 logger = structlog.get_logger()
 
+# Per-flush events, logged as a periodic consumer_summary line
+flush_counters = HotPathCounters("consumer_summary")
+
+# Hop latencies from x-tick-trace headers (see latency.py)
+latency_tracker = LatencyTracker()
+
 # Configuration
 RABBITMQ_URL = os.getenv("RABBITMQ_URL")
-QUEUE_NAME = "ticks_queue"
+# Instrument-partitioned queues: each worker consumes exactly one partition so
+# all ticks of an instrument reach the same process (db_writer keeps
+# per-instrument state for volume_delta / cvd_change / aggressor_side)
+TICK_QUEUE_PARTITIONS = int(os.getenv("TICK_QUEUE_PARTITIONS", 1))
+TICK_QUEUE_PARTITION = (
+    int(os.getenv("TICK_QUEUE_PARTITION", int(os.getenv("WORKER_ID", 1)) - 1))  # Defaults to WORKER_ID - 1
+    if TICK_QUEUE_PARTITIONS > 1 else 0
+)
+QUEUE_NAME = queue_name(TICK_QUEUE_PARTITION, TICK_QUEUE_PARTITIONS)
 BATCH_SIZE = int(os.getenv("BATCH_SIZE", 1000))
 BATCH_TIMEOUT = int(os.getenv("BATCH_TIMEOUT", 5))
 PREFETCH_COUNT = int(os.getenv("PREFETCH_COUNT", 100))
+FLUSH_RETRY_DELAY = float(os.getenv("FLUSH_RETRY_DELAY", 1))  # Seconds before the writer retries a failed batch
 
-# Global state
+# Global state (main thread)
 tick_batch = []
-delivery_tags = []  # Track delivery tags for batch acknowledgment
+last_delivery_tag = None  # Highest delivery tag in tick_batch; one multiple=True ack covers the batch
+batch_messages = 0  # Messages in tick_batch
+batch_traces = []  # LatencyTracker traces of the messages in tick_batch
 last_flush_time = time.time()
 should_stop = False
 
+# Main thread -> writer thread: (ticks, last delivery tag, message count, traces), None to stop.
+# One queued batch plus the one being written; further ticks keep accumulating in
+# tick_batch, bounded by PREFETCH_COUNT unacked messages
+flush_queue: queue.Queue = queue.Queue(maxsize=1)
+
 
 def signal_handler(signum, frame):
     """Handle shutdown signals gracefully"""
@@ -49,73 +78,119 @@ def signal_handler(signum, frame):
     should_stop = True
 
 
-def flush_batch(channel=None):
-    """Flush current batch to database and acknowledge messages"""
-    global tick_batch, delivery_tags, last_flush_time
+def hand_off_batch() -> bool:
+    """
+    Pass the accumulated batch to the writer thread (main thread)
+    
+    Returns:
+        bool: False if the writer still has a batch queued; tick_batch then
+            keeps growing and is handed off on a later check
+    """
+    global tick_batch, last_delivery_tag, batch_messages, batch_traces, last_flush_time
     
     if not tick_batch:
-        return
+        return True
+    
+    try:
+        flush_queue.put_nowait((tick_batch, last_delivery_tag, batch_messages, batch_traces))
+    except queue.Full:
+        flush_counters.add("handoff_deferred")
+        return False
     
-    batch_to_flush = tick_batch.copy()
-    tags_to_ack = delivery_tags.copy()
+    tick_batch = []
+    last_delivery_tag = None
+    batch_messages = 0
+    batch_traces = []
+    last_flush_time = time.time()
+    return True
+
+
+def flush_batch(ticks: List[Dict], traces: List) -> bool:
+    """
+    Write one handed-off batch to the database (writer thread)
     
+    Returns:
+        bool: True once committed
+    """
     try:
         start_time = time.time()
-        batch_size = len(batch_to_flush)
-        
-        logger.info("flushing_batch", size=batch_size)
         
         # Insert to database
-        rows_inserted = bulk_insert_ticks(batch_to_flush)
+        rows_inserted = bulk_insert_ticks(ticks)
         
         elapsed = time.time() - start_time
+        latency_tracker.batch_committed(traces)
         
-        logger.info(
-            "batch_flushed",
-            inserted=rows_inserted,
-            batch_size=batch_size,
-            elapsed_seconds=round(elapsed, 2)
-        )
+        flush_counters.add("batch_flushed", ticks=len(ticks), inserted=rows_inserted, seconds=elapsed)
+        return True
+    
+    except Exception as e:
+        logger.error("batch_flush_failed", error=str(e), batch_size=len(ticks))
+        return False
+
+
+def ack_batch(channel, delivery_tag: int, messages: int):
+    """Ack every message up to delivery_tag (connection thread, via add_callback_threadsafe)"""
+    try:
+        channel.basic_ack(delivery_tag=delivery_tag, multiple=True)
+        logger.debug("batch_acknowledged", count=messages)
+    except Exception as ack_error:
+        logger.error("ack_failed", delivery_tag=delivery_tag, error=str(ack_error))
+
+
+def writer_loop(connection, channel):
+    """
+    Writer thread: flush handed-off batches in order and schedule their acks
+    
+    A failed batch is retried until it commits, never skipped: a later
+    multiple=True ack would also ack its messages. bulk_insert_ticks only
+    advances its previous-tick state once a write commits, so each attempt
+    computes the same metrics. On shutdown a failing batch is left unacked
+    and redelivered.
+    """
+    while True:
+        item = flush_queue.get()
+        if item is None:
+            return
         
-        # Only clear batch and ack messages after successful DB write
-        tick_batch = []
-        delivery_tags = []
-        last_flush_time = time.time()
+        ticks, delivery_tag, messages, traces = item
+        while not flush_batch(ticks, traces):
+            if should_stop:
+                # Don't ack - this and any later batches are redelivered
+                logger.critical("batch_will_be_redelivered", failed_batch_size=len(ticks))
+                return
+            time.sleep(FLUSH_RETRY_DELAY)
         
-        # Acknowledge all messages in batch
-        if channel and tags_to_ack:
-            for tag in tags_to_ack:
-                try:
-                    channel.basic_ack(delivery_tag=tag)
-                except Exception as ack_error:
-                    logger.error("ack_failed", delivery_tag=tag, error=str(ack_error))
-            
-            logger.debug("batch_acknowledged", count=len(tags_to_ack))
-        
-    except Exception as e:
-        logger.error("batch_flush_failed", error=str(e), batch_size=len(batch_to_flush))
-        # Don't clear batch or ack on failure - messages will be redelivered
-        logger.critical("batch_will_be_redelivered", failed_batch_size=len(batch_to_flush))
+        try:
+            connection.add_callback_threadsafe(partial(ack_batch, channel, delivery_tag, messages))
+        except Exception as e:
+            # Connection gone: the broker redelivers the unacked messages
+            logger.error("ack_schedule_failed", delivery_tag=delivery_tag, error=str(e))
 
 
 def process_message(ch, method, properties, body):
     """Process a single message from RabbitMQ"""
-    global tick_batch, delivery_tags, last_flush_time
+    global last_delivery_tag, batch_messages
     
     try:
-        # Parse JSON
-        tick_data = json.loads(body)
+        # Decompress by content_encoding, then decode by content_type (columnar binary batch or JSON)
+        tick_data = decode_body(
+            body,
+            properties.content_type if properties else None,
+            properties.content_encoding if properties else None
+        )
         
         # Handle both single tick and batch of ticks
-        if isinstance(tick_data, list):
-            # Batch of ticks from ingestion service
-            tick_batch.extend(tick_data)
-            # Store delivery tag once for the entire batch message
-            delivery_tags.append(method.delivery_tag)
-        else:
+        if not isinstance(tick_data, list):
             # Single tick (backward compatibility)
-            tick_batch.append(tick_data)
-            delivery_tags.append(method.delivery_tag)
+            tick_data = [tick_data]
+        tick_batch.extend(tick_data)
+        
+        # Delivery tags increase per channel; the last one acks the whole batch
+        last_delivery_tag = method.delivery_tag
+        batch_messages += 1
+        
+        batch_traces.append(latency_tracker.message_received(properties.headers if properties else None, tick_data))
         
         # Check if we should flush
         should_flush = (
@@ -124,14 +199,24 @@ def process_message(ch, method, properties, body):
         )
         
         if should_flush:
-            flush_batch(ch)
+            hand_off_batch()
         
-        # Note: Acknowledgment now happens in flush_batch after successful DB write
+        # Note: Acknowledgment happens after the writer thread commits the batch
         
     except json.JSONDecodeError as e:
         logger.error("invalid_json", error=str(e))
         # Reject and discard bad message
         ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+    
+    except WireFormatError as e:
+        logger.error(
+            "unsupported_message_format",
+            error=str(e),
+            content_type=properties.content_type if properties else None,
+            content_encoding=properties.content_encoding if properties else None
+        )
+        # Reject and discard - this worker cannot decode it
+        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
         
     except Exception as e:
         logger.error("message_processing_failed", error=str(e))
@@ -154,6 +239,14 @@ def main():
         logger.error("rabbitmq_url_not_configured")
         sys.exit(1)
     
+    if not 0 <= TICK_QUEUE_PARTITION < TICK_QUEUE_PARTITIONS:
+        logger.error(
+            "invalid_queue_partition",
+            partition=TICK_QUEUE_PARTITION,
+            partitions=TICK_QUEUE_PARTITIONS
+        )
+        sys.exit(1)
+    
     # Test database connection
     if not test_connection():
         logger.error("database_connection_failed")
@@ -161,6 +254,12 @@ def main():
     
     logger.info("database_connected")
     
+    # Warm start: previous tick per instrument from the Redis checkpoint (the rest seed from ticks)
+    restore_previous_ticks()
+    
+    # Prometheus /metrics (hop latencies)
+    start_metrics_server()
+    
     # Connect to RabbitMQ
     max_retries = 10
     retry_delay = 5
@@ -180,7 +279,7 @@ def main():
             channel = connection.channel()
             
             # Declare queue (idempotent - creates if doesn't exist)
-            channel.queue_declare(
+            declared = channel.queue_declare(
                 queue=QUEUE_NAME,
                 durable=True,
                 arguments={
@@ -189,12 +288,22 @@ def main():
                 }
             )
             
+            if TICK_QUEUE_PARTITIONS > 1 and declared.method.consumer_count > 0:
+                # A second consumer on a partition breaks per-instrument ordering
+                logger.warning(
+                    "partition_already_consumed",
+                    queue=QUEUE_NAME,
+                    consumer_count=declared.method.consumer_count
+                )
+            
             # Set QoS - prefetch messages
             channel.basic_qos(prefetch_count=PREFETCH_COUNT)
             
             logger.info(
                 "rabbitmq_connected",
                 queue=QUEUE_NAME,
+                partition=TICK_QUEUE_PARTITION,
+                partitions=TICK_QUEUE_PARTITIONS,
                 prefetch=PREFETCH_COUNT
             )
             break
@@ -216,7 +325,11 @@ def main():
     try:
         logger.info("starting_consumer", queue=QUEUE_NAME)
         
-        channel.basic_consume(
+        # DB writes run on the writer thread; this thread keeps servicing the connection
+        writer = threading.Thread(target=writer_loop, args=(connection, channel), name="tick-writer", daemon=True)
+        writer.start()
+        
+        consumer_tag = channel.basic_consume(
             queue=QUEUE_NAME,
             on_message_callback=process_message,
             auto_ack=False  # Manual acknowledgment
@@ -229,7 +342,10 @@ def main():
                 
                 # Periodic flush check
                 if (time.time() - last_flush_time) >= BATCH_TIMEOUT and tick_batch:
-                    flush_batch(channel)
+                    hand_off_batch()
+                
+                # Latency summary for /health/latency, also while idle
+                latency_tracker.maybe_publish()
                     
             except Exception as e:
                 logger.error("consume_error", error=str(e))
@@ -238,16 +354,40 @@ def main():
         # Graceful shutdown
         logger.info("shutting_down")
         
-        # Flush remaining batch
+        # Stop deliveries (prefetched messages not yet dispatched go back to the queue)
+        channel.basic_cancel(consumer_tag)
+        
+        # Flush remaining batch, then stop the writer; the connection is serviced
+        # meanwhile so the acks it schedules go out
         if tick_batch:
             logger.info("flushing_remaining_batch", size=len(tick_batch))
-            flush_batch(channel)
+        
+        stop_sent = False
+        while writer.is_alive():
+            if tick_batch:
+                hand_off_batch()
+            elif not stop_sent:
+                try:
+                    flush_queue.put_nowait(None)
+                    stop_sent = True
+                except queue.Full:
+                    pass
+            connection.process_data_events(time_limit=0.1)
+        
+        # Acks scheduled after the last write
+        connection.process_data_events(time_limit=0)
+        
+        checkpoint_previous_ticks()
+        flush_counters.flush()
+        db_writer_counters.flush()
+        logger.info("latency_tracing_stats", **latency_tracker.get_stats())
         
         # Close connection
         if channel and channel.is_open:
             channel.close()
         if connection and connection.is_open:
             connection.close()
+        close_connections()
         
         logger.info("consumer_stopped")
         
@@ -5,25 +5,71 @@ Handles bulk inserts to TimescaleDB for optimal performance
 
 import os
 import io
+import time
 import structlog
-from typing import List, Dict, Optional
-from sqlalchemy import create_engine
+from typing import Callable, List, Dict, Optional, Tuple
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import QueuePool
 import psycopg2
 from psycopg2.extras import execute_batch
 from datetime import datetime
+from log_config import HotPathCounters
+from tick_copy import ARRAY_COLUMNS, COPY_FORMATS, TICK_COLUMNS, copy_sql, encode, merge_sql, staging_ddl
+from latency import FLUSH_PHASES, FLUSH_PHASE_SECONDS
+from tick_state import TickStateCheckpoint, seed_rows, snapshot
 
 logger = structlog.get_logger()
 
+# Per-batch events, logged as a periodic db_writer_summary line
+log_counters = HotPathCounters("db_writer_summary")
+
 # Database configuration
 DATABASE_URL = os.getenv("DATABASE_URL")
+WORKER_ID = os.getenv("WORKER_ID", "1")
+
+# Tick write path: "insert" (execute_batch) or "copy" (COPY into a staging table + INSERT ... SELECT)
+TICK_WRITE_MODE = os.getenv("TICK_WRITE_MODE", "insert").lower()
+TICK_COPY_FORMAT = os.getenv("TICK_COPY_FORMAT", "text").lower()  # text | binary
+TICK_COPY_STAGING = os.getenv("TICK_COPY_STAGING", "temp").lower()  # temp (ON COMMIT DROP) | unlogged (per worker)
+
+# Per-tick metrics: "scalar" (calculate_tick_metrics per tick) or "numpy" (whole batch, tick_metrics_columnar)
+TICK_METRICS_MODE = os.getenv("TICK_METRICS_MODE", "scalar").lower()
+
+# Prepare the row INSERT once per pooled connection and EXECUTE it per row. Needs
+# session-level connections (direct to TimescaleDB or PgBouncer session mode): with
+# PgBouncer transaction pooling a later transaction may land on a server connection
+# that never saw the PREPARE
+DB_PREPARED_STATEMENTS = os.getenv("DB_PREPARED_STATEMENTS", "false").lower() == "true"
+
+# INSERT with ON CONFLICT DO NOTHING to skip duplicates; column order matches tick_copy.COPY_COLUMNS
+INSERT_SQL = f"""
+    INSERT INTO ticks ({', '.join(TICK_COLUMNS)})
+    VALUES ({', '.join(['%s'] * len(TICK_COLUMNS))})
+    ON CONFLICT (time, instrument_token) DO NOTHING
+"""
+PREPARE_SQL = f"""
+    PREPARE tick_insert AS
+    INSERT INTO ticks ({', '.join(TICK_COLUMNS)})
+    VALUES ({', '.join(f'${i}' for i in range(1, len(TICK_COLUMNS) + 1))})
+    ON CONFLICT (time, instrument_token) DO NOTHING
+"""
+EXECUTE_SQL = f"EXECUTE tick_insert ({', '.join(['%s'] * len(TICK_COLUMNS))})"
+ROW_INSERT_SQL = EXECUTE_SQL if DB_PREPARED_STATEMENTS else INSERT_SQL
 
 # Cache for previous tick state per instrument (for delta calculations)
 # Key: instrument_token, Value: previous tick dict
 _previous_ticks: Dict[int, Dict] = {}
 
+# Instruments already looked up in ticks for a warm start (found or not), queried once each
+_seed_checked: set = set()
+
+# Redis checkpoint of _previous_ticks, loaded at startup (see tick_state.py)
+_tick_state = TickStateCheckpoint()
+
 # Create SQLAlchemy engine with connection pooling
+# The tick writer checks raw psycopg2 connections out of this pool for every
+# flush instead of connecting per batch
 engine = create_engine(
     DATABASE_URL,
     poolclass=QueuePool,
@@ -37,6 +83,22 @@ engine = create_engine(
 # Session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Flush phase histogram children, bound once
+_phase_seconds = {phase: FLUSH_PHASE_SECONDS.labels(phase=phase) for phase in FLUSH_PHASES}
+
+
+@event.listens_for(engine, "connect")
+def _prepare_statements(dbapi_connection, connection_record):
+    """PREPARE the tick INSERT on each new pooled connection (DB_PREPARED_STATEMENTS)"""
+    if not DB_PREPARED_STATEMENTS:
+        return
+    
+    cursor = dbapi_connection.cursor()
+    cursor.execute(PREPARE_SQL)
+    cursor.close()
+    dbapi_connection.commit()
+    logger.info("tick_insert_prepared")
+
 
 def calculate_tick_metrics(tick: Dict, previous_tick: Optional[Dict]) -> Dict:
     """
@@ -197,6 +259,173 @@ def calculate_tick_metrics(tick: Dict, previous_tick: Optional[Dict]) -> Dict:
     return metrics
 
 
+def _row_tuples(ticks: List[Dict]) -> List[tuple]:
+    """Parameter tuples in TICK_COLUMNS order (non-list depth arrays become NULL)"""
+    data_tuples = []
+    for tick in ticks:
+        row = []
+        for col in TICK_COLUMNS:
+            value = tick.get(col)
+            
+            # psycopg2 handles list -> array conversion
+            if col in ARRAY_COLUMNS and not isinstance(value, list):
+                value = None
+            row.append(value)
+        
+        data_tuples.append(tuple(row))
+    return data_tuples
+
+
+def copy_insert(
+    cursor,
+    ticks: List[Dict],
+    copy_format: str = TICK_COPY_FORMAT,
+    staging: str = TICK_COPY_STAGING,
+    table: str = "ticks"
+) -> int:
+    """
+    COPY ticks into a staging table and merge them into the target table
+    (see copy_payload)
+    
+    Returns:
+        int: Rows actually inserted (duplicates of existing rows excluded)
+    """
+    return copy_payload(cursor, encode(ticks, copy_format), copy_format, staging, table)
+
+
+def copy_payload(
+    cursor,
+    payload: bytes,
+    copy_format: str = TICK_COPY_FORMAT,
+    staging: str = TICK_COPY_STAGING,
+    table: str = "ticks"
+) -> int:
+    """
+    COPY an encoded batch into a staging table and merge it into the target table
+    
+    Runs in the caller's transaction; the caller commits. A temp staging
+    table is created per batch and dropped at commit, so nothing outlives
+    the transaction (PgBouncer runs in transaction pooling mode). An unlogged
+    staging table is created once per worker and truncated per batch.
+    
+    Args:
+        cursor: psycopg2 cursor
+        payload: tick_copy.encode() output for deduplicated ticks with metrics
+        copy_format: "text" or "binary", as encoded
+        staging: "temp" or "unlogged"
+        table: Target table (benchmarks use a scratch copy of ticks)
+    
+    Returns:
+        int: Rows actually inserted (duplicates of existing rows excluded)
+    """
+    if copy_format not in COPY_FORMATS:
+        raise ValueError(f"TICK_COPY_FORMAT must be one of {COPY_FORMATS}, got {copy_format!r}")
+    
+    if staging == "temp":
+        staging_table = f"{table}_copy_staging"
+        cursor.execute(staging_ddl(staging_table, temporary=True))
+    elif staging == "unlogged":
+        staging_table = f"{table}_staging_w{WORKER_ID}"
+        cursor.execute(staging_ddl(staging_table, temporary=False))
+        cursor.execute(f"TRUNCATE {staging_table}")
+    else:
+        raise ValueError(f"TICK_COPY_STAGING must be temp or unlogged, got {staging!r}")
+    
+    cursor.copy_expert(copy_sql(staging_table, copy_format), io.BytesIO(payload))
+    cursor.execute(merge_sql(staging_table, table))
+    return cursor.rowcount
+
+
+def _run_write(write: Callable, timings: Dict[str, float]):
+    """
+    Run write(cursor) and commit on a pooled connection
+    
+    Checkout pre-pings the connection (pool_pre_ping), so one the server or
+    PgBouncer dropped while idle is replaced before use. A connection lost
+    mid-batch is invalidated and the batch retried once on a fresh one; ON
+    CONFLICT DO NOTHING makes the retry safe.
+    
+    Args:
+        write: Callable taking a cursor, returning the write's result
+        timings: Phase -> seconds; connect, execute and commit are added
+    """
+    for attempt in range(2):
+        started = time.perf_counter()
+        conn = engine.raw_connection()
+        timings['connect'] += time.perf_counter() - started
+        
+        try:
+            cursor = conn.cursor()
+            
+            started = time.perf_counter()
+            result = write(cursor)
+            timings['execute'] += time.perf_counter() - started
+            
+            started = time.perf_counter()
+            conn.commit()
+            timings['commit'] += time.perf_counter() - started
+            
+            cursor.close()
+            return result
+        
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            # Broken connection - drop it from the pool
+            conn.invalidate()
+            if attempt:
+                raise
+            log_counters.add("db_reconnect")
+            logger.warning("db_connection_lost_retrying", error=str(e))
+        
+        finally:
+            # Back to the pool (rolled back if the write failed)
+            conn.close()
+
+
+def _seed_previous_ticks(instrument_tokens: set):
+    """
+    Seed the previous tick cache from the latest ticks row (current trading
+    day) of instruments first seen since startup
+    
+    Instruments without a row today stay unseeded (first tick of the day).
+    On a lookup failure they are retried with the next batch.
+    """
+    try:
+        conn = engine.raw_connection()
+        try:
+            cursor = conn.cursor()
+            seeded = seed_rows(cursor, instrument_tokens)
+            cursor.close()
+        finally:
+            conn.close()
+    
+    except Exception as e:
+        logger.warning("tick_state_seed_failed", error=str(e), instruments=len(instrument_tokens))
+        return
+    
+    _previous_ticks.update(seeded)
+    _seed_checked.update(instrument_tokens)
+    log_counters.add("tick_state_seeded", looked_up=len(instrument_tokens), seeded=len(seeded))
+
+
+def restore_previous_ticks() -> int:
+    """
+    Load the checkpointed previous-tick state (worker startup)
+    
+    Returns:
+        int: Instruments restored
+    """
+    state = _tick_state.load()
+    for instrument_token, tick in state.items():
+        _previous_ticks.setdefault(instrument_token, tick)
+    return len(state)
+
+
+def checkpoint_previous_ticks():
+    """Checkpoint the previous-tick state now (shutdown)"""
+    _tick_state.checkpoint(_previous_ticks)
+    logger.info("tick_state_stats", instruments=len(_previous_ticks), **_tick_state.get_stats())
+
+
 def get_db_engine():
     """
     Get SQLAlchemy database engine
@@ -207,9 +436,68 @@ def get_db_engine():
     return engine
 
 
+def enrich_ticks(
+    ticks: List[Dict],
+    previous_ticks: Dict[int, Dict],
+    metrics_mode: str = TICK_METRICS_MODE
+) -> Tuple[Dict[tuple, Dict], Dict[int, Dict]]:
+    """
+    Merge pre-computed metrics into a batch and deduplicate it
+    
+    Args:
+        ticks: Ticks in processing order (time-sorted), all with an instrument_token
+        previous_ticks: Previous-tick state per instrument (not modified)
+        metrics_mode: "scalar" or "numpy" (benchmarks compare both)
+    
+    Returns:
+        (enriched ticks keyed by (time, instrument_token), latest tick wins;
+        previous-tick state per instrument after the batch)
+    """
+    deduped = {}
+    updates = {}
+    
+    if metrics_mode == "numpy":
+        # Whole batch at once, seeded from previous_ticks (NumPy only imported in this mode)
+        from tick_metrics_columnar import enrich_batch
+        
+        latest = {}
+        for enriched_tick in enrich_batch(ticks, previous_ticks):
+            instrument_token = enriched_tick['instrument_token']
+            deduped[(enriched_tick.get('time'), instrument_token)] = enriched_tick
+            latest[instrument_token] = enriched_tick
+        
+        # Only each instrument's last tick becomes state
+        for instrument_token, enriched_tick in latest.items():
+            updates[instrument_token] = snapshot(enriched_tick)
+        return deduped, updates
+    
+    for tick in ticks:
+        instrument_token = tick['instrument_token']
+        
+        # Get previous tick for this instrument
+        prev_tick = updates.get(instrument_token) or previous_ticks.get(instrument_token)
+        
+        # Calculate metrics
+        metrics = calculate_tick_metrics(tick, prev_tick)
+        
+        # Merge metrics into tick
+        enriched_tick = {**tick, **metrics}
+        
+        # Deduplicate: keep latest tick per (time, instrument_token)
+        key = (tick.get('time'), instrument_token)
+        deduped[key] = enriched_tick
+        
+        # Previous tick state for the next tick: the enriched state (aggressor_side
+        # included), the same fields SEED_SQL and the checkpoint restore provide
+        updates[instrument_token] = snapshot(enriched_tick)
+    
+    return deduped, updates
+
+
 def bulk_insert_ticks(ticks: List[Dict]) -> int:
     """
     Bulk insert ticks using PostgreSQL execute_batch with ON CONFLICT
+    (or COPY through a staging table when TICK_WRITE_MODE=copy)
     Calculates and adds pre-computed metrics before insertion.
     
     Deduplicates ticks in-memory (same time + instrument_token) and uses
@@ -219,7 +507,7 @@ def bulk_insert_ticks(ticks: List[Dict]) -> int:
         ticks: List of tick dictionaries
     
     Returns:
-        int: Number of rows inserted/updated
+        int: Number of rows inserted (attempted, in insert mode)
     
     Raises:
         Exception: If insert fails
@@ -230,132 +518,66 @@ def bulk_insert_ticks(ticks: List[Dict]) -> int:
         logger.warning("bulk_insert_called_with_empty_list")
         return 0
     
+    timings = dict.fromkeys(FLUSH_PHASES, 0.0)
+    started = time.perf_counter()
+    
     # Sort by time to ensure correct ordering for delta calculations
     ticks_sorted = sorted(ticks, key=lambda t: (t.get('time', datetime.min), t.get('instrument_token', 0)))
+    ticks_sorted = [tick for tick in ticks_sorted if tick.get('instrument_token')]
     
-    # Calculate metrics and deduplicate
-    enriched_ticks = []
-    deduped = {}
+    # Instruments with no cached (or checkpointed) previous tick: seed from their latest row in ticks
+    unseen = {tick['instrument_token'] for tick in ticks_sorted}.difference(_previous_ticks, _seed_checked)
+    if unseen:
+        _seed_previous_ticks(unseen)
     
-    for tick in ticks_sorted:
-        instrument_token = tick.get('instrument_token')
-        if not instrument_token:
-            continue
-        
-        # Get previous tick for this instrument
-        prev_tick = _previous_ticks.get(instrument_token)
-        
-        # Calculate metrics
-        metrics = calculate_tick_metrics(tick, prev_tick)
-        
-        # Merge metrics into tick
-        enriched_tick = {**tick, **metrics}
-        
-        # Deduplicate: keep latest tick per (time, instrument_token)
-        key = (tick.get('time'), instrument_token)
-        deduped[key] = enriched_tick
-        
-        # Update previous tick cache
-        _previous_ticks[instrument_token] = tick
+    # Calculate metrics and deduplicate; the batch's own state reaches _previous_ticks
+    # only after the write, so a retried batch sees the same previous ticks as its first attempt
+    deduped, updates = enrich_ticks(ticks_sorted, _previous_ticks)
     
     ticks_to_insert = list(deduped.values())
+    timings['metrics'] = time.perf_counter() - started
     original_count = len(ticks)
     deduped_count = len(ticks_to_insert)
     
     if original_count > deduped_count:
-        logger.info(
-            "batch_deduplicated",
-            original=original_count,
-            deduped=deduped_count,
-            duplicates_removed=original_count - deduped_count
-        )
+        log_counters.add("batch_deduplicated", duplicates_removed=original_count - deduped_count)
     
     try:
-        # Get raw psycopg2 connection
-        conn = psycopg2.connect(DATABASE_URL)
-        cursor = conn.cursor()
+        # Encode before checking out a connection, so it is held only for the write
+        started = time.perf_counter()
+        if TICK_WRITE_MODE == "copy":
+            # COPY into staging + one INSERT ... SELECT; rowcount is the true insert count
+            payload = encode(ticks_to_insert, TICK_COPY_FORMAT)
+            write = lambda cursor: copy_payload(cursor, payload)
+        else:
+            # Execute batch insert with ON CONFLICT (silently skips duplicates)
+            data_tuples = _row_tuples(ticks_to_insert)
+            write = lambda cursor: execute_batch(cursor, ROW_INSERT_SQL, data_tuples, page_size=500)
+        timings['encode'] = time.perf_counter() - started
         
-        # Column order matching database schema (with new pre-calculated metrics)
-        columns = [
-            'time', 'last_trade_time', 'instrument_token', 'trading_symbol',
-            'exchange', 'instrument_type', 'last_price', 'last_traded_quantity',
-            'average_traded_price', 'volume_traded', 'oi', 'oi_day_high',
-            'oi_day_low', 'day_open', 'day_high', 'day_low', 'day_close',
-            'change', 'change_percent', 'total_buy_quantity', 'total_sell_quantity',
-            'bid_prices', 'bid_quantities', 'bid_orders', 'ask_prices',
-            'ask_quantities', 'ask_orders', 'tradable', 'mode',
-            # Pre-calculated metrics
-            'volume_delta', 'oi_delta', 'aggressor_side', 'cvd_change',
-            'buy_quantity_delta', 'sell_quantity_delta', 'mid_price_calc',
-            'bid_depth_total', 'ask_depth_total', 'depth_imbalance_ratio', 'price_delta',
-            # Orderflow toxicity metrics
-            'consumption_rate', 'flow_intensity', 'depth_toxicity_tick', 'kyle_lambda_tick',
-            # Legacy fields
-            'bid_ask_spread', 'mid_price', 'order_imbalance'
-        ]
+        result = _run_write(write, timings)
         
-        # Build INSERT with ON CONFLICT DO NOTHING to skip duplicates
-        cols_str = ', '.join(columns)
-        placeholders = ', '.join(['%s'] * len(columns))
+        # Note: rowcount is not available from execute_batch with ON CONFLICT DO NOTHING
+        rows_inserted = result if TICK_WRITE_MODE == "copy" else len(ticks_to_insert)
         
-        insert_sql = f"""
-            INSERT INTO ticks ({cols_str})
-            VALUES ({placeholders})
-            ON CONFLICT (time, instrument_token) DO NOTHING
-        """
-        
-        # Prepare data tuples
-        data_tuples = []
-        for tick in ticks_to_insert:
-            row = []
-            for col in columns:
-                value = tick.get(col)
-                
-                # Handle arrays - convert list to PostgreSQL array
-                if col in ['bid_prices', 'bid_quantities', 'bid_orders', 
-                           'ask_prices', 'ask_quantities', 'ask_orders']:
-                    if isinstance(value, list):
-                        row.append(value)  # psycopg2 handles list -> array conversion
-                    else:
-                        row.append(None)
-                else:
-                    row.append(value)
-            
-            data_tuples.append(tuple(row))
+        for phase, seconds in timings.items():
+            _phase_seconds[phase].observe(seconds)
         
-        # Execute batch insert with ON CONFLICT (silently skips duplicates)
-        execute_batch(cursor, insert_sql, data_tuples, page_size=500)
+        # Previous-tick state of committed instruments, every TICK_STATE_CHECKPOINT_INTERVAL
+        _previous_ticks.update(updates)
+        _tick_state.touched.update(updates)
+        _tick_state.maybe_checkpoint(_previous_ticks)
         
-        # Commit transaction
-        conn.commit()
-        
-        # Note: rowcount may not be accurate with ON CONFLICT DO NOTHING
-        rows_inserted = len(ticks_to_insert)
-        
-        logger.info(
+        log_counters.add(
             "bulk_insert_successful",
-            rows_attempted=rows_inserted,
-            original_batch_size=original_count,
-            deduped_batch_size=deduped_count,
-            note="duplicates_silently_skipped_via_on_conflict"
+            rows_attempted=len(ticks_to_insert),
+            rows_inserted=rows_inserted,
+            **{f"{phase}_seconds": seconds for phase, seconds in timings.items()}
         )
         
-        # Cleanup
-        cursor.close()
-        conn.close()
-        
         return rows_inserted
     
     except Exception as e:
-        # Ensure cleanup on error
-        try:
-            if 'cursor' in locals() and cursor:
-                cursor.close()
-            if 'conn' in locals() and conn:
-                conn.close()
-        except:
-            pass
-        
         logger.error(
             "bulk_insert_failed",
             error=str(e),
@@ -365,7 +587,10 @@ def bulk_insert_ticks(ticks: List[Dict]) -> int:
         # Try fallback method using SQLAlchemy
         try:
             logger.warning("attempting_fallback_insert_method")
-            return _bulk_insert_fallback(ticks_to_insert)
+            rows_inserted = _bulk_insert_fallback(ticks_to_insert)
+            _previous_ticks.update(updates)
+            _tick_state.touched.update(updates)
+            return rows_inserted
         except Exception as fallback_error:
             logger.error(
                 "fallback_insert_also_failed",
@@ -385,72 +610,21 @@ def _bulk_insert_fallback(ticks: List[Dict]) -> int:
     Returns:
         int: Number of rows inserted/updated
     """
-    try:
-        # Get raw psycopg2 connection for ON CONFLICT support
-        conn = psycopg2.connect(DATABASE_URL)
-        cursor = conn.cursor()
-        
-        # Column order matching database schema (with new pre-calculated metrics)
-        columns = [
-            'time', 'last_trade_time', 'instrument_token', 'trading_symbol',
-            'exchange', 'instrument_type', 'last_price', 'last_traded_quantity',
-            'average_traded_price', 'volume_traded', 'oi', 'oi_day_high',
-            'oi_day_low', 'day_open', 'day_high', 'day_low', 'day_close',
-            'change', 'change_percent', 'total_buy_quantity', 'total_sell_quantity',
-            'bid_prices', 'bid_quantities', 'bid_orders', 'ask_prices',
-            'ask_quantities', 'ask_orders', 'tradable', 'mode',
-            # Pre-calculated metrics
-            'volume_delta', 'oi_delta', 'aggressor_side', 'cvd_change',
-            'buy_quantity_delta', 'sell_quantity_delta', 'mid_price_calc',
-            'bid_depth_total', 'ask_depth_total', 'depth_imbalance_ratio', 'price_delta',
-            # Orderflow toxicity metrics
-            'consumption_rate', 'flow_intensity', 'depth_toxicity_tick', 'kyle_lambda_tick',
-            # Legacy fields
-            'bid_ask_spread', 'mid_price', 'order_imbalance'
-        ]
-        
-        # Build INSERT with ON CONFLICT DO NOTHING to skip duplicates
-        cols_str = ', '.join(columns)
-        placeholders = ', '.join(['%s'] * len(columns))
-        
-        insert_sql = f"""
-            INSERT INTO ticks ({cols_str})
-            VALUES ({placeholders})
-            ON CONFLICT (time, instrument_token) DO NOTHING
-        """
-        
-        # Prepare data tuples
-        data_tuples = []
-        for tick in ticks:
-            row = []
-            for col in columns:
-                value = tick.get(col)
-                
-                # Handle arrays - convert list to PostgreSQL array
-                if col in ['bid_prices', 'bid_quantities', 'bid_orders', 
-                           'ask_prices', 'ask_quantities', 'ask_orders']:
-                    if isinstance(value, list):
-                        row.append(value)  # psycopg2 handles list -> array conversion
-                    else:
-                        row.append(None)
-                else:
-                    row.append(value)
-            
-            data_tuples.append(tuple(row))
-        
+    def write(cursor) -> int:
         # Execute inserts one by one (slower but handles duplicates)
         inserted_count = 0
-        for data_tuple in data_tuples:
+        for data_tuple in _row_tuples(ticks):
             try:
-                cursor.execute(insert_sql, data_tuple)
+                cursor.execute(ROW_INSERT_SQL, data_tuple)
                 if cursor.rowcount > 0:
                     inserted_count += cursor.rowcount
             except Exception as row_error:
                 logger.warning("fallback_row_insert_failed", error=str(row_error))
                 continue
-        
-        # Commit transaction
-        conn.commit()
+        return inserted_count
+    
+    try:
+        inserted_count = _run_write(write, dict.fromkeys(FLUSH_PHASES, 0.0))
         
         logger.info(
             "fallback_insert_successful",
@@ -459,22 +633,9 @@ def _bulk_insert_fallback(ticks: List[Dict]) -> int:
             duplicates_skipped=len(ticks) - inserted_count
         )
         
-        # Cleanup
-        cursor.close()
-        conn.close()
-        
         return inserted_count
     
     except Exception as e:
-        # Ensure cleanup on error
-        try:
-            if 'cursor' in locals() and cursor:
-                cursor.close()
-            if 'conn' in locals() and conn:
-                conn.close()
-        except:
-            pass
-        
         logger.error("fallback_insert_failed", error=str(e))
         raise
 
@@ -487,11 +648,14 @@ def test_connection() -> bool:
         bool: True if connection successful
     """
     try:
-        conn = psycopg2.connect(DATABASE_URL)
-        cursor = conn.cursor()
-        cursor.execute("SELECT 1;")
-        cursor.close()
-        conn.close()
+        # Checked back into the pool, so the first flush reuses it
+        conn = engine.raw_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1;")
+            cursor.close()
+        finally:
+            conn.close()
         
         logger.info("database_connection_test_successful")
         return True
@@ -501,5 +665,10 @@ def test_connection() -> bool:
         return False
 
 
+def close_connections():
+    """Close pooled connections (shutdown)"""
+    engine.dispose()
+
+
 # Import Tick model for fallback method
 from models import Tick
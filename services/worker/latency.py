@@ -0,0 +1,338 @@
+"""
+Pipeline Latency Tracing
+Per-hop tick latency from the x-tick-trace headers set by the ingestion service
+
+Each batch message carries the WebSocket receive, enrich-done and publish
+times of its oldest tick (tick_wire.trace_headers). The consumer adds its
+receive time and the DB commit time and records, per source:
+
+    enrich    WebSocket receive -> enrichment done
+    batch     enrichment done -> publish (batching, encoding)
+    broker    publish -> consumer receive (RabbitMQ queueing)
+    consume   consumer receive -> DB commit (worker batching, insert)
+    total     WebSocket receive -> DB commit
+
+plus exchange -> commit latency (last_trade_time to DB commit) for every
+TRACE_TICK_SAMPLE_RATE-th tick.
+
+Latencies go to Prometheus histograms on WORKER_METRICS_PORT and to a
+windowed bucket count written to Redis as latency:worker:<WORKER_ID> every
+LATENCY_SUMMARY_INTERVAL seconds, which the API merges for /health/latency.
+Hops spanning two hosts assume their clocks are in sync; negative values
+(clock skew) are recorded as 0.
+
+The consume hop is further split by db_writer into flush phases (metrics,
+encode, connect, execute, commit) on tick_flush_phase_seconds.
+"""
+
+import os
+import json
+import time
+import threading
+import structlog
+from bisect import bisect_left
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+import redis
+from prometheus_client import Histogram, start_http_server
+
+from tick_wire import parse_trace
+
+logger = structlog.get_logger()
+
+IST = ZoneInfo('Asia/Kolkata')
+
+WORKER_ID = os.getenv("WORKER_ID", "1")
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", 9110 + int(WORKER_ID)))  # 0 = disabled
+TRACE_TICK_SAMPLE_RATE = max(int(os.getenv("TRACE_TICK_SAMPLE_RATE", 10)), 1)  # 1 in N ticks for exchange -> commit
+LATENCY_SUMMARY_INTERVAL = float(os.getenv("LATENCY_SUMMARY_INTERVAL", 30))  # Seconds per Redis summary window
+REDIS_KEY_PREFIX = "latency:worker:"
+
+HOPS = ('enrich', 'batch', 'broker', 'consume', 'total')
+EXCHANGE_HOP = 'exchange_to_commit'
+
+# Upper bounds in seconds; the Redis window uses the same buckets (+Inf last)
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0
+)
+
+HOP_SECONDS = Histogram(
+    'tick_hop_latency_seconds',
+    'Tick batch latency per pipeline hop (oldest tick of each batch)',
+    ['hop', 'source'],
+    buckets=LATENCY_BUCKETS
+)
+EXCHANGE_TO_COMMIT_SECONDS = Histogram(
+    'tick_exchange_to_commit_seconds',
+    'Exchange last_trade_time to DB commit, sampled ticks',
+    ['source'],
+    buckets=LATENCY_BUCKETS
+)
+
+
+# bulk_insert_ticks phases: metric calculation, row/COPY encoding, pool checkout
+# (incl. pre-ping or reconnect), INSERT/COPY, commit
+FLUSH_PHASES = ('metrics', 'encode', 'connect', 'execute', 'commit')
+FLUSH_PHASE_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+)
+FLUSH_PHASE_SECONDS = Histogram(
+    'tick_flush_phase_seconds',
+    'Time per phase of one DB flush (bulk_insert_ticks)',
+    ['phase'],
+    buckets=FLUSH_PHASE_BUCKETS
+)
+
+
+class MessageTrace:
+    """Hop timestamps and sampled ticks of one consumed message, held until its batch commits"""
+    
+    __slots__ = ('source', 'stamps', 'consumed_at', 'ticks')
+    
+    def __init__(self, source: str, stamps: Optional[List[float]], consumed_at: float, ticks: List[Tuple]):
+        self.source = source
+        self.stamps = stamps
+        self.consumed_at = consumed_at
+        self.ticks = ticks
+
+
+class LatencyTracker:
+    """
+    Records hop and exchange -> commit latencies for committed batches
+    
+    message_received() runs once per consumed message, batch_committed()
+    once per DB flush; both are cheap enough to leave on (one header read per
+    message, one timestamp parse per distinct sampled last_trade_time).
+    """
+    
+    def __init__(
+        self,
+        worker_id: str = WORKER_ID,
+        redis_url: Optional[str] = None,
+        sample_rate: int = TRACE_TICK_SAMPLE_RATE,
+        interval: float = LATENCY_SUMMARY_INTERVAL
+    ):
+        self.worker_id = worker_id
+        self.redis_url = redis_url if redis_url is not None else os.getenv("REDIS_URL", "")
+        self.sample_rate = sample_rate
+        self.interval = interval
+        
+        self._redis = None
+        self._lock = threading.Lock()
+        self._ticks_seen = 0
+        self._children: Dict[Tuple[str, str], Any] = {}
+        
+        # (hop, source) -> [bucket counts..., sum, max]; reset every interval
+        self._window: Dict[Tuple[str, str], List[float]] = {}
+        self._window_start = time.time()
+        self._sample: Optional[Tuple] = None
+        
+        # Statistics
+        self.traced_messages = 0
+        self.untraced_messages = 0
+        self.summaries_written = 0
+        self.summary_failures = 0
+    
+    def message_received(self, headers: Optional[Dict], ticks: List[Dict]) -> MessageTrace:
+        """
+        Capture the trace of a consumed message
+        
+        Args:
+            headers: AMQP headers (x-tick-trace / x-tick-source)
+            ticks: Decoded ticks of the message
+        """
+        now = time.time()
+        trace = parse_trace(headers)
+        if trace is None:
+            self.untraced_messages += 1
+            source, stamps = 'unknown', None
+        else:
+            self.traced_messages += 1
+            source, stamps = trace
+        
+        # Every sample_rate-th tick across messages
+        offset = -self._ticks_seen % self.sample_rate
+        self._ticks_seen += len(ticks)
+        sampled = [
+            (tick.get('instrument_token'), tick.get('last_trade_time'))
+            for tick in ticks[offset::self.sample_rate]
+        ]
+        
+        return MessageTrace(source, stamps, now, sampled)
+    
+    def batch_committed(self, traces: List[MessageTrace], committed_at: Optional[float] = None):
+        """
+        Record latencies for the messages of a committed batch
+        
+        Args:
+            traces: MessageTrace per message in the batch
+            committed_at: Epoch seconds of the DB commit (defaults to now)
+        """
+        committed_at = committed_at if committed_at is not None else time.time()
+        parsed: Dict[Any, Optional[float]] = {}
+        
+        with self._lock:
+            for trace in traces:
+                if trace.stamps is not None:
+                    received, enriched, published = trace.stamps
+                    self._observe('enrich', trace.source, enriched - received)
+                    self._observe('batch', trace.source, published - enriched)
+                    self._observe('broker', trace.source, trace.consumed_at - published)
+                    self._observe('consume', trace.source, committed_at - trace.consumed_at)
+                    self._observe('total', trace.source, committed_at - received)
+                
+                for instrument_token, last_trade_time in trace.ticks:
+                    if not last_trade_time:
+                        continue
+                    epoch = parsed.get(last_trade_time, -1.0)
+                    if epoch == -1.0:
+                        epoch = _epoch(last_trade_time)
+                        parsed[last_trade_time] = epoch
+                    if epoch is None:
+                        continue
+                    
+                    latency = self._observe(EXCHANGE_HOP, trace.source, committed_at - epoch)
+                    # Latest sampled tick, detailed in the summary
+                    self._sample = (trace, instrument_token, last_trade_time, latency, committed_at)
+        
+        self.maybe_publish(committed_at)
+    
+    def _observe(self, hop: str, source: str, seconds: float) -> float:
+        """Prometheus + window observation (caller holds the lock)"""
+        seconds = max(seconds, 0.0)
+        key = (hop, source)
+        
+        child = self._children.get(key)
+        if child is None:
+            if hop == EXCHANGE_HOP:
+                child = EXCHANGE_TO_COMMIT_SECONDS.labels(source=source)
+            else:
+                child = HOP_SECONDS.labels(hop=hop, source=source)
+            self._children[key] = child
+        child.observe(seconds)
+        
+        series = self._window.get(key)
+        if series is None:
+            series = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0, 0.0]
+            self._window[key] = series
+        series[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        series[-2] += seconds
+        if seconds > series[-1]:
+            series[-1] = seconds
+        return seconds
+    
+    def maybe_publish(self, now: Optional[float] = None):
+        """Write the window to Redis once LATENCY_SUMMARY_INTERVAL has passed"""
+        now = now if now is not None else time.time()
+        if now - self._window_start < self.interval:
+            return
+        
+        with self._lock:
+            # Called from the consumer and writer threads; only one publishes a window
+            if now - self._window_start < self.interval:
+                return
+            window, self._window = self._window, {}
+            sample, self._sample = self._sample, None
+            window_start, self._window_start = self._window_start, now
+        
+        if not self.redis_url:
+            return
+        
+        summary = {
+            'worker_id': self.worker_id,
+            'window_start': window_start,
+            'window_end': now,
+            'buckets': list(LATENCY_BUCKETS),
+            'series': [
+                {
+                    'hop': hop,
+                    'source': source,
+                    'counts': series[:-2],
+                    'sum': series[-2],
+                    'max': series[-1]
+                }
+                for (hop, source), series in window.items()
+            ],
+            'sample': _sample_detail(*sample) if sample else None,
+            'traced_messages': self.traced_messages,
+            'untraced_messages': self.untraced_messages
+        }
+        
+        try:
+            if self._redis is None:
+                self._redis = redis.from_url(self.redis_url, socket_timeout=2)
+            # Kept for a few windows so a stopped worker drops out of /health/latency
+            self._redis.setex(
+                f"{REDIS_KEY_PREFIX}{self.worker_id}",
+                int(self.interval * 3) + 1,
+                json.dumps(summary)
+            )
+            self.summaries_written += 1
+        except Exception as e:
+            self.summary_failures += 1
+            self._redis = None
+            logger.warning("latency_summary_write_failed", error=str(e))
+    
+    def get_stats(self) -> Dict:
+        """Get tracing statistics"""
+        return {
+            'traced_messages': self.traced_messages,
+            'untraced_messages': self.untraced_messages,
+            'latency_summaries_written': self.summaries_written,
+            'latency_summary_failures': self.summary_failures
+        }
+
+
+def _sample_detail(trace: MessageTrace, instrument_token, last_trade_time, latency: float, committed_at: float) -> Dict:
+    """Per-tick detail of a sampled tick for the Redis summary"""
+    return {
+        'source': trace.source,
+        'instrument_token': instrument_token,
+        'last_trade_time': str(last_trade_time),
+        'exchange_to_commit_ms': round(latency * 1000, 1),
+        'hops_ms': _hops_ms(trace, committed_at)
+    }
+
+
+def _hops_ms(trace: MessageTrace, committed_at: float) -> Optional[Dict[str, float]]:
+    """Hop durations of one message in milliseconds (None if untraced)"""
+    if trace.stamps is None:
+        return None
+    
+    received, enriched, published = trace.stamps
+    points = (received, enriched, published, trace.consumed_at, committed_at)
+    hops = {hop: round(max(end - start, 0.0) * 1000, 2) for hop, start, end in zip(HOPS, points, points[1:])}
+    hops['total'] = round(max(committed_at - received, 0.0) * 1000, 2)
+    return hops
+
+
+def _epoch(value) -> Optional[float]:
+    """Epoch seconds of an ISO string or datetime (naive values are IST)"""
+    try:
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value)
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=IST)
+        return value.timestamp()
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+def start_metrics_server(port: int = WORKER_METRICS_PORT) -> bool:
+    """
+    Serve /metrics on a background thread
+    
+    Returns:
+        bool: True if the server was started (port > 0)
+    """
+    if port <= 0:
+        logger.info("metrics_server_disabled")
+        return False
+    
+    start_http_server(port)
+    logger.info("metrics_server_started", port=port)
+    return True
@@ -0,0 +1,338 @@
+"""
+Logging Configuration
+Shared structlog setup for the Python services
+
+This module is copied verbatim into each service's build context
+(services/ingestion, services/worker); keep the copies identical.
+
+- Loggers are cached on first use
+- Per-event rate limiting: at most LOG_RATE_LIMIT lines per second per event
+  name; the rest are dropped and reported as suppressed=N on the next line
+  for that event that gets through
+- Sampling: LOG_SAMPLE_RATES="event=N,..." keeps 1 in N lines of an event
+- Rendered lines are handed to a writer thread through a bounded queue, so a
+  slow stdout pipe (PM2 / Docker log driver) never blocks the calling thread
+- HotPathCounters turns per-batch / per-packet events into one summary line
+  per LOG_SUMMARY_INTERVAL
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional, TextIO
+
+import structlog
+
+LOG_RATE_LIMIT = float(os.getenv("LOG_RATE_LIMIT", 20))  # Lines per second per event name (0 = unlimited)
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")  # "event=N,..." keeps 1 in N
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))  # Lines buffered for the writer thread (0 = write inline)
+LOG_SUMMARY_INTERVAL = float(os.getenv("LOG_SUMMARY_INTERVAL", 60))  # Seconds between hot-path summaries
+
+_STOP = object()
+
+
+class EventRateLimiter:
+    """
+    structlog processor: token bucket per event name
+    
+    Each event name may burst up to `burst` lines and then `rate` lines per
+    second. Dropped lines are counted and reported on the next line of that
+    event that passes.
+    """
+    
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst or max(rate, 1.0)
+        self.suppressed_total = 0
+        
+        # event -> [tokens, last refill (monotonic), suppressed since last line]
+        self._buckets: Dict[str, list] = {}
+        self._lock = threading.Lock()
+    
+    def __call__(self, logger, method_name: str, event_dict: Dict) -> Dict:
+        event = event_dict.get('event')
+        now = time.monotonic()
+        
+        with self._lock:
+            bucket = self._buckets.get(event)
+            if bucket is None:
+                bucket = self._buckets[event] = [self.burst, now, 0]
+            
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if tokens < 1.0:
+                bucket[0] = tokens
+                bucket[2] += 1
+                self.suppressed_total += 1
+                raise structlog.DropEvent
+            
+            bucket[0] = tokens - 1.0
+            suppressed, bucket[2] = bucket[2], 0
+        
+        if suppressed:
+            event_dict['suppressed'] = suppressed
+        return event_dict
+
+
+class EventSampler:
+    """structlog processor: keep the first and then every Nth line of selected events"""
+    
+    def __init__(self, rates: Dict[str, int]):
+        self.rates = rates
+        self._seen: Dict[str, int] = {}
+        self._lock = threading.Lock()
+    
+    def __call__(self, logger, method_name: str, event_dict: Dict) -> Dict:
+        event = event_dict.get('event')
+        rate = self.rates.get(event)
+        if not rate or rate <= 1:
+            return event_dict
+        
+        with self._lock:
+            seen = self._seen.get(event, 0)
+            self._seen[event] = seen + 1
+        
+        if seen % rate:
+            raise structlog.DropEvent
+        
+        event_dict['sampled'] = rate
+        return event_dict
+
+
+def parse_sample_rates(value: str) -> Dict[str, int]:
+    """
+    Parse LOG_SAMPLE_RATES
+    
+    Args:
+        value: Comma-separated event=N pairs, e.g. "batch_published=100,security_id_not_found=10"
+    
+    Returns:
+        Dict mapping event name to N (keep 1 in N)
+    """
+    rates = {}
+    for item in value.split(','):
+        if '=' not in item:
+            continue
+        event, rate = item.split('=', 1)
+        rates[event.strip()] = int(rate)
+    return rates
+
+
+class LogWriter:
+    """
+    Background writer for rendered log lines
+    
+    put() never blocks: if the queue is full the line is dropped and counted,
+    and a log_lines_dropped line is written once the writer catches up.
+    """
+    
+    def __init__(self, stream: Optional[TextIO] = None, maxsize: int = LOG_QUEUE_SIZE):
+        """
+        Start the writer thread
+        
+        Args:
+            stream: Output stream (defaults to sys.stdout at write time)
+            maxsize: Lines buffered before put() starts dropping
+        """
+        self.stream = stream
+        self.dropped = 0
+        self._reported_dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize)
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+    
+    def put(self, line: str):
+        try:
+            self._queue.put_nowait(line)
+        except queue.Full:
+            self.dropped += 1
+    
+    def _run(self):
+        get = self._queue.get
+        get_nowait = self._queue.get_nowait
+        
+        while True:
+            lines = [get()]
+            # Write whatever else is already queued in one call
+            try:
+                while len(lines) < 1000:
+                    lines.append(get_nowait())
+            except queue.Empty:
+                pass
+            
+            stop = _STOP in lines
+            if stop:
+                lines = lines[:lines.index(_STOP)]
+            
+            if self.dropped != self._reported_dropped:
+                lines.append(json.dumps({
+                    'dropped': self.dropped - self._reported_dropped,
+                    'event': 'log_lines_dropped',
+                    'timestamp': datetime.now(timezone.utc).isoformat(),
+                    'level': 'warning'
+                }))
+                self._reported_dropped = self.dropped
+            
+            if lines:
+                stream = self.stream or sys.stdout
+                try:
+                    stream.write('\n'.join(lines) + '\n')
+                    stream.flush()
+                except Exception:
+                    pass
+            
+            if stop:
+                return
+    
+    def close(self, timeout: float = 2.0):
+        """Write out queued lines and stop the thread (registered with atexit)"""
+        if not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+
+class QueueLogger:
+    """structlog logger that hands rendered lines to a LogWriter"""
+    
+    def __init__(self, writer: LogWriter):
+        self._put = writer.put
+    
+    def msg(self, message: str):
+        self._put(message)
+    
+    log = debug = info = warn = warning = err = error = critical = exception = failure = fatal = msg
+
+
+class QueueLoggerFactory:
+    """logger_factory for structlog.configure: one QueueLogger per get_logger() call, one shared writer"""
+    
+    def __init__(self, writer: LogWriter):
+        self.writer = writer
+    
+    def __call__(self, *args) -> QueueLogger:
+        return QueueLogger(self.writer)
+
+
+_writer: Optional[LogWriter] = None
+_rate_limiter: Optional[EventRateLimiter] = None
+
+
+def configure_logging(level: str = "INFO", queue_size: int = LOG_QUEUE_SIZE):
+    """
+    Configure structlog for a service entry point (JSON lines on stdout)
+    
+    Args:
+        level: Minimum log level name (e.g. LOG_LEVEL)
+        queue_size: Writer queue size; 0 writes synchronously from the calling thread
+    """
+    global _writer, _rate_limiter
+    
+    processors = []
+    
+    sample_rates = parse_sample_rates(LOG_SAMPLE_RATES)
+    if sample_rates:
+        processors.append(EventSampler(sample_rates))
+    
+    if LOG_RATE_LIMIT > 0:
+        _rate_limiter = EventRateLimiter(LOG_RATE_LIMIT)
+        processors.append(_rate_limiter)
+    
+    processors += [
+        structlog.processors.TimeStamper(fmt="iso"),
+        structlog.processors.add_log_level,
+        structlog.processors.StackInfoRenderer(),
+        structlog.dev.set_exc_info,
+        structlog.processors.JSONRenderer()
+    ]
+    
+    if queue_size > 0:
+        if _writer is None:
+            _writer = LogWriter(maxsize=queue_size)
+        logger_factory = QueueLoggerFactory(_writer)
+    else:
+        logger_factory = structlog.PrintLoggerFactory()
+    
+    structlog.configure(
+        processors=processors,
+        wrapper_class=structlog.make_filtering_bound_logger(getattr(logging, level.upper())),
+        context_class=dict,
+        logger_factory=logger_factory,
+        cache_logger_on_first_use=True
+    )
+
+
+def get_logging_stats() -> Dict:
+    """Get rate limiter / writer statistics"""
+    return {
+        'log_suppressed_total': _rate_limiter.suppressed_total if _rate_limiter else 0,
+        'log_dropped_total': _writer.dropped if _writer else 0,
+        'log_queue_depth': _writer._queue.qsize() if _writer else 0
+    }
+
+
+class HotPathCounters:
+    """
+    Counters for hot-path events, logged as one summary line per interval
+    
+    add("batch_published", ticks=500) counts the event and sums the keyword
+    amounts (batch_published=1, batch_published_ticks=500). Once `interval`
+    seconds have passed the totals are logged as one `name` line and reset.
+    """
+    
+    def __init__(self, name: str, interval: Optional[float] = None):
+        """
+        Args:
+            name: Summary event name (e.g. "publisher_summary")
+            interval: Override for LOG_SUMMARY_INTERVAL (seconds)
+        """
+        self.name = name
+        self.interval = interval if interval is not None else LOG_SUMMARY_INTERVAL
+        self._logger = structlog.get_logger()
+        self._counts: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+    
+    def add(self, event: str, **amounts: float):
+        """Count one occurrence of event and add the keyword amounts"""
+        now = time.monotonic()
+        
+        with self._lock:
+            counts = self._counts
+            counts[event] = counts.get(event, 0) + 1
+            for key, value in amounts.items():
+                key = f"{event}_{key}"
+                counts[key] = counts.get(key, 0) + value
+            
+            if now - self._window_start < self.interval:
+                return
+            summary = self._take(now)
+        
+        self._logger.info(self.name, **summary)
+    
+    def flush(self):
+        """Log whatever has been counted since the last summary (shutdown)"""
+        with self._lock:
+            if not self._counts:
+                return
+            summary = self._take(time.monotonic())
+        
+        self._logger.info(self.name, **summary)
+    
+    def _take(self, now: float) -> Dict:
+        """Current totals plus the window length; resets the window (caller holds the lock)"""
+        summary = {key: round(value, 3) for key, value in self._counts.items()}
+        summary['interval_seconds'] = round(now - self._window_start, 1)
+        self._counts = {}
+        self._window_start = now
+        return summary
@@ -6,25 +6,17 @@ Processes tick data and performs maintenance operations
 import os
 import json
 import time
-import logging
 import redis
 import structlog
 from typing import List, Dict
 from celery import Task
 from celery_app import app
 from db_writer import bulk_insert_ticks, test_connection
+from log_config import configure_logging
 
-# Configure logging
-structlog.configure(
-    processors=[
-        structlog.processors.TimeStamper(fmt="iso"),
-        structlog.processors.add_log_level,
-        structlog.processors.JSONRenderer()
-    ],
-    wrapper_class=structlog.make_filtering_bound_logger(logging.INFO),
-    context_class=dict,
-    logger_factory=structlog.PrintLoggerFactory(),
-)
+# Configure logging (rate limited - see log_config.py). Written inline: Celery's
+# prefork children would not inherit the queued writer's thread
+configure_logging(os.getenv("LOG_LEVEL", "INFO"), queue_size=0)
 
 logger = structlog.get_logger()
 
@@ -0,0 +1,256 @@
+"""
+COPY Encoding for Ticks
+Text and binary COPY FROM STDIN payloads for the ticks staging table
+
+bulk_insert_ticks (TICK_WRITE_MODE=copy) streams a batch into a staging
+table with one COPY, then moves it into the hypertable with a single
+INSERT ... SELECT ... ON CONFLICT DO NOTHING, whose rowcount is the true
+number of new rows.
+
+Staging columns use COPY-friendly types: NUMERIC columns are staged as
+float8 (binary NUMERIC is a base-10000 digit format not worth encoding in
+Python) and cast to NUMERIC(p, s) by the INSERT. Postgres converts float8
+through 15 significant digits before rounding to the column scale, so a
+value within ~1e-15 of a rounding boundary can store one unit of the last
+digit away from what execute_batch (17-digit repr) stores.
+"""
+
+import struct
+from functools import partial
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Sequence, Tuple
+
+# (column, staging type) - order matches the ticks INSERT column list
+COPY_COLUMNS: Tuple[Tuple[str, str], ...] = (
+    ('time', 'timestamptz'),
+    ('last_trade_time', 'timestamptz'),
+    ('instrument_token', 'int4'),
+    ('trading_symbol', 'text'),
+    ('exchange', 'text'),
+    ('instrument_type', 'text'),
+    ('last_price', 'float8'),
+    ('last_traded_quantity', 'int4'),
+    ('average_traded_price', 'float8'),
+    ('volume_traded', 'int8'),
+    ('oi', 'int8'),
+    ('oi_day_high', 'int8'),
+    ('oi_day_low', 'int8'),
+    ('day_open', 'float8'),
+    ('day_high', 'float8'),
+    ('day_low', 'float8'),
+    ('day_close', 'float8'),
+    ('change', 'float8'),
+    ('change_percent', 'float8'),
+    ('total_buy_quantity', 'int8'),
+    ('total_sell_quantity', 'int8'),
+    ('bid_prices', 'float8[]'),
+    ('bid_quantities', 'int4[]'),
+    ('bid_orders', 'int4[]'),
+    ('ask_prices', 'float8[]'),
+    ('ask_quantities', 'int4[]'),
+    ('ask_orders', 'int4[]'),
+    ('tradable', 'bool'),
+    ('mode', 'text'),
+    # Pre-calculated metrics
+    ('volume_delta', 'int8'),
+    ('oi_delta', 'int8'),
+    ('aggressor_side', 'text'),
+    ('cvd_change', 'int8'),
+    ('buy_quantity_delta', 'int8'),
+    ('sell_quantity_delta', 'int8'),
+    ('mid_price_calc', 'float8'),
+    ('bid_depth_total', 'int8'),
+    ('ask_depth_total', 'int8'),
+    ('depth_imbalance_ratio', 'float8'),
+    ('price_delta', 'float8'),
+    # Orderflow toxicity metrics
+    ('consumption_rate', 'float8'),
+    ('flow_intensity', 'float8'),
+    ('depth_toxicity_tick', 'float8'),
+    ('kyle_lambda_tick', 'float8'),
+    # Legacy fields
+    ('bid_ask_spread', 'float8'),
+    ('mid_price', 'float8'),
+    ('order_imbalance', 'int8'),
+)
+
+TICK_COLUMNS: Tuple[str, ...] = tuple(column for column, _ in COPY_COLUMNS)
+ARRAY_COLUMNS = frozenset(column for column, kind in COPY_COLUMNS if kind.endswith('[]'))
+
+COPY_FORMATS = ('text', 'binary')
+
+# Binary COPY framing
+BINARY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('!ii', 0, 0)
+BINARY_TRAILER = struct.pack('!h', -1)
+NULL_FIELD = struct.pack('!i', -1)
+PG_EPOCH = datetime(2000, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+ELEMENT_OIDS = {'float8': 701, 'int4': 23}
+
+_I16 = struct.Struct('!h')
+_I32 = struct.Struct('!i')
+_FIELD_INT4 = struct.Struct('!ii')
+_FIELD_INT8 = struct.Struct('!iq')
+_FIELD_FLOAT8 = struct.Struct('!id')
+_FIELD_BOOL_TRUE = struct.pack('!ib', 1, 1)
+_FIELD_BOOL_FALSE = struct.pack('!ib', 1, 0)
+_ARRAY_HEADER = struct.Struct('!iiiiii')  # field length, ndim, has-null, element oid, dim, lower bound
+_ELEMENT_FIELDS = {'float8': _FIELD_FLOAT8, 'int4': _FIELD_INT4}
+_EMPTY_ARRAYS = {element: struct.pack('!iiii', 12, 0, 0, oid) for element, oid in ELEMENT_OIDS.items()}
+_TEXT_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def staging_ddl(table: str, temporary: bool = True) -> str:
+    """
+    CREATE statement for a staging table with the COPY column types
+    
+    Args:
+        table: Staging table name
+        temporary: TEMP table dropped at commit (safe behind PgBouncer transaction
+            pooling); otherwise a persistent UNLOGGED table
+    """
+    columns = ',\n    '.join(f"{column} {kind}" for column, kind in COPY_COLUMNS)
+    if temporary:
+        return f"CREATE TEMP TABLE {table} (\n    {columns}\n) ON COMMIT DROP"
+    return f"CREATE UNLOGGED TABLE IF NOT EXISTS {table} (\n    {columns}\n)"
+
+
+def copy_sql(table: str, copy_format: str = 'text') -> str:
+    """COPY ... FROM STDIN statement for an encoded payload"""
+    if copy_format not in COPY_FORMATS:
+        raise ValueError(f"unknown COPY format {copy_format!r}, expected one of {COPY_FORMATS}")
+    return f"COPY {table} ({', '.join(TICK_COLUMNS)}) FROM STDIN WITH (FORMAT {copy_format})"
+
+
+def merge_sql(staging: str, target: str = 'ticks') -> str:
+    """INSERT ... SELECT from the staging table, skipping rows already in the target"""
+    columns = ', '.join(TICK_COLUMNS)
+    return (
+        f"INSERT INTO {target} ({columns}) "
+        f"SELECT {columns} FROM {staging} "
+        f"ON CONFLICT (time, instrument_token) DO NOTHING"
+    )
+
+
+def encode(ticks: Sequence[Dict[str, Any]], copy_format: str = 'text') -> bytes:
+    """Encode tick dicts (with metrics) as a COPY payload in the given format"""
+    if copy_format == 'binary':
+        return encode_binary(ticks)
+    if copy_format == 'text':
+        return encode_text(ticks)
+    raise ValueError(f"unknown COPY format {copy_format!r}, expected one of {COPY_FORMATS}")
+
+
+# ============================================================================
+# TEXT FORMAT
+# ============================================================================
+
+def _text_array(values) -> str:
+    if not isinstance(values, (list, tuple)):
+        return '\\N'
+    if None in values:
+        return '{' + ','.join('NULL' if v is None else str(v) for v in values) + '}'
+    return '{' + ','.join(map(str, values)) + '}'
+
+
+def _text_formatters() -> List:
+    formatters = []
+    for _, kind in COPY_COLUMNS:
+        if kind.endswith('[]'):
+            formatters.append(_text_array)
+        elif kind in ('int4', 'int8'):
+            formatters.append('%d'.__mod__)
+        elif kind == 'bool':
+            formatters.append(lambda v: 't' if v else 'f')
+        elif kind == 'text':
+            formatters.append(lambda v: str(v).translate(_TEXT_ESCAPES))
+        elif kind == 'timestamptz':
+            # ISO strings (or datetimes) are parsed by Postgres; naive values use the session TimeZone
+            formatters.append(lambda v: v if isinstance(v, str) else v.isoformat())
+        else:
+            formatters.append(str)
+    return formatters
+
+
+_TEXT_FORMATTERS = tuple(_text_formatters())
+
+
+def encode_text(ticks: Sequence[Dict[str, Any]]) -> bytes:
+    """Tab-separated COPY text rows, \\N for NULL"""
+    lines = [
+        '\t'.join([
+            '\\N' if value is None else formatter(value)
+            for formatter, value in zip(_TEXT_FORMATTERS, map(tick.get, TICK_COLUMNS))
+        ])
+        for tick in ticks
+    ]
+    lines.append('')
+    return '\n'.join(lines).encode('utf-8')
+
+
+# ============================================================================
+# BINARY FORMAT
+# ============================================================================
+
+def _binary_timestamp(value) -> bytes:
+    """Microseconds since 2000-01-01 UTC; naive values are taken as UTC"""
+    ts = datetime.fromisoformat(value) if isinstance(value, str) else value
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return _FIELD_INT8.pack(8, (ts - PG_EPOCH) // _MICROSECOND)
+
+
+def _binary_array(values, element: str) -> bytes:
+    if not isinstance(values, (list, tuple)):
+        return NULL_FIELD
+    if not values:
+        # Empty array: ndim 0, no dimensions
+        return _EMPTY_ARRAYS[element]
+    
+    field = _ELEMENT_FIELDS[element]
+    cast = float if element == 'float8' else int
+    body = b''.join(NULL_FIELD if v is None else field.pack(field.size - 4, cast(v)) for v in values)
+    has_null = 1 if None in values else 0
+    return _ARRAY_HEADER.pack(20 + len(body), 1, has_null, ELEMENT_OIDS[element], len(values), 1) + body
+
+
+def _binary_text(value) -> bytes:
+    data = str(value).encode('utf-8')
+    return _I32.pack(len(data)) + data
+
+
+def _binary_encoders() -> List:
+    encoders = []
+    for _, kind in COPY_COLUMNS:
+        if kind == 'float8':
+            encoders.append(partial(_FIELD_FLOAT8.pack, 8))
+        elif kind == 'int8':
+            encoders.append(lambda v: _FIELD_INT8.pack(8, int(v)))
+        elif kind == 'int4':
+            encoders.append(lambda v: _FIELD_INT4.pack(4, int(v)))
+        elif kind == 'text':
+            encoders.append(_binary_text)
+        elif kind == 'timestamptz':
+            encoders.append(_binary_timestamp)
+        elif kind == 'bool':
+            encoders.append(lambda v: _FIELD_BOOL_TRUE if v else _FIELD_BOOL_FALSE)
+        else:
+            encoders.append(partial(_binary_array, element=kind[:-2]))
+    return encoders
+
+
+_BINARY_ENCODERS = tuple(_binary_encoders())
+
+
+def encode_binary(ticks: Sequence[Dict[str, Any]]) -> bytes:
+    """PGCOPY binary rows (header, int16 field count + length-prefixed fields per row, trailer)"""
+    field_count = _I16.pack(len(COPY_COLUMNS))
+    parts = [BINARY_HEADER]
+    for tick in ticks:
+        parts.append(field_count)
+        parts.extend([
+            NULL_FIELD if value is None else encoder(value)
+            for encoder, value in zip(_BINARY_ENCODERS, map(tick.get, TICK_COLUMNS))
+        ])
+    parts.append(BINARY_TRAILER)
+    return b''.join(parts)
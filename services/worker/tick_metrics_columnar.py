@@ -0,0 +1,254 @@
+"""
+Columnar Tick Metrics (NumPy)
+Computes the calculate_tick_metrics() fields for a whole batch at once
+(TICK_METRICS_MODE=numpy; the default "scalar" calls calculate_tick_metrics
+per tick)
+
+- Input fields are pulled into column arrays in C (itemgetter + fromiter),
+  falling back to per-tick .get() only for columns with missing or None values
+- The batch is time-sorted, so a stable sort on instrument_token orders it
+  by (instrument_token, time), duplicates in arrival order like the scalar loop
+- Lagged values are a shift by one row within each instrument group; the
+  first row of a group is seeded from the previous-tick cache (one lookup per
+  instrument, not per tick)
+- Lee-Ready/EMO aggressor rules run as boolean masks; zero ticks inherit the
+  aggressor of the row before them by a forward fill inside the group
+
+Results equal the scalar function's field for field, Python int/float types
+included, given integer volume, OI, quantity and depth-quantity fields as the
+ingestion service sends them (bench_tick_metrics.py checks this).
+"""
+
+from operator import itemgetter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Key order matches calculate_tick_metrics()
+METRIC_FIELDS = (
+    'volume_delta', 'oi_delta', 'aggressor_side', 'cvd_change',
+    'buy_quantity_delta', 'sell_quantity_delta', 'mid_price_calc',
+    'bid_depth_total', 'ask_depth_total', 'depth_imbalance_ratio', 'price_delta',
+    'consumption_rate', 'flow_intensity', 'depth_toxicity_tick', 'kyle_lambda_tick'
+)
+
+# Integer fields read as tick.get(field, 0) or 0
+INT_FIELDS = ('volume_traded', 'oi', 'total_buy_quantity', 'total_sell_quantity')
+
+# aggressor_side codes; a seeded tick may carry another value (NULL from the ticks table)
+AGGRESSOR_SIDES = ('NEUTRAL', 'BUY', 'SELL')
+NEUTRAL, BUY, SELL = range(3)
+
+# Rows converted back to Python values at a time
+ROW_CHUNK = 4096
+
+
+def _column(ticks: List[Dict], field: str, dtype) -> np.ndarray:
+    """tick.get(field, 0) or 0 per tick"""
+    try:
+        values = np.fromiter(map(itemgetter(field), ticks), dtype=dtype, count=len(ticks))
+        # fromiter reads None as NaN for floats
+        if dtype is not np.float64 or not np.isnan(values).any():
+            return values
+    except (KeyError, TypeError, ValueError):
+        pass
+    
+    # Missing fields or None values
+    return np.array([tick.get(field, 0) or 0 for tick in ticks], dtype=dtype)
+
+
+def _depth_lists(ticks: List[Dict], field: str) -> Optional[List[List]]:
+    """Depth arrays when every tick has a non-empty one (the normal case), else None"""
+    try:
+        lists = list(map(itemgetter(field), ticks))
+    except KeyError:
+        return None
+    if not all(lists):
+        return None
+    return lists
+
+
+def _best_price(ticks: List[Dict], field: str) -> np.ndarray:
+    """Level 0 price, 0.0 when the depth array is missing/empty or the level is 0/None"""
+    lists = _depth_lists(ticks, field)
+    if lists is not None:
+        try:
+            prices = np.fromiter(map(itemgetter(0), lists), dtype=np.float64, count=len(ticks))
+            if not np.isnan(prices).any():
+                return prices
+        except (TypeError, ValueError):
+            pass
+    
+    return np.array(
+        [float(levels[0]) if levels and levels[0] else 0.0 for levels in (tick.get(field, []) for tick in ticks)],
+        dtype=np.float64
+    )
+
+
+def _depth_columns(ticks: List[Dict], field: str) -> Tuple[np.ndarray, np.ndarray]:
+    """(level 0 quantity, sum of non-empty levels) per tick"""
+    lists = _depth_lists(ticks, field)
+    if lists is not None:
+        try:
+            first = np.fromiter(map(itemgetter(0), lists), dtype=np.int64, count=len(ticks))
+            totals = np.fromiter(map(sum, lists), dtype=np.int64, count=len(ticks))
+            return first, totals
+        except (TypeError, ValueError):
+            pass
+    
+    # Missing, empty or None levels
+    first = []
+    totals = []
+    for tick in ticks:
+        levels = tick.get(field, [])
+        first.append((levels[0] or 0) if levels else 0)
+        totals.append(sum(qty for qty in levels if qty) if levels else 0)
+    return np.array(first, dtype=np.int64), np.array(totals, dtype=np.int64)
+
+
+def _seed_column(seeds: List[Optional[Dict]], field: str, dtype) -> np.ndarray:
+    """seed.get(field, 0) or 0 per group, 0 for unseeded groups"""
+    return np.array([(seed.get(field, 0) or 0) if seed else 0 for seed in seeds], dtype=dtype)
+
+
+def enrich_batch(ticks: List[Dict], previous_ticks: Dict[int, Dict]) -> List[Dict]:
+    """
+    Copies of the ticks with their metrics merged in ({**tick, **metrics}),
+    the same result as calling calculate_tick_metrics() tick by tick with
+    each instrument's previous tick
+    
+    Args:
+        ticks: Ticks in processing order (time-sorted), all with an instrument_token
+        previous_ticks: Previous-tick state per instrument before this batch (not modified)
+    
+    Returns:
+        List of enriched tick dicts in input order
+    """
+    enriched = []
+    for tick, row in zip(ticks, metric_rows(ticks, previous_ticks)):
+        merged = tick.copy()
+        merged.update(zip(METRIC_FIELDS, row))
+        enriched.append(merged)
+    return enriched
+
+
+def metric_rows(ticks: List[Dict], previous_ticks: Dict[int, Dict]):
+    """Metric values per tick as tuples in METRIC_FIELDS order, in input order"""
+    n = len(ticks)
+    if n == 0:
+        return
+    
+    tokens = np.fromiter(map(itemgetter('instrument_token'), ticks), dtype=np.int64, count=n)
+    
+    # Group by instrument: the input is time-sorted, so a stable sort on the token
+    # is the (instrument_token, time) order
+    order = np.argsort(tokens, kind='stable')
+    tokens = tokens[order]
+    group_start = np.empty(n, dtype=bool)
+    group_start[0] = True
+    np.not_equal(tokens[1:], tokens[:-1], out=group_start[1:])
+    starts = np.flatnonzero(group_start)
+    
+    volume, oi, buy_qty, sell_qty = (_column(ticks, field, np.int64)[order] for field in INT_FIELDS)
+    price = _column(ticks, 'last_price', np.float64)[order]
+    best_bid = _best_price(ticks, 'bid_prices')[order]
+    best_ask = _best_price(ticks, 'ask_prices')[order]
+    bid_qty, bid_total = (column[order] for column in _depth_columns(ticks, 'bid_quantities'))
+    ask_qty, ask_total = (column[order] for column in _depth_columns(ticks, 'ask_quantities'))
+    
+    # Previous-tick state of each group's first row (hundreds of instruments, not ticks)
+    seeds = [previous_ticks.get(token) for token in tokens[starts].tolist()]
+    seeded = np.fromiter(map(bool, seeds), dtype=bool, count=len(seeds))
+    
+    def lagged(column: np.ndarray, seed_values: np.ndarray) -> np.ndarray:
+        """Grouped shift: the row before in the same instrument, the seed at a group start"""
+        previous = np.empty_like(column)
+        previous[1:] = column[:-1]
+        previous[starts] = seed_values
+        return previous
+    
+    has_prev = lagged(np.ones(n, dtype=bool), seeded)
+    prev_volume, prev_oi, prev_buy_qty, prev_sell_qty = (
+        lagged(column, _seed_column(seeds, field, np.int64))
+        for column, field in zip((volume, oi, buy_qty, sell_qty), INT_FIELDS)
+    )
+    prev_price = lagged(price, _seed_column(seeds, 'last_price', np.float64))
+    
+    # 1, 2, 5, 6, 11: lagged deltas
+    volume_delta = np.where(has_prev, np.maximum(volume - prev_volume, 0), 0)
+    oi_delta = np.where(has_prev, oi - prev_oi, 0)
+    buy_quantity_delta = np.where(has_prev, buy_qty - prev_buy_qty, 0)
+    sell_quantity_delta = np.where(has_prev, sell_qty - prev_sell_qty, 0)
+    price_delta = np.where(has_prev, price - prev_price, 0.0)
+    
+    # 3 & 4. aggressor_side (Lee-Ready + EMO) and cvd_change
+    traded = (volume_delta > 0) & (price > 0)
+    at_ask = traded & (best_ask > 0) & (price >= best_ask)
+    at_bid = traded & ~at_ask & (best_bid > 0) & (price <= best_bid)
+    inside = traded & ~at_ask & ~at_bid & (best_bid > 0) & (best_ask > 0)
+    
+    depth = bid_qty + ask_qty
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weighted_mid = np.where(
+            depth > 0,
+            (best_bid * ask_qty + best_ask * bid_qty) / depth,
+            (best_bid + best_ask) / 2.0
+        )
+    at_mid = inside & (np.abs(price - weighted_mid) < 0.01)
+    quote_rule = inside & ~at_mid
+    tick_rule = at_mid & has_prev & (prev_price > 0)
+    zero_tick = tick_rule & (price == prev_price)
+    
+    aggressor = np.zeros(n, dtype=np.int8)
+    aggressor[at_ask | (quote_rule & (price > weighted_mid)) | (tick_rule & (price > prev_price))] = BUY
+    aggressor[at_bid | (quote_rule & ~(price > weighted_mid)) | (tick_rule & (price < prev_price))] = SELL
+    
+    # Zero tick: inherit the previous tick's aggressor_side. A group's first row
+    # takes it from the seed; later rows forward-fill from the nearest row before
+    # them that is not a zero tick (itself inherited if it was a seeded first row)
+    sides = list(AGGRESSOR_SIDES)
+    codes = {side: code for code, side in enumerate(sides)}
+    seed_aggressor = np.zeros(len(seeds), dtype=np.int8)
+    for group in np.flatnonzero(zero_tick[starts]).tolist():
+        side = seeds[group].get('aggressor_side', 'NEUTRAL')
+        if side not in codes:
+            codes[side] = len(sides)
+            sides.append(side)
+        seed_aggressor[group] = codes[side]
+    aggressor[starts] = np.where(zero_tick[starts], seed_aggressor, aggressor[starts])
+    
+    source = np.where(zero_tick & ~group_start, 0, np.arange(n))
+    np.maximum.accumulate(source, out=source)
+    aggressor = aggressor[source]
+    
+    cvd_change = np.where(aggressor == BUY, volume_delta, -volume_delta)
+    
+    # 7-10. mid price and depth
+    both_sides = (best_bid > 0) & (best_ask > 0)
+    mid_price_calc = np.where(both_sides, (best_bid + best_ask) / 2.0, price)
+    total_depth = bid_total + ask_total
+    abs_price_delta = np.abs(price_delta)
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        depth_imbalance_ratio = np.where(ask_total > 0, bid_total / ask_total, 0.0)
+        
+        # 12-15. orderflow toxicity
+        consumption_rate = np.where((volume_delta > 0) & (total_depth > 0), total_depth / volume_delta, 0.0)
+        flow_intensity = np.where((volume_delta > 0) & (abs_price_delta > 0.01), abs_price_delta / volume_delta, 0.0)
+    depth_toxicity_tick = 1.0 / (1.0 + consumption_rate)
+    kyle_lambda_tick = flow_intensity * depth_toxicity_tick
+    
+    # Back to input order, converted to Python values a chunk at a time so only
+    # ROW_CHUNK rows of temporaries are alive next to the enriched ticks
+    inverse = np.empty(n, dtype=np.intp)
+    inverse[order] = np.arange(n)
+    columns = (
+        volume_delta, oi_delta, aggressor, cvd_change, buy_quantity_delta, sell_quantity_delta,
+        mid_price_calc, bid_total, ask_total, depth_imbalance_ratio, price_delta,
+        consumption_rate, flow_intensity, depth_toxicity_tick, kyle_lambda_tick
+    )
+    columns = [column[inverse] for column in columns]
+    for start in range(0, n, ROW_CHUNK):
+        chunk = [column[start:start + ROW_CHUNK].tolist() for column in columns]
+        chunk[2] = list(map(sides.__getitem__, chunk[2]))
+        yield from zip(*chunk)
@@ -0,0 +1,208 @@
+"""
+Previous-Tick State Checkpoints
+Warm start for the per-instrument state behind volume_delta, oi_delta,
+cvd_change and aggressor_side
+
+db_writer keeps the last tick of every instrument in memory. Without it the
+first tick after a restart gets volume_delta=0 / NEUTRAL and the next delta
+spans the whole gap, so the fields calculate_tick_metrics() reads from the
+previous tick are checkpointed to a Redis hash (tick_state:previous, one
+JSON field per instrument) every TICK_STATE_CHECKPOINT_INTERVAL seconds,
+after a successful flush and at shutdown. Workers write disjoint instruments
+(partitioned queues), so they share the hash.
+
+At startup the hash is bulk-loaded; instruments it does not cover are seeded
+from their latest row in ticks when they first show up in a batch
+(SEED_SQL, one index lookup per instrument). Only state from the current
+IST trading day is used: volume_traded and the quantity totals are day
+cumulative, so yesterday's close would give a bogus first delta.
+
+A crash loses at most one interval of checkpoints; those instruments'
+first deltas then span the ticks committed since the last checkpoint.
+"""
+
+import os
+import json
+import time
+import structlog
+from datetime import datetime, time as dt_time
+from typing import Dict, Iterable, Optional
+from zoneinfo import ZoneInfo
+
+import redis
+
+logger = structlog.get_logger()
+
+IST = ZoneInfo('Asia/Kolkata')
+
+TICK_STATE_CHECKPOINT_INTERVAL = float(os.getenv("TICK_STATE_CHECKPOINT_INTERVAL", 5))  # Seconds, 0 = disabled
+REDIS_KEY = "tick_state:previous"
+REDIS_KEY_TTL = 36 * 3600  # Refreshed on every checkpoint; drops the hash after a day without ticks
+
+# Fields calculate_tick_metrics() reads from the previous tick, plus its time
+STATE_FIELDS = (
+    'time', 'volume_traded', 'oi', 'total_buy_quantity', 'total_sell_quantity',
+    'last_price', 'aggressor_side'
+)
+
+# Latest row per instrument since the start of the trading day (idx_ticks_instrument_time)
+SEED_SQL = """
+    SELECT t.instrument_token, l.time, l.volume_traded, l.oi, l.total_buy_quantity,
+           l.total_sell_quantity, l.last_price, l.aggressor_side
+    FROM unnest(%s::int[]) AS t(instrument_token)
+    CROSS JOIN LATERAL (
+        SELECT time, volume_traded, oi, total_buy_quantity, total_sell_quantity, last_price, aggressor_side
+        FROM ticks
+        WHERE ticks.instrument_token = t.instrument_token AND time >= %s
+        ORDER BY time DESC
+        LIMIT 1
+    ) l
+"""
+
+
+def snapshot(tick: Dict) -> Dict:
+    """State fields of a tick; missing fields stay missing (metrics use .get defaults)"""
+    return {field: tick[field] for field in STATE_FIELDS if field in tick}
+
+
+def session_start(now: Optional[datetime] = None) -> datetime:
+    """Midnight IST of the current trading day"""
+    now = now or datetime.now(IST)
+    return datetime.combine(now.astimezone(IST).date(), dt_time(), tzinfo=IST)
+
+
+def in_session(value, start: datetime) -> bool:
+    """True if a tick time (ISO string or datetime, naive = IST) is at or after start"""
+    try:
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value)
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=IST)
+        return value >= start
+    except (TypeError, ValueError, AttributeError):
+        return False
+
+
+def seed_rows(cursor, instrument_tokens: Iterable[int]) -> Dict[int, Dict]:
+    """
+    Previous-tick state from the latest ticks row of each instrument today
+    
+    Args:
+        cursor: psycopg2 cursor
+        instrument_tokens: Instruments to look up
+    
+    Returns:
+        instrument_token -> state dict, for instruments with a row today
+    """
+    cursor.execute(SEED_SQL, (list(instrument_tokens), session_start()))
+    seeded = {}
+    for token, tick_time, volume, oi, buy_qty, sell_qty, last_price, aggressor in cursor.fetchall():
+        seeded[token] = {
+            'time': tick_time.isoformat(),
+            'volume_traded': volume,
+            'oi': oi,
+            'total_buy_quantity': buy_qty,
+            'total_sell_quantity': sell_qty,
+            'last_price': float(last_price) if last_price is not None else None,
+            'aggressor_side': aggressor
+        }
+    return seeded
+
+
+class TickStateCheckpoint:
+    """
+    Periodic Redis checkpoint of db_writer's previous-tick cache
+    
+    The writer adds the instruments of each committed batch to `touched`;
+    maybe_checkpoint() writes just those every interval, in one HSET.
+    """
+    
+    def __init__(self, redis_url: Optional[str] = None, interval: float = TICK_STATE_CHECKPOINT_INTERVAL):
+        self.redis_url = redis_url if redis_url is not None else os.getenv("REDIS_URL", "")
+        self.interval = interval
+        self.enabled = bool(self.redis_url) and interval > 0
+        
+        self._redis = None
+        self._last_checkpoint = time.monotonic()
+        self.touched = set()
+        
+        # Statistics
+        self.checkpoints_written = 0
+        self.checkpoint_failures = 0
+    
+    def _client(self):
+        if self._redis is None:
+            self._redis = redis.from_url(self.redis_url, socket_timeout=2)
+        return self._redis
+    
+    def load(self) -> Dict[int, Dict]:
+        """
+        Checkpointed state from the current trading day
+        
+        Returns:
+            instrument_token -> state dict (empty if disabled or Redis is unavailable)
+        """
+        if not self.enabled:
+            return {}
+        
+        try:
+            raw = self._client().hgetall(REDIS_KEY)
+        except Exception as e:
+            self._redis = None
+            logger.warning("tick_state_load_failed", error=str(e))
+            return {}
+        
+        start = session_start()
+        state = {}
+        stale = 0
+        for token, value in raw.items():
+            try:
+                tick = json.loads(value)
+            except ValueError:
+                continue
+            if in_session(tick.get('time'), start):
+                state[int(token)] = tick
+            else:
+                stale += 1
+        
+        logger.info("tick_state_loaded", instruments=len(state), stale=stale)
+        return state
+    
+    def maybe_checkpoint(self, previous_ticks: Dict[int, Dict]):
+        """Checkpoint touched instruments once the interval has passed"""
+        if self.enabled and time.monotonic() - self._last_checkpoint >= self.interval:
+            self.checkpoint(previous_ticks)
+    
+    def checkpoint(self, previous_ticks: Dict[int, Dict]):
+        """Write the state of the touched instruments now"""
+        self._last_checkpoint = time.monotonic()
+        if not self.enabled or not self.touched:
+            return
+        
+        touched, self.touched = self.touched, set()
+        mapping = {
+            token: json.dumps(snapshot(previous_ticks[token]), default=str)
+            for token in touched if token in previous_ticks
+        }
+        if not mapping:
+            return
+        
+        try:
+            pipe = self._client().pipeline(transaction=False)
+            pipe.hset(REDIS_KEY, mapping=mapping)
+            pipe.expire(REDIS_KEY, REDIS_KEY_TTL)
+            pipe.execute()
+            self.checkpoints_written += 1
+        except Exception as e:
+            # Retried with the next checkpoint
+            self.touched |= touched
+            self.checkpoint_failures += 1
+            self._redis = None
+            logger.warning("tick_state_checkpoint_failed", error=str(e), instruments=len(mapping))
+    
+    def get_stats(self) -> Dict:
+        """Get checkpoint statistics"""
+        return {
+            'tick_state_checkpoints_written': self.checkpoints_written,
+            'tick_state_checkpoint_failures': self.checkpoint_failures
+        }